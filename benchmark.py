@@ -0,0 +1,384 @@
+# coding: utf-8
+"""
+benchmark.py
+Замер производительности comparator.py на синтетических выгрузках.
+Для каждого размера генерирует пару Mos.csv / Invaders.csv (кириллические
+заголовки, разные префиксы ключей, ключи в темах, [Баг], строки спринтов),
+прогоняет этапы сравнения и печатает время и пик памяти по этапам.
+Каждый этап выполняется в новом процессе, результаты прошлых этапов он читает из
+STATE_NAME: пик памяти - пик процесса этапа (интерпретатор, модули, входные данные
+и сам этап), а не накопленный за весь прогон.
+reconcile_cold / reconcile_warm - путь main(): без сохраненного состояния и
+повторно после небольшой правки (сравнивать с match_two_way + categorize_and_prepare).
+Если время этапа растёт быстрее числа строк (с запасом SCALING_TOLERANCE) или
+этап из STAGE_MAX_MEMORY_GROWTH занимает больше памяти, чем допускает лимит,
+скрипт завершается с кодом 1.
+Отдельно замеряется холодный старт: новый интерпретатор и import comparator
+(тяжелые модули при импорте загружаться не должны, иначе тоже код 1).
+Запуск:
+    python benchmark.py                         # 1k, 10k, 100k, 1M строк
+    python benchmark.py --sizes 1000 10000      # свои размеры
+    python benchmark.py --skip export_to_excel  # без отдельных этапов
+    python benchmark.py --sizes                 # только холодный старт
+"""
+
+import io
+import sys
+import json
+import time
+import pickle
+import shutil
+import statistics
+import subprocess
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import comparator
+
+try:
+    import resource
+except ImportError:  # Windows: пик памяти не замеряется
+    resource = None
+
+# -------------------------
+# Настройки
+# -------------------------
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+STAGES = ('read_csv_guess', 'normalization', 'match_two_way', 'categorize_and_prepare',
+          'reconcile_cold', 'reconcile_warm',
+          'generate_html', 'export_to_excel', 'export_results')
+
+# Время этапа может расти не более чем в SCALING_TOLERANCE раз быстрее числа строк.
+# Пары замеров короче SCALING_MIN_SECONDS не сравниваются (шум)
+SCALING_TOLERANCE = 3.0
+SCALING_MIN_SECONDS = 0.05
+
+# Прирост памяти этапа (пик минус память процесса в начале этапа) - не больше этой доли
+# памяти в начале этапа (замер только на Linux). Выгрузка результатов пишется порциями,
+# ее прирост - около 0.7 от исходной памяти на 10k-1M строк
+STAGE_MAX_MEMORY_GROWTH = {'export_results': 1.0}
+
+# Холодный старт - медиана COLD_START_RUNS запусков. Модули LAZY_MODULES импортируют
+# этапы, которым они нужны, а не сам import comparator
+COLD_START_RUNS = 5
+LAZY_MODULES = ('pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'pyarrow')
+
+# Доли строк в синтетических выгрузках
+LINKED_SHARE = 0.6        # задачи Invaders, связанные с задачей ДИТ
+SAME_SPRINT_SHARE = 0.7   # из связанных - в том же спринте
+BUG_SHARE = 0.15
+SPRINTS = 24
+
+# Результаты этапов для следующих этапов (в рабочем каталоге размера)
+STATE_NAME = 'bench_state.pickle'
+SAVED_STAGES = ('read_csv_guess', 'normalization', 'match_two_way', 'categorize_and_prepare')
+
+# reconcile_warm - повторный запуск после правки тем WARM_CHANGED_ROWS строк Invaders
+# (reconcile_cold - тот же вызов без сохраненного состояния)
+WARM_CHANGED_ROWS = 50
+
+STATUSES = ['Открыт', 'В работе', 'Готово', 'Закрыт', 'Отложен', 'Отклонен',
+            'На анализе у исполнителя', 'To Do', 'In Progress', 'Done']
+ASSIGNEES = ['Иванов И.И.', 'Петрова А.С.', 'Сидоров П.П.', 'Кузнецова Е.В.', '']
+WORDS = ['Доработать', 'Исправить', 'Добавить', 'Настроить', 'Проверить',
+         'форму', 'отчёт', 'интеграцию', 'выгрузку', 'справочник', 'роль', 'фильтр']
+
+# -------------------------
+# Генерация выгрузок
+# -------------------------
+def _pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+def _titles(rng, n):
+    """Темы из случайных слов, часть - с пометкой [Баг]"""
+    words = [_pick(rng, WORDS, n) for _ in range(3)]
+    titles = pd.Series(words[0]).str.cat([pd.Series(w) for w in words[1:]], sep=' ')
+    bugs = rng.random(n) < BUG_SHARE
+    return titles.where(~bugs, '[Баг] ' + titles)
+
+def _sprint_strings(rng, sprints, styles):
+    """Строки спринтов в разных форматах выгрузок; sprints == 0 - без спринта"""
+    sprints = pd.Series(sprints).astype(str)
+    dated = 'Спринт ' + sprints + ' (01.02-14.02)'
+    meta = 'META Спринт ' + sprints
+    plain = 'Спринт ' + sprints
+    values = np.select([styles == 0, styles == 1], [dated, meta], plain)
+    return pd.Series(values, dtype=object).where(sprints != '0', '')
+
+def generate_exports(out_dir: Path, rows: int, seed: int = 1):
+    """Записать в out_dir пару выгрузок по rows строк: Mos.csv (cp1251, как из Excel)
+    и Invaders.csv (utf-8 с BOM). Возвращает (mos_path, inv_path)"""
+    rng = np.random.default_rng(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    numbers = pd.Series(np.arange(1, rows + 1)).astype(str)
+
+    # ДИТ
+    mos_keys = 'META-' + numbers
+    mos_sprints = rng.integers(0, SPRINTS + 1, rows)
+    mos = pd.DataFrame({
+        'Тип задачи': _pick(rng, ['Задача', 'Ошибка', 'История'], rows),
+        'Ключ проблемы': mos_keys,
+        'Тема': _titles(rng, rows),
+        'Компоненты': _sprint_strings(rng, mos_sprints, rng.integers(0, 3, rows)),
+        'Статус': _pick(rng, STATUSES, rows),
+        'Исполнитель': _pick(rng, ASSIGNEES, rows),
+        'Создано': _pick(rng, ['01.02.2024 10:00', '15.03.2024 12:30', '02.04.2024 09:15'], rows),
+        'Описание': _pick(rng, ['', 'Подробности в приложении. ' * 4, 'См. комментарии'], rows),
+    })
+
+    # Invaders: ключи с разными префиксами, часть задач связана с задачами ДИТ
+    prefixes = _pick(rng, comparator.INV_PREFIXES, rows)
+    inv_keys = pd.Series(prefixes).str.cat(numbers)
+    inv_titles = _titles(rng, rows)
+    linked = rng.random(rows) < LINKED_SHARE
+    target = rng.permutation(rows)
+    mode = rng.choice(3, rows, p=[0.7, 0.25, 0.05])
+    inv_sprints = np.where(linked & (rng.random(rows) < SAME_SPRINT_SHARE),
+                           mos_sprints[target], rng.integers(0, SPRINTS + 1, rows))
+
+    # связь: ключ ДИТ в теме Invaders, ключ Invaders в теме ДИТ, общий ключ
+    linked_keys = mos_keys.to_numpy()[target]
+    in_inv_title = linked & (mode == 0)
+    inv_titles = inv_titles.where(~in_inv_title, '[' + pd.Series(linked_keys) + '] ' + inv_titles)
+    in_mos_title = linked & (mode == 1)
+    mos_titles = mos['Тема'].to_numpy(dtype=object)
+    mos_titles[target[in_mos_title]] += ' (' + inv_keys.to_numpy(dtype=object)[in_mos_title] + ')'
+    mos['Тема'] = mos_titles
+    inv_keys = inv_keys.where(~(linked & (mode == 2)), pd.Series(linked_keys))
+    # часть ключей не заполнена - ключ берётся из темы
+    inv_keys = inv_keys.where(rng.random(rows) > 0.03, '')
+
+    inv = pd.DataFrame({
+        'Тип задачи': _pick(rng, ['Task', 'Bug', 'Story'], rows),
+        'Ключ проблемы': inv_keys,
+        'Тема': inv_titles,
+        'Статус': _pick(rng, STATUSES, rows),
+        'Пользовательское поле (Релизный спринт)': _sprint_strings(rng, inv_sprints, rng.integers(0, 3, rows)),
+        'Исполнитель': _pick(rng, ASSIGNEES, rows),
+    })
+
+    mos_path = out_dir / comparator.MOS_NAME
+    inv_path = out_dir / comparator.INV_NAME
+    mos.to_csv(mos_path, index=False, encoding='cp1251')
+    inv.to_csv(inv_path, index=False, encoding='utf-8-sig')
+    return mos_path, inv_path
+
+# -------------------------
+# Замер
+# -------------------------
+def _proc_status_mb(field: str):
+    """Поле /proc/self/status (VmRSS, VmHWM), МБ; None, если /proc нет (не Linux)"""
+    status = Path('/proc/self/status')
+    if not status.exists():
+        return None
+    for line in status.read_text().splitlines():
+        if line.startswith(f'{field}:'):
+            return int(line.split()[1]) / 1024
+    return None
+
+def _peak_memory_mb():
+    """Пик резидентной памяти процесса, МБ (None, если не поддерживается).
+    На Linux - VmHWM: ru_maxrss наследует пик родителя через fork/exec"""
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None or resource is None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux - килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_stage(name: str, work_dir: Path, seed: int = 1) -> dict:
+    """Выполнить этап name над выгрузками и результатами прошлых этапов из work_dir;
+    результаты этапов SAVED_STAGES сохраняются туда же. Возвращает {'seconds': .., 'peak_mb': ..}
+    (пик памяти процесса, поэтому этап запускается в новом процессе, см. run_isolated)"""
+    state_file = work_dir / STATE_NAME
+    state = pickle.loads(state_file.read_bytes()) if state_file.exists() else {}
+    mos_path = work_dir / comparator.MOS_NAME
+    inv_path = work_dir / comparator.INV_NAME
+    state_path = work_dir / comparator.CACHE_DIR_NAME / comparator.MATCH_STATE_NAME
+
+    def read():
+        encodings = comparator.sniff_encodings(mos_path, inv_path)
+        profiles = comparator.resolve_profiles(mos_path, inv_path, encodings=encodings)
+        state['mos'] = comparator.load_source(mos_path, profiles[0], 'mos', encoding=encodings[0])
+        state['inv'] = comparator.load_source(inv_path, profiles[1], 'inv', encoding=encodings[1])
+
+    def normalize():
+        state['mos'], state['inv'] = comparator.normalize_sources(state['mos'], state['inv'])
+
+    def match():
+        state['matches'] = comparator.match_two_way(state['mos'], state['inv'])
+
+    def categorize():
+        status_columns = comparator.profile_status_columns(state['mos'], state['inv'])
+        state['results'] = comparator.categorize_and_prepare(state['mos'], state['inv'], *state['matches'],
+                                                             status_columns=status_columns)
+
+    def reconcile_cold():
+        shutil.rmtree(state_path, ignore_errors=True)
+        comparator.reconcile(state['mos'], state['inv'], state_path)
+
+    def reconcile_warm():
+        comparator.reconcile(state['mos'], state['edited_inv'], state_path)
+
+    stages = {
+        'read_csv_guess': read,
+        'normalization': normalize,
+        'match_two_way': match,
+        'categorize_and_prepare': categorize,
+        'reconcile_cold': reconcile_cold,
+        'reconcile_warm': reconcile_warm,
+        'generate_html': lambda: comparator.generate_html(
+            state['results'], work_dir / comparator.OUT_NAME, state['mos'], state['inv']),
+        'export_to_excel': lambda: comparator.export_to_excel(
+            state['results'], work_dir / comparator.EXCEL_NAME, state['mos'], state['inv']),
+        'export_results': lambda: comparator.export_results(
+            state['results'], work_dir / comparator.RESULTS_DIR_NAME),
+    }
+    if name == 'reconcile_warm':
+        edited = state['inv'].copy()
+        rows = np.random.default_rng(seed).choice(len(edited), min(WARM_CHANGED_ROWS, len(edited)), replace=False)
+        titles = edited.columns.get_loc('Тема')
+        edited.iloc[rows, titles] = edited.iloc[rows, titles].astype(str) + " (правка)"
+        state['edited_inv'] = edited
+
+    start_mb = _proc_status_mb('VmRSS')
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        stages[name]()
+        seconds = time.perf_counter() - started
+    timing = {'seconds': seconds, 'peak_mb': _peak_memory_mb(), 'start_mb': start_mb}
+    if name in SAVED_STAGES:
+        state_file.write_bytes(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    return timing
+
+def run_isolated(name: str, work_dir: Path, seed: int = 1) -> dict:
+    """run_stage в новом процессе (spawn: без памяти родителя)"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(run_stage, name, work_dir, seed).result()
+
+def run_size(rows: int, work_dir: Path, skip=(), seed: int = 1) -> dict:
+    """Сгенерировать выгрузки на rows строк и прогнать этапы, каждый в новом процессе.
+    Возвращает {этап: {'seconds': .., 'peak_mb': ..}}"""
+    generate_exports(work_dir, rows, seed)
+    # страницы прошлого прогона не переиспользуются: замеряется полная запись отчета
+    shutil.rmtree(work_dir / comparator.HTML_SHARD_DIR_NAME, ignore_errors=True)
+    (work_dir / STATE_NAME).unlink(missing_ok=True)
+    timings = {}
+    try:
+        # этапы зависят друг от друга, поэтому пропускать можно только выходные
+        for name in STAGES:
+            if name not in skip:
+                timings[name] = run_isolated(name, work_dir, seed)
+    finally:
+        (work_dir / STATE_NAME).unlink(missing_ok=True)
+    return timings
+
+def measure_cold_start(runs: int = COLD_START_RUNS) -> dict:
+    """Холодный старт: новый интерпретатор и import comparator.
+    Возвращает {'seconds': медиана, 'loaded': модули LAZY_MODULES, загруженные при импорте}"""
+    code = f"import sys, comparator; print(*(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        done = subprocess.run([sys.executable, '-c', code], cwd=Path(comparator.__file__).parent,
+                              capture_output=True, text=True, check=True)
+        seconds.append(time.perf_counter() - started)
+    return {'seconds': statistics.median(seconds), 'loaded': done.stdout.split()}
+
+def scaling_failures(report: dict) -> list:
+    """Этапы, время которых растёт сверхлинейно: [(этап, n1, n2, t1, t2)]"""
+    failures = []
+    sizes = sorted(report)
+    for small, large in zip(sizes, sizes[1:]):
+        for name in STAGES:
+            if name not in report[small] or name not in report[large]:
+                continue
+            t_small = report[small][name]['seconds']
+            t_large = report[large][name]['seconds']
+            if t_small < SCALING_MIN_SECONDS:
+                continue
+            if t_large / t_small > (large / small) * SCALING_TOLERANCE:
+                failures.append((name, small, large, t_small, t_large))
+    return failures
+
+def memory_failures(report: dict) -> list:
+    """Этапы сверх STAGE_MAX_MEMORY_GROWTH: [(этап, строк, МБ в начале, пик МБ)]"""
+    failures = []
+    for size in sorted(report):
+        for name, limit in STAGE_MAX_MEMORY_GROWTH.items():
+            item = report[size].get(name)
+            if item is None or item.get('start_mb') is None or item['peak_mb'] is None:
+                continue
+            if item['peak_mb'] - item['start_mb'] > limit * item['start_mb']:
+                failures.append((name, size, item['start_mb'], item['peak_mb']))
+    return failures
+
+def print_report(report: dict):
+    sizes = sorted(report)
+    print(f"{'Этап':<24}" + "".join(f"{size:>22,}" for size in sizes))
+    for name in STAGES:
+        cells = []
+        for size in sizes:
+            item = report[size].get(name)
+            if item is None:
+                cells.append(f"{'-':>22}")
+                continue
+            peak = f"{item['peak_mb']:.0f} МБ" if item['peak_mb'] is not None else "н/д"
+            cells.append(f"{item['seconds']:>10.2f} с {peak:>9}")
+        print(f"{name:<24}" + "".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер производительности comparator.py")
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(SIZES), help="размеры выгрузок, строк")
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['generate_html', 'export_to_excel', 'export_results', 'cold_start'],
+                        help="не замерять эти этапы")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--work-dir', type=Path, help="куда писать выгрузки и отчёты (по умолчанию - временный каталог)")
+    parser.add_argument('--json', type=Path, help="сохранить результаты в JSON")
+    parser.add_argument('--no-assert', action='store_true', help="не проверять масштабирование")
+    args = parser.parse_args()
+
+    root = args.work_dir or Path(tempfile.mkdtemp(prefix="comparator_bench_"))
+    report = {}
+    try:
+        for rows in sorted(args.sizes):
+            print(f"{rows:,} строк...", flush=True)
+            report[rows] = run_size(rows, root / str(rows), args.skip, args.seed)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    cold_start = None if 'cold_start' in args.skip else measure_cold_start()
+
+    print()
+    if report:
+        print_report(report)
+    if cold_start is not None:
+        print(f"{'холодный старт':<24}{cold_start['seconds']:>10.2f} с (запуск Python и import comparator)")
+    if args.json:
+        saved = {**report, 'cold_start': cold_start} if cold_start is not None else report
+        args.json.write_text(json.dumps(saved, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    failures = [] if args.no_assert else scaling_failures(report)
+    for name, small, large, t_small, t_large in failures:
+        print(f"❗ {name}: {small:,} -> {large:,} строк, {t_small:.2f} с -> {t_large:.2f} с "
+              f"(рост x{t_large / t_small:.0f} при росте строк x{large // small})")
+    memory = [] if args.no_assert else memory_failures(report)
+    for name, size, start_mb, peak_mb in memory:
+        print(f"❗ {name}: {size:,} строк, пик {peak_mb:.0f} МБ при {start_mb:.0f} МБ в начале этапа "
+              f"(допустимый прирост x{STAGE_MAX_MEMORY_GROWTH[name]:g})")
+    eager = [] if args.no_assert or cold_start is None else cold_start['loaded']
+    if eager:
+        print(f"❗ import comparator загружает {', '.join(eager)}: холодный старт платит за них всегда")
+    if failures or memory or eager:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
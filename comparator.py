@@ -6,22 +6,65 @@ main.py
  - объединение спринтов по номеру (игнорируя даты)
  - двустороннее сопоставление (META-XXX в title и наоборот)
  - HTML визуал: колонки по спринтам -> ДИТ / Invaders, подсветка карточек
+ - для больших отчетов HTML со сжатыми данными: карточки рисуются по мере прокрутки
+ - для длинной истории спринтов - индекс и отдельная страница на спринт (report_sprints/)
  - фильтр по задаче
  - фильтр по спринту
  - выгрузку в Excel
+ - выгрузку результатов и сводки для BI: parquet / csv / jsonl (comparison_data/)
  - разделение на свимлайны "Задачи" и "Баги"
  - вывод статусов задач
-Запуск: нажать Run в IDE (PyCharm/VSCode и т.д.)
+Запуск: нажать Run в IDE (PyCharm/VSCode и т.д.) или из командной строки:
+    python comparator.py --mos выгрузка_дит.csv --inv выгрузка_invaders.csv --out-dir отчеты
+    python comparator.py --stage match             # только сопоставление и счетчики
+    python comparator.py --outputs data            # только машиночитаемые выгрузки
 Зависимости: pandas, openpyxl
     pip install pandas openpyxl
+Опционально: pyarrow (кэш нормализованных данных и выгрузка результатов в parquet),
+xlsxwriter (быстрая запись больших Excel отчетов)
 """
 
+from __future__ import annotations
+
 import re
+import sys
 import html
-from pathlib import Path
-import pandas as pd
+import os
+import time
+import heapq
+import contextlib
+import io
+import traceback
+import functools
+import hashlib
+import json
+import zlib
+import base64
+import shutil
+import argparse
+import importlib
+from pathlib import Path, PurePosixPath
 from datetime import datetime
 
+
+class _LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибуту"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        # дальше атрибут берется из экземпляра, без __getattr__
+        setattr(self, attr, value)
+        return value
+
+
+# pandas и numpy нужны только этапам обработки: разбор аргументов, проверка путей
+# и --help обходятся без них (остальные тяжелые модули импортируются в функциях)
+np = _LazyModule('numpy')
+pd = _LazyModule('pandas')
+
 # -------------------------
 # Настройки
 # -------------------------
@@ -30,6 +73,35 @@ INV_NAME = "Invaders.csv"
 OUT_NAME = "report.html"
 EXCEL_NAME = "comparison_report.xlsx"
 
+# Кэш нормализованных данных (рядом со скриптом). NORMALIZATION_VERSION нужно
+# увеличивать при любом изменении чтения/нормализации, чтобы старый кэш не использовался
+CACHE_DIR_NAME = ".comparator_cache"
+CACHE_MAX_ENTRIES = 8
+NORMALIZATION_VERSION = 3
+
+# Состояние прошлого сопоставления для инкрементального пересчёта (каталог в каталоге
+# кэша). Если затронута больше RECONCILE_MAX_DIRTY_SHARE доли строк, пересчёт частями
+# дороже полного, и выполняется полный
+MATCH_STATE_NAME = "match_state"
+MATCH_STATE_VERSION = 5
+RECONCILE_MAX_DIRTY_SHARE = 0.5
+
+# Параллельный режим (пул процессов): 0 или 1 - последовательно, N - число процессов.
+# Части меньше PARALLEL_MIN_ROWS строк обрабатываются без пула.
+PARALLEL_WORKERS = 0
+PARALLEL_MIN_ROWS = 5000
+PARALLEL_PARTS_PER_WORKER = 4
+
+# Выходные файлы (HTML, Excel, выгрузка данных) только читают результаты и строятся
+# одновременно, каждый в своем процессе: 0 - процессов по числу выходов, но не больше
+# числа процессоров; 1 - по очереди в этом процессе
+OUTPUT_WORKERS = 0
+
+# Этапы запуска по порядку (--stage - последний выполняемый) и выходные файлы
+# этапа 'report' (--outputs)
+RUN_STAGES = ('load', 'match', 'report')
+OUTPUTS = ('html', 'excel', 'data')
+
 # Базовые URL для задач
 MOS_BASE_URL = "https://itpm.mos.ru/browse/"
 INV_BASE_URL = "https://jira.theinvaders.ru/browse/"
@@ -37,119 +109,370 @@ INV_BASE_URL = "https://jira.theinvaders.ru/browse/"
 # Префиксы для задач Invaders
 INV_PREFIXES = ['MT-', 'PART-', 'FEATURE-', 'BUG-', 'TASK-', 'EPIC-', 'STORY-', 'IMPROVEMENT-']
 
+# Таблица результатов сравнения: категории и колонки
+CATEGORIES = ('match', 'diff_sprint', 'mos_only', 'inv_only')
+RESULT_COLUMNS = ['category', 'is_bug',
+                  'mos_id', 'mos_title', 'mos_sprint', 'mos_sprint_no', 'mos_status', 'mos_url',
+                  'inv_id', 'inv_title', 'inv_sprint', 'inv_sprint_no', 'inv_status', 'inv_url']
+UNKNOWN_STATUS = "Неизвестно"
+
+# Группы статусов: (группа, подпись, цвет, ключевые слова). Статус относится к первой
+# группе, ключевое слово которой входит в него без учета регистра, иначе - STATUS_OTHER.
+# Группа задает CSS класс карточки (status-<группа>), цвет в HTML/Excel и строку сводки
+STATUS_GROUPS = [
+    ('ready', 'Готово', '#2f9e44', ['готово', 'закрыт', 'выполнено', 'done', 'closed', 'resolved']),
+    ('inprogress', 'В работе', '#e6b000', ['в работе', 'в прогрессе', 'in progress', 'progress']),
+    ('open', 'Открыто', '#1e6fe0', ['открыт', 'новая', 'to do', 'open', 'new']),
+    ('rejected', 'Отклонено', '#dc2626', ['отклонен', 'rejected', 'declined']),
+    ('other', 'Прочие', '#6b7280', ['отложен']),
+]
+STATUS_OTHER = 'other'
+
+# Спринты: номер из строки вида '... Спринт N ...'; без номера - 'Нет спринта'
+SPRINT_RE = re.compile(r'Спринт\s*(\d+)', flags=re.IGNORECASE)
+NO_SPRINT = "Нет спринта"
+NO_SPRINT_NUMBER = -1
+
+# Размер буфера записи HTML отчета
+HTML_WRITE_BUFFER = 1024 * 1024
+
+# Режим HTML отчета: 'cards' - все карточки в разметке; 'data' - записи компактными
+# JSON-данными, карточки рисует скрипт страницы (только видимые при прокрутке);
+# 'compact' - как 'data', но JSON сжат gzip (base64 в файле), браузер распаковывает
+# его DecompressionStream (Chrome 80+, Firefox 113+, Safari 16.4+);
+# 'auto' - 'compact' начиная с HTML_DATA_MIN_RECORDS записей
+HTML_MODE = 'auto'
+HTML_DATA_MIN_RECORDS = 5000
+HTML_COMPRESS_LEVEL = 6
+
+# Максимальная ширина колонки Excel (ширина считается по длине значений колонки)
+EXCEL_MAX_COLUMN_WIDTH = 50
+
+# Движок записи Excel: 'openpyxl', 'xlsxwriter' (быстрее, постоянная память) или
+# 'auto' - xlsxwriter, если установлен, начиная с EXCEL_FAST_MIN_ROWS строк данных
+EXCEL_ENGINE = 'auto'
+EXCEL_FAST_MIN_ROWS = 20_000
+
+# Состав Excel отчета: 'categories' - сводка и листы категорий; 'full' - плюс листы
+# исходных данных ДИТ и Invaders: колонки выгрузок, прочитанные по профилю (не вся
+# выгрузка), без служебных колонок нормализации; самая дорогая часть экспорта
+EXCEL_DETAIL = 'categories'
+
+# Строк на листе Excel не больше EXCEL_MAX_ROWS (с заголовком): длинная таблица
+# продолжается на листах '<имя> (2)', '<имя> (3)', ...
+EXCEL_MAX_ROWS = 1_048_576
+
+# Машиночитаемые выгрузки результатов (для BI и скриптов) в папке RESULTS_DIR_NAME:
+# results.<формат> - запись на строку в схеме RESULTS_SCHEMA, summary.<формат> - счетчики
+# в схеме SUMMARY_SCHEMA, RESULTS_MANIFEST - версия схемы и список файлов.
+# Форматы: 'parquet' (нужен pyarrow, без него пропускается), 'csv', 'jsonl'.
+# RESULTS_SCHEMA_VERSION нужно увеличивать при любом изменении схем
+RESULTS_DIR_NAME = "comparison_data"
+RESULTS_FORMATS = ('parquet', 'csv', 'jsonl')
+RESULTS_MANIFEST = "manifest.json"
+RESULTS_SCHEMA_VERSION = 1
+# JSON Lines пишется порциями по RESULTS_JSONL_CHUNK_ROWS строк (память не растет с размером)
+RESULTS_JSONL_CHUNK_ROWS = 10_000
+RESULTS_SCHEMA = {
+    'category': 'string', 'is_bug': 'bool',
+    'mos_id': 'string', 'mos_title': 'string', 'mos_sprint_no': 'Int64', 'mos_sprint': 'string',
+    'mos_status': 'string', 'mos_status_group': 'string', 'mos_url': 'string',
+    'inv_id': 'string', 'inv_title': 'string', 'inv_sprint_no': 'Int64', 'inv_sprint': 'string',
+    'inv_status': 'string', 'inv_status_group': 'string', 'inv_url': 'string',
+}
+SUMMARY_SCHEMA = {'metric': 'string', 'key': 'string', 'count': 'int64'}
+
+# Раскладка HTML отчета: 'single' - один файл; 'sharded' - легкий индекс (сводка и
+# список спринтов) в OUT_NAME и по странице на каждые HTML_SHARD_SPRINTS спринтов
+# в папке HTML_SHARD_DIR_NAME; 'auto' - 'sharded' начиная с HTML_SHARD_MIN_SPRINTS спринтов.
+# Страница перезаписывается, только если изменились её записи (manifest.json в папке)
+HTML_LAYOUT = 'auto'
+HTML_SHARD_MIN_SPRINTS = 24
+HTML_SHARD_SPRINTS = 1
+HTML_SHARD_DIR_NAME = "report_sprints"
+HTML_SHARD_MANIFEST = "manifest.json"
+# Версия разметки страниц: при изменении шаблона все страницы пишутся заново
+HTML_TEMPLATE_VERSION = 1
+
+# Чтение CSV: сколько байт смотреть для определения кодировки,
+# сколько строк брать для поиска колонок и размер порции при чтении
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_SAMPLE_ROWS = 1000
+CSV_CHUNK_ROWS = 50_000
+
+# Профили выгрузок: какие колонки выгрузки служат ключом, темой, спринтом и статусом.
+# Определяются один раз и сохраняются в PROFILES_NAME (рядом со скриптом, можно
+# поправить вручную); пока набор колонок выгрузки не меняется, поиск не повторяется
+PROFILES_NAME = "source_profiles.json"
+MOS_PROFILE = "itpm.mos.ru export"
+INV_PROFILE = "theinvaders Jira export"
+PROFILE_ROLES = ('key', 'title', 'sprint', 'status')
+KEY_COLUMN_NAMES = ['Ключ проблемы', 'Ключ задачи', 'Issue key', 'Key']
+TITLE_COLUMN_NAMES = ['Тема', 'Summary', 'Название']
+
+# Под какими именами колонки ролей попадают в таблицы сравнения,
+# и какие ещё колонки выгрузки нужны (если есть)
+STATUS_COLUMN = 'Статус'
+CANONICAL_COLUMNS = {
+    'mos': {'key': 'Ключ проблемы', 'title': 'Тема', 'sprint': 'Компоненты', 'status': STATUS_COLUMN},
+    'inv': {'key': 'Ключ проблемы', 'title': 'Тема',
+            'sprint': 'Пользовательское поле (Релизный спринт)', 'status': STATUS_COLUMN},
+}
+EXTRA_COLUMNS = {'mos': [], 'inv': ['title']}
+
+# Одно чередование по всем префиксам вместо отдельной регулярки на каждый
+_INV_PREFIX_ALT = '(?:' + '|'.join(re.escape(p) for p in INV_PREFIXES) + ')'
+INV_PREFIX_RE = re.compile(_INV_PREFIX_ALT)
+INV_KEY_RE = re.compile(rf'({_INV_PREFIX_ALT}\d+)')
+INV_WHOLE_KEY_RE = re.compile(rf'{_INV_PREFIX_ALT}.*\d')
+META_KEY_RE = re.compile(r'(META-\d+)')
+NUMBER_RE = re.compile(r'(\d+)')
+
 # -------------------------
 # Вспомогательные функции
 # -------------------------
-def read_csv_guess(path: Path) -> pd.DataFrame:
+def sniff_encoding(path: Path) -> str:
+    """Определить кодировку CSV по первым килобайтам файла: utf-8 (с BOM или без) или cp1251"""
+    with open(path, 'rb') as f:
+        head = f.read(CSV_SNIFF_BYTES)
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # многобайтовый символ мог оборваться на границе прочитанного блока
+        if not (e.reason == 'unexpected end of data' and e.start >= len(head) - 3):
+            return "cp1251"
+    return "utf-8-sig"
+
+def csv_read_options(encoding: str) -> dict:
+    """Параметры read_csv для кодировки: utf-8 читается строго, чтобы ошибка в середине
+    файла не превращалась молча в '\ufffd'; в cp1251 неопределённые байты заменяются"""
+    return {'encoding': encoding, 'encoding_errors': 'replace' if encoding == 'cp1251' else 'strict'}
+
+def read_csv_decoded(path: Path, encoding: str, read):
+    """read(encoding) с кодировкой из sniff_encoding; если utf-8 не подтвердилась дальше
+    проверенного начала файла, чтение повторяется в cp1251"""
+    try:
+        return read(encoding)
+    except UnicodeDecodeError:
+        if encoding == "cp1251":
+            raise
+        print(f"  ⚠️ {Path(path).name}: после первых {CSV_SNIFF_BYTES // 1024} КБ не utf-8, читаем как cp1251")
+        return read("cp1251")
+
+def iter_csv_chunks(path: Path, usecols=None, chunksize: int = CSV_CHUNK_ROWS, encoding: str = None):
+    """Чтение CSV порциями по chunksize строк (только колонки usecols)"""
+    encoding = encoding or sniff_encoding(path)
+    yield from pd.read_csv(path, usecols=usecols, chunksize=chunksize, **csv_read_options(encoding))
+
+def read_csv_guess(path: Path, usecols=None, chunksize: int = CSV_CHUNK_ROWS, encoding: str = None) -> pd.DataFrame:
+    """Прочитать CSV порциями (iter_csv_chunks). Порции раскладываются по колонкам, колонки
+    склеиваются по одной с освобождением порций: полная таблица в памяти одна.
+    encoding - результат sniff_encoding (не задана - определяется здесь)"""
+    def read(encoding):
+        pieces = {}
+        for chunk in iter_csv_chunks(path, usecols=usecols, chunksize=chunksize, encoding=encoding):
+            for col in chunk.columns:
+                pieces.setdefault(col, []).append(chunk[col])
+            del chunk
+        if not pieces:
+            return pd.read_csv(path, usecols=usecols, nrows=0, **csv_read_options(encoding))
+        return pd.DataFrame({col: pd.concat(pieces.pop(col), ignore_index=True) for col in list(pieces)})
+
+    return read_csv_decoded(path, encoding or sniff_encoding(path), read)
+
+def read_csv_header(path: Path, encoding: str) -> list:
+    """Имена колонок CSV"""
+    return list(read_csv_decoded(path, encoding, lambda enc: pd.read_csv(path, nrows=0, **csv_read_options(enc))).columns)
+
+def source_columns_hash(columns) -> str:
+    """Хэш набора колонок выгрузки: по нему проверяется, подходит ли сохранённый профиль"""
+    return hashlib.sha256("\x1f".join(str(col) for col in columns).encode("utf-8")).hexdigest()
+
+def detect_profile(sample: pd.DataFrame, kind: str, system_name: str) -> dict:
+    """Определить колонки ролей (ключ, тема, спринт, статус) по первым строкам выгрузки"""
+    columns = list(sample.columns)
+    key_col = next((col for col in columns if str(col).strip() in KEY_COLUMN_NAMES), None)
+    title_col = next((col for col in columns if str(col).strip() in TITLE_COLUMN_NAMES), None)
+    if title_col is None and columns:
+        # без темы тема берётся из первой колонки
+        title_col = columns[0]
+    if kind == 'mos':
+        sprint_col = 'Компоненты' if 'Компоненты' in columns else None
+    else:
+        sprint_col = find_sprint_column(sample)
+    status_col = find_status_column(sample, system_name)
+    return {'key': key_col, 'title': title_col, 'sprint': sprint_col, 'status': status_col}
+
+def load_profiles(profiles_path: Path) -> dict:
+    """Сохранённые профили выгрузок {имя профиля: профиль}"""
+    try:
+        with open(profiles_path, encoding="utf-8") as f:
+            profiles = json.load(f)
+        return profiles if isinstance(profiles, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"  ⚠️ Не удалось прочитать профили ({e}), колонки будут определены заново")
+        return {}
+
+def save_profiles(profiles_path: Path, profiles: dict):
+    """Сохранить профили выгрузок (атомарно: временный файл и замена)"""
+    tmp = profiles_path.with_name(f".{profiles_path.name}.tmp")
     try:
-        return pd.read_csv(path, encoding="utf-8-sig")
-    except Exception:
-        # fallback
-        return pd.read_csv(path, encoding="cp1251", errors="ignore")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, profiles_path)
+    except Exception as e:
+        tmp.unlink(missing_ok=True)
+        print(f"  ⚠️ Не удалось сохранить профили: {e}")
+
+def resolve_profile(path: Path, name: str, kind: str, system_name: str,
+                    profiles_path: Path = None, encoding: str = None) -> dict:
+    """Профиль выгрузки: сохранённый, если набор колонок файла не изменился,
+    иначе колонки определяются по первым CSV_SAMPLE_ROWS строкам и профиль сохраняется.
+    kind - 'mos' или 'inv'; profiles_path=None - не читать и не сохранять профили;
+    encoding - результат sniff_encoding (не задана - определяется здесь)"""
+    encoding = encoding or sniff_encoding(path)
+    header = read_csv_header(path, encoding)
+    columns_hash = source_columns_hash(header)
+
+    profiles = load_profiles(profiles_path) if profiles_path is not None else {}
+    profile = profiles.get(name)
+    if (isinstance(profile, dict) and profile.get('columns_hash') == columns_hash
+            and all(profile.get(role) is None or profile.get(role) in header for role in PROFILE_ROLES)):
+        print(f"  ✓ Профиль '{name}': колонки взяты из {profiles_path.name}")
+        return profile
+
+    print(f"  Профиль '{name}': определяем колонки {system_name}...")
+    sample = read_csv_decoded(path, encoding,
+                              lambda enc: pd.read_csv(path, nrows=CSV_SAMPLE_ROWS, **csv_read_options(enc)))
+    profile = detect_profile(sample, kind, system_name)
+    profile['columns_hash'] = columns_hash
+    print("    " + ", ".join(f"{role}: {profile[role]!r}" for role in PROFILE_ROLES))
+    if profiles_path is not None:
+        profiles[name] = profile
+        save_profiles(profiles_path, profiles)
+    return profile
+
+def load_source(path: Path, profile: dict, kind: str, chunksize: int = CSV_CHUNK_ROWS,
+                encoding: str = None) -> pd.DataFrame:
+    """Прочитать выгрузку, оставив только колонки профиля (и EXTRA_COLUMNS),
+    под каноническими именами CANONICAL_COLUMNS[kind]. encoding - результат sniff_encoding"""
+    targets = CANONICAL_COLUMNS[kind]
+    roles = {role: profile.get(role) for role in PROFILE_ROLES if profile.get(role) is not None}
+    extras = [col for col in EXTRA_COLUMNS[kind] if col not in roles.values() and col not in targets.values()]
+    wanted = {*roles.values(), *extras}
+
+    # отсутствующие в файле колонки просто не читаются, отдельно заголовок не нужен
+    df = read_csv_guess(path, usecols=(lambda col: col in wanted) if wanted else None,
+                        chunksize=chunksize, encoding=encoding)
+    sources = {role: col for role, col in roles.items() if col in df.columns}
+    extras = [col for col in extras if col in df.columns]
+    # колонка может служить сразу нескольким ролям (например, тема из первой колонки,
+    # которая и есть ключ), поэтому собираем таблицу заново, а не переименовываем
+    columns = {targets[role]: df[col] for role, col in sources.items()}
+    columns.update({col: df[col] for col in extras})
+    return pd.DataFrame(columns, index=df.index)
+
+def sprint_number(s) -> int:
+    """Номер спринта по любой строке, содержащей 'Спринт' и номер (в том числе
+    'META Спринт 13'); NO_SPRINT_NUMBER, если номера нет"""
+    if s is None or (isinstance(s, float) and pd.isna(s)):
+        return NO_SPRINT_NUMBER
+    m = SPRINT_RE.search(str(s))
+    return int(m.group(1)) if m else NO_SPRINT_NUMBER
+
+def sprint_label(number: int) -> str:
+    """'Спринт N' по номеру или 'Нет спринта'"""
+    return NO_SPRINT if number == NO_SPRINT_NUMBER else f"Спринт {number}"
 
 def canonical_sprint(s: str) -> str:
     """Вернуть 'Спринт N' по любой строке, содержащей 'Спринт' и номер.
        Если номер не найден — 'Нет спринта'"""
-    if s is None or (isinstance(s, float) and pd.isna(s)):
-        return "Нет спринта"
-    s = str(s)
-    m = re.search(r'Спринт\s*(\d+)', s, flags=re.IGNORECASE)
-    if m:
-        return f"Спринт {int(m.group(1))}"
-    # иногда в данных может быть 'META Спринт 13'
-    m2 = re.search(r'META\s*Спринт\s*(\d+)', s, flags=re.IGNORECASE)
-    if m2:
-        return f"Спринт {int(m2.group(1))}"
-    return "Нет спринта"
-
-def extract_meta_key_from_text(s: str):
-    if s is None or (isinstance(s, float) and pd.isna(s)):
-        return None
-    m = re.search(r'(META-\d+)', str(s), flags=re.IGNORECASE)
-    return m.group(1).upper() if m else None
+    return sprint_label(sprint_number(s))
 
-def extract_inv_key_from_text(s: str):
-    """Извлечение ключа Invaders (MT-, PART-, FEATURE- и т.д.) из текста"""
-    if s is None or (isinstance(s, float) and pd.isna(s)):
-        return None
-    
-    s_str = str(s).upper()
-    
-    # Проверяем все возможные префиксы Invaders
-    for prefix in INV_PREFIXES:
-        pattern = fr'({prefix}\d+)'
-        m = re.search(pattern, s_str, re.IGNORECASE)
-        if m:
-            return m.group(1).upper()
-    
-    return None
+def sprint_numbers(col: pd.Series) -> pd.Series:
+    """Номера спринтов колонки (int). Различных значений в колонке спринта
+    несколько десятков, поэтому разбор идёт один раз на значение"""
+    codes, uniques = pd.factorize(col)
+    # код -1 (пустое значение) попадает на последний элемент - NO_SPRINT_NUMBER
+    numbers = np.array([sprint_number(v) for v in uniques] + [NO_SPRINT_NUMBER], dtype=np.int64)
+    return pd.Series(numbers[codes], index=col.index)
+
+def sprint_labels(numbers: pd.Series) -> pd.Series:
+    """'Спринт N' / 'Нет спринта' по колонке номеров (один раз на номер)"""
+    codes, uniques = pd.factorize(numbers)
+    labels = np.array([sprint_label(int(n)) for n in uniques] + [None], dtype=object)
+    return pd.Series(labels[codes], index=numbers.index, dtype=object)
+
+def sprint_order(numbers) -> list:
+    """Различные номера спринтов по возрастанию, 'Нет спринта' - последним"""
+    return sorted(set(int(n) for n in numbers), key=lambda n: (n == NO_SPRINT_NUMBER, n))
+
+def _upper_text(col: pd.Series) -> pd.Series:
+    """Колонка в виде строк в верхнем регистре; пустые значения остаются NaN"""
+    return col.astype(str).str.upper().where(col.notna())
+
+def extract_meta_keys(texts: pd.Series) -> pd.Series:
+    """Извлечение ключа META-XXX из каждой строки колонки (NaN, если ключа нет)"""
+    return _upper_text(texts).str.extract(META_KEY_RE, expand=False)
+
+def extract_inv_keys(texts: pd.Series) -> pd.Series:
+    """Извлечение ключа Invaders (MT-, PART-, FEATURE- и т.д.) из каждой строки колонки"""
+    return _upper_text(texts).str.extract(INV_KEY_RE, expand=False)
+
+def normalize_inv_keys(keys: pd.Series) -> pd.Series:
+    """Нормализация колонки ключей Invaders - извлекаем правильный формат.
+    Ключ, начинающийся с префикса и заканчивающийся номером, остаётся целиком,
+    иначе из строки извлекается первый ключ с префиксом (NaN, если его нет)"""
+    key_upper = _upper_text(keys)
+    whole = key_upper.where(key_upper.str.fullmatch(INV_WHOLE_KEY_RE, na=False))
+    return whole.fillna(key_upper.str.extract(INV_KEY_RE, expand=False))
+
+def build_task_urls(task_ids: pd.Series, task_type: str) -> pd.Series:
+    """URL для колонки ID задач заданного типа ('mos' или 'inv'); '#' если ID пустой"""
+    ids = _upper_text(task_ids).str.strip()
+    num = ids.str.extract(NUMBER_RE, expand=False)
 
-def get_task_url(task_id: str, task_type: str) -> str:
-    """Получить URL для задачи по её ID и типу"""
-    if not task_id or pd.isna(task_id):
-        return "#"
-    
-    task_id_str = str(task_id).strip().upper()
-    
     if task_type == 'mos':
         # Для ДИТ: добавляем META- если нет
-        if task_id_str.startswith('META-'):
-            return f"{MOS_BASE_URL}{task_id_str}"
-        else:
-            # Проверяем, есть ли номер в ID
-            num_match = re.search(r'(\d+)', task_id_str)
-            if num_match:
-                return f"{MOS_BASE_URL}META-{num_match.group(1)}"
-            return "#"
+        path = ids.where(ids.str.startswith('META-', na=False))
+        path = path.fillna(num.radd('META-'))
+        base = MOS_BASE_URL
     elif task_type == 'inv':
-        # Для Invaders: проверяем все возможные префиксы
-        for prefix in INV_PREFIXES:
-            if task_id_str.startswith(prefix):
-                return f"{INV_BASE_URL}{task_id_str}"
-        
-        # Если префикса нет, пробуем извлечь номер и добавляем MT- по умолчанию
-        num_match = re.search(r'(\d+)', task_id_str)
-        if num_match:
-            # Но сначала проверим, может быть в самом ID есть префикс, но в нижнем регистре
-            lower_id = str(task_id).lower()
-            for prefix in INV_PREFIXES:
-                prefix_lower = prefix.lower()
-                if prefix_lower in lower_id:
-                    # Извлекаем полный ключ с префиксом
-                    pattern = fr'({prefix_lower}\d+)'
-                    m = re.search(pattern, lower_id)
-                    if m:
-                        return f"{INV_BASE_URL}{m.group(1).upper()}"
-            
-            # Если не нашли префикс, используем MT- по умолчанию
-            return f"{INV_BASE_URL}MT-{num_match.group(1)}"
-        return "#"
-    return "#"
-
-def normalize_inv_key(key_str: str):
-    """Нормализация ключа Invaders - извлекаем правильный формат"""
-    if not key_str or pd.isna(key_str):
-        return None
-    
-    # Пробуем извлечь ключ с любым из префиксов
-    key_upper = str(key_str).upper()
-    
-    for prefix in INV_PREFIXES:
-        if key_upper.startswith(prefix):
-            # Убедимся, что после префикса есть номер
-            if re.search(r'\d+$', key_upper[len(prefix):]):
-                return key_upper
-    
-    # Если не нашли префикс, пробуем извлечь из строки
-    for prefix in INV_PREFIXES:
-        pattern = fr'({prefix}\d+)'
-        m = re.search(pattern, key_upper)
-        if m:
-            return m.group(1)
-    
-    return None
+        # Для Invaders: ID с префиксом, затем ключ с префиксом внутри ID,
+        # иначе номер с префиксом MT- по умолчанию
+        path = ids.where(ids.str.match(INV_PREFIX_RE, na=False))
+        path = path.fillna(ids.str.extract(INV_KEY_RE, expand=False))
+        path = path.fillna(num.radd('MT-'))
+        base = INV_BASE_URL
+    else:
+        return pd.Series("#", index=task_ids.index, dtype=object)
+
+    path = path.where(ids != "")
+    return pd.Series(base, index=task_ids.index).str.cat(path).fillna("#")
 
-def find_status_column(df, system_name):
+@functools.lru_cache(maxsize=None)
+def status_group(status) -> str:
+    """Группа статуса по STATUS_GROUPS. Различных статусов в выгрузках немного,
+    поэтому каждый классифицируется один раз за запуск"""
+    text = str(status or '').lower()
+    for group, _label, _color, keywords in STATUS_GROUPS:
+        if any(keyword in text for keyword in keywords):
+            return group
+    return STATUS_OTHER
+
+def status_groups(statuses: pd.Series) -> pd.Series:
+    """Группы статусов колонки (пустые - STATUS_OTHER): классифицируются только различные значения"""
+    codes, uniques = pd.factorize(statuses)
+    groups = np.array([status_group(status) for status in uniques] + [STATUS_OTHER], dtype=object)
+    return pd.Series(groups[codes], index=statuses.index)
+
+def status_group_info() -> dict:
+    """{группа: (подпись, цвет)} в порядке STATUS_GROUPS"""
+    return {group: (label, color) for group, label, color, _keywords in STATUS_GROUPS}
+
+def find_status_column(df, system_name, verbose=True):
     """Найти колонку со статусом в DataFrame"""
     status_columns = []
     
@@ -176,25 +499,93 @@ def find_status_column(df, system_name):
     if status_columns:
         return status_columns[0]
     
-    # Если не нашли, проверяем содержимое колонок
+    # Если не нашли, проверяем содержимое колонок: значение ячейки целиком должно быть
+    # ключевым словом STATUS_GROUPS, иначе темы и комментарии со словами вроде 'new'
+    # принимались бы за статус
+    keywords = {keyword for _g, _l, _c, group_keywords in STATUS_GROUPS for keyword in group_keywords}
     for col in df.columns:
         # Берем первые несколько непустых значений
         sample_values = df[col].dropna().head(5)
-        if len(sample_values) > 0:
-            # Проверяем, содержат ли значения типичные статусы
-            status_keywords = ['открыт', 'в работе', 'готово', 'закрыт', 'отложен',
-                              'open', 'in progress', 'done', 'closed', 'resolved']
+        if any(" ".join(str(val).lower().split()) in keywords for val in sample_values):
+            return col
+    
+    if verbose:
+        print(f"  ⚠️ Для {system_name} не найдена колонка со статусом. Доступные колонки: {list(df.columns)[:10]}...")
+    return None
+
+def find_sprint_column(df, verbose=True):
+    """Найти колонку со спринтом в DataFrame Invaders"""
+    # Возможные названия колонки со спринтом
+    possible_names = [
+        'Релизный спринт', 'Release Sprint', 'Sprint', 'Спринт',
+        'Пользовательское поле (Релизный спринт)',
+        'Custom field (Release Sprint)'
+    ]
+    
+    # Ищем точное совпадение
+    for col in df.columns:
+        col_str = str(col).strip()
+        if col_str in possible_names:
+            if verbose:
+                print(f"  ✓ Найдена колонка спринта: '{col}'")
+            return col
+    
+    # Если не нашли точное совпадение, ищем частичное
+    for col in df.columns:
+        col_lower = str(col).lower()
+        if any(name.lower() in col_lower for name in ['спринт', 'sprint', 'релиз']):
+            if verbose:
+                print(f"  ⚠️ Найдена похожая колонка: '{col}'")
+            return col
+    
+    # Если все еще не нашли, показываем первые значения из каждой колонки
+    if verbose:
+        print("  ❗ Не найдена колонка со спринтом. Проверяем содержимое колонок...")
+    for col in df.columns[:5]:  # Проверяем первые 5 колонок
+        sample_values = df[col].dropna().head(3)
+        if not sample_values.empty:
+            if verbose:
+                print(f"    Колонка '{col}': {list(sample_values.values)}")
+            # Проверяем, содержат ли значения слово "спринт"
             for val in sample_values:
-                val_str = str(val).lower()
-                if any(keyword in val_str for keyword in status_keywords):
+                if isinstance(val, str) and ('спринт' in val.lower() or 'sprint' in val.lower()):
+                    if verbose:
+                        print(f"  ✓ Возможно это колонка спринта: '{col}'")
                     return col
-    
-    print(f"  ⚠️ Для {system_name} не найдена колонка со статусом. Доступные колонки: {list(df.columns)[:10]}...")
     return None
 
 # -------------------------
 # Сопоставление
 # -------------------------
+# Токен ключа задачи вида PREFIX-NNN (META-12, MT-5, ...). Границы не дают
+# ключу META-12 совпасть внутри META-123 или XMETA-12.
+KEY_TOKEN_RE = re.compile(r'(?<![A-Z0-9])([A-Z][A-Z0-9_]*-\d+)(?!\d)')
+
+def _is_empty(v) -> bool:
+    return v is None or (isinstance(v, float) and pd.isna(v))
+
+def build_token_index(titles: pd.Series) -> dict:
+    """Один проход по темам: токен PREFIX-NNN -> список индексов строк (в порядке строк)"""
+    index = {}
+    for idx, title in titles.items():
+        if _is_empty(title):
+            continue
+        for token in dict.fromkeys(KEY_TOKEN_RE.findall(str(title).upper())):
+            index.setdefault(token, []).append(idx)
+    return index
+
+def _first_free(index: dict, cursors: dict, token: str, used: set):
+    """Первая ещё не сопоставленная строка с токеном в теме (или None).
+    Курсор по каждому токену только сдвигается вперёд, т.к. used лишь растёт."""
+    rows = index.get(token)
+    if not rows:
+        return None
+    pos = cursors.get(token, 0)
+    while pos < len(rows) and rows[pos] in used:
+        pos += 1
+    cursors[token] = pos
+    return rows[pos] if pos < len(rows) else None
+
 def match_two_way(mos_df, inv_df):
     """
     Возвращаем:
@@ -205,7 +596,28 @@ def match_two_way(mos_df, inv_df):
       1) прямое совпадение по ключу 'Ключ проблемы' (равенство)
       2) если у Mos есть ключ META-XXX и он встречается в теме Invaders -> match
       3) если у Inv есть ключ META-XXX и он встречается в теме Mos -> match
+    Для шагов 2 и 3 темы один раз индексируются по токенам PREFIX-NNN,
+    поэтому сопоставление почти линейное по числу строк.
     """
+    steps = match_steps(mos_df, inv_df)
+    matches = [(mi, ji) for mi, ji, _step in steps]
+    mos_used = {mi for mi, _ji in matches}
+    inv_used = {ji for _mi, ji in matches}
+    return matches, mos_used, inv_used
+
+def title_column(df, fallback_col: str = None) -> pd.Series:
+    """Колонка 'Тема'; при пустой теме берётся fallback_col, если он есть"""
+    titles = df['Тема'] if 'Тема' in df.columns else pd.Series("", index=df.index)
+    if fallback_col and fallback_col in df.columns:
+        titles = titles.where(titles.fillna("") != "", df[fallback_col])
+    return titles
+
+def match_titles(mos_df, inv_df):
+    """Темы, в которых ищутся ключи: (темы Mos, темы Invaders; при пустой 'Тема' берём 'title')"""
+    return title_column(mos_df), title_column(inv_df, 'title')
+
+def match_steps(mos_df, inv_df):
+    """Алгоритм match_two_way: список (mos_index, inv_index, шаг 1/2/3) в порядке нахождения"""
     matches = []
     mos_used = set()
     inv_used = set()
@@ -216,77 +628,71 @@ def match_two_way(mos_df, inv_df):
     if 'Ключ проблемы' not in inv_df.columns:
         inv_df['Ключ проблемы'] = None
 
+    mos_keys = mos_df['Ключ проблемы']
+    inv_keys = inv_df['Ключ проблемы']
+
     # 1) прямое совпадение ключей (case-insensitive)
     inv_key_map = {}
-    for ji, j in inv_df.iterrows():
-        v = j.get('Ключ проблемы')
-        if v is None or (isinstance(v, float) and pd.isna(v)):
+    for ji, v in inv_keys.items():
+        if _is_empty(v):
             continue
-        v_str = str(v).upper()
-        inv_key_map[v_str] = ji
+        inv_key_map[str(v).upper()] = ji
 
-    for mi, m in mos_df.iterrows():
-        mk = m.get('Ключ проблемы')
-        if mk is None or (isinstance(mk, float) and pd.isna(mk)):
+    for mi, mk in mos_keys.items():
+        if _is_empty(mk):
             continue
         mk_u = str(mk).upper()
         if mk_u in inv_key_map:
             ji = inv_key_map[mk_u]
-            matches.append((mi, ji))
+            matches.append((mi, ji, 1))
             mos_used.add(mi)
             inv_used.add(ji)
 
+    mos_titles, inv_titles = match_titles(mos_df, inv_df)
+
     # 2) ключ Mos в теме Invaders
-    for mi, m in mos_df.iterrows():
-        if mi in mos_used:
-            continue
-        mk = m.get('Ключ проблемы')
-        if mk is None or (isinstance(mk, float) and pd.isna(mk)):
+    inv_index = build_token_index(inv_titles)
+    inv_cursors = {}
+    for mi, mk in mos_keys.items():
+        if mi in mos_used or _is_empty(mk):
             continue
-        mk_u = str(mk).upper()
-        for ji, j in inv_df.iterrows():
-            if ji in inv_used:
-                continue
-            title = str(j.get('Тема') or j.get('title') or "")
-            if mk_u in title.upper():
-                matches.append((mi, ji))
-                mos_used.add(mi)
-                inv_used.add(ji)
-                break
-
-    # 3) ключ Inv in topic Mos
-    for ji, j in inv_df.iterrows():
-        if ji in inv_used:
-            continue
-        jk = j.get('Ключ проблемы')
-        if jk is None or (isinstance(jk, float) and pd.isna(jk)):
+        ji = _first_free(inv_index, inv_cursors, str(mk).upper(), inv_used)
+        if ji is not None:
+            matches.append((mi, ji, 2))
+            mos_used.add(mi)
+            inv_used.add(ji)
+
+    # 3) ключ Inv в теме Mos
+    mos_index = build_token_index(mos_titles)
+    mos_cursors = {}
+    for ji, jk in inv_keys.items():
+        if ji in inv_used or _is_empty(jk):
             continue
-        jk_u = str(jk).upper()
-        for mi, m in mos_df.iterrows():
-            if mi in mos_used:
-                continue
-            title = str(m.get('Тема') or "")
-            if jk_u in title.upper():
-                matches.append((mi, ji))
-                mos_used.add(mi)
-                inv_used.add(ji)
-                break
+        mi = _first_free(mos_index, mos_cursors, str(jk).upper(), mos_used)
+        if mi is not None:
+            matches.append((mi, ji, 3))
+            mos_used.add(mi)
+            inv_used.add(ji)
 
-    return matches, mos_used, inv_used
+    return matches
 
-def categorize_and_prepare(mos_df, inv_df, matches, mos_used, inv_used):
+def categorize_and_prepare(mos_df, inv_df, matches, mos_used, inv_used, status_columns=None):
     """
-    Возвращает структуру categorized:
-      {
-        'match': [ {mos_id, inv_id, mos_title, inv_title, mos_sprint, inv_sprint, mos_url, inv_url, is_bug, mos_status, inv_status}, ... ],
-        'diff_sprint': [...],
-        'mos_only': [...],
-        'inv_only': [...]
-      }
+    Возвращает таблицу результатов (pandas.DataFrame, колонки RESULT_COLUMNS):
+      category - 'match' | 'diff_sprint' | 'mos_only' | 'inv_only',
+      is_bug, mos_id, mos_title, mos_sprint, mos_status, mos_url,
+      inv_id, inv_title, inv_sprint, inv_status, inv_url
+    Для 'mos_only' колонки inv_* пустые (NaN), для 'inv_only' - mos_*.
+    Порядок строк: пары в порядке matches, затем mos_only и inv_only в порядке строк.
+    status_columns - уже найденные (mos_status_col, inv_status_col); по умолчанию ищутся в таблицах
     """
-    categorized = {'match': [], 'diff_sprint': [], 'mos_only': [], 'inv_only': []}
+    if status_columns is None:
+        status_columns = detect_status_columns(mos_df, inv_df)
+    results = build_results(mos_df, inv_df, matches, mos_used, inv_used, status_columns)
+    return results[RESULT_COLUMNS].reset_index(drop=True)
 
-    # Находим колонки со статусами
+def detect_status_columns(mos_df, inv_df):
+    """Найти колонки со статусами обеих систем: (mos_status_col, inv_status_col)"""
     mos_status_col = find_status_column(mos_df, "ДИТ")
     inv_status_col = find_status_column(inv_df, "Invaders")
     
@@ -300,491 +706,1237 @@ def categorize_and_prepare(mos_df, inv_df, matches, mos_used, inv_used):
     else:
         print(f"  ✗ Колонка статуса для Invaders не найдена")
 
-    for mi, ji in matches:
-        m = mos_df.loc[mi]
-        j = inv_df.loc[ji]
-        ms = canonical_sprint(m.get('Компоненты') if 'Компоненты' in m.index else m.get('sprint'))
-        js = canonical_sprint(j.get('Пользовательское поле (Релизный спринт)') if 'Пользовательское поле (Релизный спринт)' in j.index else j.get('sprint'))
-        
-        mos_id = m.get('Ключ проблемы')
-        inv_id = j.get('Ключ проблемы')
-        
-        # Нормализуем ключ Invaders
-        if inv_id:
-            normalized_inv_id = normalize_inv_key(inv_id)
-            if normalized_inv_id:
-                inv_id = normalized_inv_id
-        
-        # Получаем URL для задач
-        mos_url = get_task_url(mos_id, 'mos')
-        inv_url = get_task_url(inv_id, 'inv')
-        
-        # Получаем статусы задач
-        mos_status = m.get(mos_status_col) if mos_status_col else None
-        inv_status = j.get(inv_status_col) if inv_status_col else None
-        
-        # Очищаем статусы от NaN
-        if mos_status and isinstance(mos_status, float) and pd.isna(mos_status):
-            mos_status = None
-        if inv_status and isinstance(inv_status, float) and pd.isna(inv_status):
-            inv_status = None
-        
-        # Получаем названия задач
-        mos_title = m.get('Тема') or ""
-        inv_title = j.get('Тема') or j.get('title') or ""
-        
-        # Определяем, является ли задача багом
-        # Проверяем в названии Invaders наличие [Баг]
-        is_bug = False
-        if isinstance(inv_title, str) and '[Баг]' in inv_title:
-            is_bug = True
-        elif isinstance(mos_title, str) and '[Баг]' in mos_title:
-            is_bug = True
-        
-        rec = {
-            'mos_id': mos_id,
-            'inv_id': inv_id,
-            'mos_title': mos_title,
-            'inv_title': inv_title,
-            'mos_sprint': ms,
-            'inv_sprint': js,
-            'mos_url': mos_url,
-            'inv_url': inv_url,
-            'is_bug': is_bug,
-            'mos_status': str(mos_status) if mos_status else "Неизвестно",
-            'inv_status': str(inv_status) if inv_status else "Неизвестно"
-        }
-        if ms == js:
-            categorized['match'].append(rec)
+    return mos_status_col, inv_status_col
+
+def profile_status_columns(mos_df, inv_df):
+    """Колонки статуса таблиц, прочитанных по профилям выгрузок: STATUS_COLUMN или None"""
+    return tuple(STATUS_COLUMN if STATUS_COLUMN in df.columns else None for df in (mos_df, inv_df))
+
+def _status_values(df, status_col) -> pd.Series:
+    """Статусы строками; пустые - UNKNOWN_STATUS"""
+    if not status_col:
+        return pd.Series(UNKNOWN_STATUS, index=df.index, dtype=object)
+    status = df[status_col]
+    text = status.astype(str)
+    known = status.notna() & (text != "")
+    if pd.api.types.is_numeric_dtype(status):
+        known &= status != 0
+    return text.where(known, UNKNOWN_STATUS).astype(object)
+
+def side_results(df, side: str, status_col) -> pd.DataFrame:
+    """
+    Колонки одной стороны для таблицы результатов ('mos' или 'inv'),
+    индекс - индекс строк df: {side}_id, _title, _sprint, _status, _url и {side}_bug.
+    """
+    if side == 'mos':
+        ids = df['Ключ проблемы']
+        titles = title_column(df)
+        sprint_source = 'Компоненты'
+    else:
+        raw_ids = df['Ключ проблемы']
+        ids = normalize_inv_keys(raw_ids).fillna(raw_ids)
+        titles = title_column(df, 'title')
+        sprint_source = 'Пользовательское поле (Релизный спринт)'
+
+    if 'sprint_no' in df.columns:
+        numbers = df['sprint_no']
+    else:
+        source = df[sprint_source] if sprint_source in df.columns else pd.Series(None, index=df.index, dtype=object)
+        numbers = sprint_numbers(source)
+
+    titles = titles.fillna("").astype(object)
+    return pd.DataFrame({
+        f'{side}_id': ids.astype(object),
+        f'{side}_title': titles,
+        f'{side}_sprint': sprint_labels(numbers),
+        f'{side}_sprint_no': numbers,
+        f'{side}_status': _status_values(df, status_col),
+        f'{side}_url': build_task_urls(ids, side).astype(object),
+        f'{side}_bug': titles.astype(str).str.contains('[Баг]', regex=False).astype(bool),
+    }, index=df.index)
+
+def build_results(mos_df, inv_df, matches, mos_used, inv_used, status_columns) -> pd.DataFrame:
+    """
+    Категоризация соединениями таблиц: RESULT_COLUMNS плюс mos_index/inv_index -
+    индексы строк исходных таблиц (NaN для отсутствующей стороны).
+    """
+    mos_status_col, inv_status_col = status_columns
+    mos = side_results(mos_df, 'mos', mos_status_col)
+    inv = side_results(inv_df, 'inv', inv_status_col)
+
+    pairs = pd.DataFrame(list(matches), columns=['mos_index', 'inv_index'], dtype=object)
+    paired = pd.concat([
+        pairs,
+        mos.reindex(pairs['mos_index']).reset_index(drop=True),
+        inv.reindex(pairs['inv_index']).reset_index(drop=True),
+    ], axis=1)
+    paired['category'] = np.where(paired['mos_sprint_no'] == paired['inv_sprint_no'], 'match', 'diff_sprint')
+    paired['is_bug'] = paired['inv_bug'].astype(bool) | paired['mos_bug'].astype(bool)
+
+    mos_only = mos[~mos.index.isin(list(mos_used))]
+    mos_only = mos_only.assign(category='mos_only', is_bug=mos_only['mos_bug'],
+                               mos_index=mos_only.index.to_series().astype(object))
+    inv_only = inv[~inv.index.isin(list(inv_used))]
+    inv_only = inv_only.assign(category='inv_only', is_bug=inv_only['inv_bug'],
+                               inv_index=inv_only.index.to_series().astype(object))
+
+    columns = RESULT_COLUMNS + ['mos_index', 'inv_index']
+    parts = [part.reset_index(drop=True).reindex(columns=columns) for part in (paired, mos_only, inv_only)]
+    results = pd.concat(parts, ignore_index=True)
+    results['is_bug'] = results['is_bug'].astype(bool)
+    for col in ('mos_sprint_no', 'inv_sprint_no'):
+        results[col] = results[col].astype('Int64')
+    return results
+
+def category_counts(results, bugs_only: bool = False) -> dict:
+    """Количество строк (или багов) по категориям: {категория: n} для всех CATEGORIES"""
+    rows = results[results['is_bug']] if bugs_only else results
+    counts = rows['category'].value_counts()
+    return {category: int(counts.get(category, 0)) for category in CATEGORIES}
+
+def _side_statuses(results) -> pd.Series:
+    """Статусы задач обеих систем (сторона есть у записи) одной колонкой"""
+    return pd.concat([
+        results.loc[results['category'] != 'inv_only', 'mos_status'],
+        results.loc[results['category'] != 'mos_only', 'inv_status'],
+    ])
+
+def status_counts(results) -> dict:
+    """Количество задач по статусам (обе системы), по возрастанию статуса"""
+    return dict(sorted(_side_statuses(results).value_counts().items()))
+
+def status_group_counts(results) -> dict:
+    """Количество задач по группам статусов (обе системы) в порядке STATUS_GROUPS"""
+    counts = status_groups(_side_statuses(results)).value_counts()
+    return {group: int(counts.get(group, 0)) for group in status_group_info()}
+
+def category_fields(category: str) -> list:
+    """Поля записей категории: is_bug и поля её сторон"""
+    fields = ['is_bug']
+    if category != 'inv_only':
+        fields += ['mos_id', 'mos_title', 'mos_sprint', 'mos_sprint_no', 'mos_status', 'mos_url']
+    if category != 'mos_only':
+        fields += ['inv_id', 'inv_title', 'inv_sprint', 'inv_sprint_no', 'inv_status', 'inv_url']
+    return fields
+
+# -------------------------
+# Параллельный режим
+# -------------------------
+# Строки, у которых нет общих токенов, сопоставляются независимо (см. ниже
+# "Инкрементальное сопоставление"), поэтому части для процессов собираются
+# из целых компонент и результат совпадает с последовательным.
+def partition_by_tokens(mos_tokens: dict, inv_tokens: dict, parts: int):
+    """
+    Разбить строки на не более parts частей так, чтобы строки с общим токеном
+    попали в одну часть. mos_tokens/inv_tokens: индекс строки -> токены.
+    Возвращает [(индексы ДИТ, индексы Invaders)], индексы в исходном порядке.
+    """
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for side, tokens_of in (('mos', mos_tokens), ('inv', inv_tokens)):
+        for label, tokens in tokens_of.items():
+            node = (side, label)
+            parent.setdefault(node, node)
+            for tok in tokens:
+                tok_node = ('tok', tok)
+                parent.setdefault(tok_node, tok_node)
+                a, b = find(node), find(tok_node)
+                if a != b:
+                    parent[a] = b
+
+    components = {}
+    for side, tokens_of in (('mos', mos_tokens), ('inv', inv_tokens)):
+        for label in tokens_of:
+            components.setdefault(find((side, label)), ([], []))[0 if side == 'mos' else 1].append(label)
+
+    # крупные компоненты первыми - в наименее загруженную часть
+    buckets = [([], []) for _ in range(max(1, parts))]
+    loads = [(0, i) for i in range(len(buckets))]
+    for mos_labels, inv_labels in sorted(components.values(), key=lambda c: -(len(c[0]) + len(c[1]))):
+        load, i = heapq.heappop(loads)
+        buckets[i][0].extend(mos_labels)
+        buckets[i][1].extend(inv_labels)
+        heapq.heappush(loads, (load + len(mos_labels) + len(inv_labels), i))
+
+    order_mos = {label: pos for pos, label in enumerate(mos_tokens)}
+    order_inv = {label: pos for pos, label in enumerate(inv_tokens)}
+    return [(sorted(m, key=order_mos.__getitem__), sorted(j, key=order_inv.__getitem__))
+            for m, j in buckets if m or j]
+
+def run_parallel(stage: str, func, tasks, workers: int):
+    """
+    Выполнить func(*task) для каждой задачи в пуле процессов, результаты - в порядке задач.
+    func возвращает (результат, секунды CPU); печатается время этапа и ускорение
+    (процессорное время всех частей / общее время этапа).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        done = list(pool.map(func, *zip(*tasks))) if tasks else []
+    wall = time.perf_counter() - started
+    busy = sum(seconds for _result, seconds in done)
+    print(f"  ⏱ {stage}: {wall:.2f} с, частей {len(tasks)}, процессов {workers}, "
+          f"ускорение ×{busy / wall if wall else 1:.1f}")
+    return [result for result, _seconds in done]
+
+def _timed(func, *args):
+    started = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - started
+
+def _timed_match_partition(mos_df, inv_df, status_columns):
+    return _timed(match_partition, mos_df, inv_df, status_columns)
+
+def _timed_normalize(func, df):
+    return _timed(func, df)
+
+def normalize_in_parallel(stage: str, func, df, workers: int):
+    """func(df) по частям строк в пуле процессов; части склеиваются в исходном порядке"""
+    if workers <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return func(df)
+    size = -(-len(df) // (workers * PARALLEL_PARTS_PER_WORKER))
+    chunks = [df.iloc[start:start + size] for start in range(0, len(df), size)]
+    parts = run_parallel(stage, _timed_normalize, [(func, chunk) for chunk in chunks], workers)
+    return pd.concat(parts)
+
+def _render_output(func, args):
+    """func(*args) с перехватом печати: (вывод, секунды, исключение или None, traceback)"""
+    log = io.StringIO()
+    error = trace = None
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        try:
+            func(*args)
+        except Exception as e:
+            error, trace = e, traceback.format_exc()
+    return log.getvalue(), time.perf_counter() - started, error, trace
+
+def render_outputs(outputs: dict, workers: int = 0) -> dict:
+    """
+    Построить выходные файлы: outputs - {имя: (func, args)}. Выходы независимы и только
+    читают общие данные, поэтому строятся одновременно в пуле процессов (workers - см.
+    OUTPUT_WORKERS) и общее время - как у самого медленного. Печать каждого выхода
+    выводится целиком по его готовности, со временем.
+    Возвращает {имя: (исключение или None, traceback)}; ошибка одного выхода не мешает другим.
+    """
+    if workers <= 0:
+        workers = min(len(outputs), os.cpu_count() or 1)
+    started = time.perf_counter()
+    done = {}
+
+    def report(name, log, seconds, error, trace):
+        print(log, end="")
+        print(f"  ⏱ {name}: {seconds:.2f} с{' (ошибка)' if error else ''}")
+        done[name] = (error, trace)
+
+    if workers <= 1 or len(outputs) <= 1:
+        for name, (func, args) in outputs.items():
+            report(name, *_render_output(func, args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(outputs))) as pool:
+            futures = {pool.submit(_render_output, func, args): name for name, (func, args) in outputs.items()}
+            for future in as_completed(futures):
+                report(futures[future], *future.result())
+    print(f"  ⏱ выходы: {time.perf_counter() - started:.2f} с, процессов {max(1, min(workers, len(outputs)))}")
+    return done
+
+# -------------------------
+# Инкрементальное сопоставление
+# -------------------------
+# Жадное сопоставление связывает только строки с общим токеном (ключ или
+# PREFIX-NNN из темы), поэтому строки распадаются на независимые компоненты.
+# Пересчитываются лишь компоненты, которых коснулись добавленные, удалённые
+# или изменённые строки; остальные пары и записи берутся из прошлого запуска.
+# Состояние хранится колонками (каталог MATCH_STATE_NAME): хэши строк - в rows.npz,
+# токены строк и записи результата - в parquet (без pyarrow - pickle). Сравнение
+# с прошлым запуском векторное, построчно обрабатываются только пересчитываемые строки.
+
+# Нечетная 64-битная константа: номер повтора одинаковых строк смешивается с хэшем
+ROW_OCCURRENCE_MIX = 0x9E3779B97F4A7C15
+
+def row_identities(df) -> np.ndarray:
+    """Идентичность строк между запусками (uint64): хэш содержимого, смешанный с номером
+    повтора одинаковых строк"""
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy(dtype=np.uint64)
+    return hashes + occurrence * np.uint64(ROW_OCCURRENCE_MIX)
+
+def token_table(keys: pd.Series, titles: pd.Series, nodes=None) -> pd.DataFrame:
+    """
+    Токены, через которые строки могут сопоставиться, длинной таблицей: token, node
+    (номер строки, по умолчанию позиция), key (токен - ключ строки, а не PREFIX-NNN из темы).
+    Токены те же, что у match_steps: ключ в верхнем регистре и KEY_TOKEN_RE в теме.
+    """
+    nodes = np.arange(len(keys), dtype=np.int64) if nodes is None else np.asarray(nodes, dtype=np.int64)
+    parts = []
+    for values, is_key in ((titles, False), (keys, True)):
+        values = pd.Series(values.to_numpy(dtype=object), index=nodes)
+        values = values[values.notna()]
+        if is_key:
+            found = values.map(lambda key: str(key).upper())
         else:
-            categorized['diff_sprint'].append(rec)
+            found = values.map(lambda title: KEY_TOKEN_RE.findall(str(title).upper())).explode().dropna()
+        parts.append(pd.DataFrame({'token': found.to_numpy(dtype=object),
+                                   'node': found.index.to_numpy(dtype=np.int64), 'key': is_key}))
+    return pd.concat(parts, ignore_index=True)
 
-    # mos only
-    for mi, m in mos_df.iterrows():
-        if mi in mos_used:
-            continue
-        ms = canonical_sprint(m.get('Компоненты'))
-        mos_id = m.get('Ключ проблемы')
-        mos_url = get_task_url(mos_id, 'mos')
-        
-        # Получаем статус задачи
-        mos_status = m.get(mos_status_col) if mos_status_col else None
-        if mos_status and isinstance(mos_status, float) and pd.isna(mos_status):
-            mos_status = None
-        
-        # Определяем, является ли багом
-        mos_title = m.get('Тема') or ""
-        is_bug = isinstance(mos_title, str) and '[Баг]' in mos_title
-        
-        categorized['mos_only'].append({
-            'mos_id': mos_id,
-            'mos_title': mos_title,
-            'mos_sprint': ms,
-            'mos_url': mos_url,
-            'is_bug': is_bug,
-            'mos_status': str(mos_status) if mos_status else "Неизвестно"
-        })
-
-    # inv only
-    for ji, j in inv_df.iterrows():
-        if ji in inv_used:
-            continue
-        js = canonical_sprint(j.get('Пользовательское поле (Релизный спринт)') if 'Пользовательское поле (Релизный спринт)' in j.index else j.get('sprint'))
-        inv_id = j.get('Ключ проблемы')
-        
-        # Нормализуем ключ Invaders
-        if inv_id:
-            normalized_inv_id = normalize_inv_key(inv_id)
-            if normalized_inv_id:
-                inv_id = normalized_inv_id
-        
-        inv_url = get_task_url(inv_id, 'inv')
-        inv_title = j.get('Тема') or j.get('title') or ""
-        
-        # Получаем статус задачи
-        inv_status = j.get(inv_status_col) if inv_status_col else None
-        if inv_status and isinstance(inv_status, float) and pd.isna(inv_status):
-            inv_status = None
-        
-        # Определяем, является ли багом
-        is_bug = isinstance(inv_title, str) and '[Баг]' in inv_title
-        
-        categorized['inv_only'].append({
-            'inv_id': inv_id,
-            'inv_title': inv_title,
-            'inv_sprint': js,
-            'inv_url': inv_url,
-            'is_bug': is_bug,
-            'inv_status': str(inv_status) if inv_status else "Неизвестно"
-        })
-
-    return categorized
-
-def export_to_excel(categorized, out_file: Path, mos_df, inv_df):
+def load_match_state(state_path: Path, fingerprint):
+    """
+    Состояние прошлого запуска или None, если его нет или оно от другой конфигурации:
+    {'mos', 'inv': хэши строк (row_identities), 'tokens': token_table всех строк (node -
+    позиция строки ДИТ, затем Invaders), 'entries': записи результата с позициями строк}.
+    Типы колонок entries восстанавливаются по state.json: parquet возвращает object-колонки
+    строками, а результат должен совпадать с полным пересчетом и по типам
+    """
+    if state_path is None or not (state_path / "state.json").exists():
+        return None
+    try:
+        meta = json.loads((state_path / "state.json").read_text(encoding="utf-8"))
+        if meta.get('fingerprint') != json.loads(json.dumps(fingerprint)):
+            return None
+        fmt = meta['format']
+        with np.load(state_path / "rows.npz") as rows:
+            state = {'mos': rows['mos'], 'inv': rows['inv']}
+        for name in ('tokens', 'entries'):
+            path = state_path / f"{name}.{fmt}"
+            state[name] = pd.read_parquet(path) if fmt == "parquet" else pd.read_pickle(path)
+        state['entries'] = state['entries'].astype(meta['dtypes'])
+    except Exception as e:
+        print(f"  ⚠️ Не удалось прочитать состояние сопоставления ({e}), считаем заново")
+        return None
+    return state
+
+def save_match_state(state_path: Path, fingerprint, state):
+    """Сохранить состояние сопоставления (атомарно, через временный каталог)"""
+    fmt = _cache_format()
+    tmp = state_path.with_name(f".{state_path.name}.tmp")
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.savez(tmp / "rows.npz", mos=state['mos'], inv=state['inv'])
+        for name in ('tokens', 'entries'):
+            if fmt == "parquet":
+                state[name].to_parquet(tmp / f"{name}.{fmt}")
+            else:
+                state[name].to_pickle(tmp / f"{name}.{fmt}")
+        dtypes = {col: str(dtype) for col, dtype in state['entries'].dtypes.items()}
+        (tmp / "state.json").write_text(json.dumps({'fingerprint': fingerprint, 'format': fmt, 'dtypes': dtypes}),
+                                        encoding="utf-8")
+        shutil.rmtree(state_path, ignore_errors=True)
+        tmp.rename(state_path)
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        print(f"  ⚠️ Не удалось сохранить состояние сопоставления: {e}")
+
+def _moved_positions(positions, mapping) -> np.ndarray:
+    """Позиции строк прошлого запуска сейчас по mapping (прошлая позиция -> текущая);
+    -1 - строки нет (нет стороны у записи или строка удалена)"""
+    current = np.full(len(positions), -1, dtype=np.int64)
+    present = positions >= 0
+    current[present] = mapping[positions[present]]
+    return current
+
+def _changed_rows(prev, mos_ids, inv_ids, mos_keys, inv_keys, mos_titles, inv_titles):
+    """
+    Что пересчитывать по сравнению с прошлым запуском: (dirty, moved, tokens, stats).
+    dirty - маски пересчитываемых строк (ДИТ, Invaders); moved - прошлая позиция -> текущая
+    (-1 - строка удалена) по сторонам; tokens - token_table текущих строк.
+    None - переиспользовать прошлый результат нельзя (неизменённые строки идут в другом
+    порядке, хэши строк не уникальны) или невыгодно (больше RECONCILE_MAX_DIRTY_SHARE строк).
+    """
+    n_mos = len(mos_ids)
+    sides = []
+    for cur, old in ((mos_ids, prev['mos']), (inv_ids, prev['inv'])):
+        cur, old = pd.Index(cur), pd.Index(old)
+        if not (cur.is_unique and old.is_unique):
+            return None
+        sides.append((old.get_indexer(cur), cur.get_indexer(old)))
+    (mos_back, mos_moved), (inv_back, inv_moved) = sides
+    nodes_total = n_mos + len(inv_ids)
+
+    # прошлый номер строки (ДИТ, затем Invaders) -> текущий, -1 - строка удалена
+    prev_to_cur = np.concatenate([mos_moved, np.where(inv_moved >= 0, inv_moved + n_mos, -1)])
+    added = np.flatnonzero(np.concatenate([mos_back, inv_back]) < 0)
+
+    # токены: у сохранившихся строк - из прошлого состояния, у добавленных - заново
+    prev_tokens = prev['tokens']
+    token_nodes = prev_to_cur[prev_tokens['node'].to_numpy(dtype=np.int64)]
+    removed_tokens = prev_tokens[token_nodes < 0]
+    added_mos, added_inv = added[added < n_mos], added[added >= n_mos] - n_mos
+    tokens = pd.concat([
+        prev_tokens[token_nodes >= 0].assign(node=token_nodes[token_nodes >= 0]),
+        token_table(mos_keys.iloc[added_mos], mos_titles.iloc[added_mos], added_mos),
+        token_table(inv_keys.iloc[added_inv], inv_titles.iloc[added_inv], added_inv + n_mos),
+    ], ignore_index=True)
+
+    # обход компонент, затронутых добавленными и удалёнными строками: токен -> строки с ним,
+    # строка -> её токены, пока появляются новые строки
+    codes, uniques = pd.factorize(pd.concat([tokens['token'], removed_tokens['token']], ignore_index=True))
+    token_codes, removed_codes = codes[:len(tokens)], codes[len(tokens):]
+    nodes = tokens['node'].to_numpy(dtype=np.int64)
+    dirty = np.zeros(nodes_total, dtype=bool)
+    dirty[added] = True
+    seen = np.zeros(len(uniques), dtype=bool)
+    frontier = np.concatenate([removed_codes, token_codes[dirty[nodes]]])
+    while len(frontier):
+        fresh_tokens = np.zeros(len(uniques), dtype=bool)
+        fresh_tokens[frontier] = True
+        fresh_tokens &= ~seen
+        seen |= fresh_tokens
+        reached = np.zeros(nodes_total, dtype=bool)
+        reached[nodes[fresh_tokens[token_codes]]] = True
+        reached &= ~dirty
+        dirty |= reached
+        frontier = token_codes[reached[nodes]]
+
+    if dirty.sum() > RECONCILE_MAX_DIRTY_SHARE * nodes_total:
+        return None
+
+    # неизменённые строки должны идти в прежнем относительном порядке,
+    # иначе жадное сопоставление могло бы выбрать другие пары
+    for back, side_dirty in ((mos_back, dirty[:n_mos]), (inv_back, dirty[n_mos:])):
+        if np.any(np.diff(back[~side_dirty]) <= 0):
+            return None
+
+    is_added = np.zeros(nodes_total, dtype=bool)
+    is_added[added] = True
+    removed_keys = removed_tokens.loc[removed_tokens['key'].to_numpy(dtype=bool), 'token']
+    added_keys = tokens.loc[tokens['key'].to_numpy(dtype=bool) & is_added[nodes], 'token']
+    changed = int(added_keys.isin(set(removed_keys)).sum())
+    removed = int((prev_to_cur < 0).sum())
+    stats = {'added': len(added) - changed, 'removed': removed - changed, 'changed': changed}
+    return (dirty[:n_mos], dirty[n_mos:]), (mos_moved, inv_moved), tokens, stats
+
+def match_partition(mos_df, inv_df, status_columns) -> pd.DataFrame:
+    """Сопоставление и категоризация части строк: таблица build_results с колонкой step (шаг пары)"""
+    steps = match_steps(mos_df, inv_df)
+    step_of = {mi: step for mi, _ji, step in steps}
+    pairs = [(mi, ji) for mi, ji, _step in steps]
+    results = build_results(mos_df, inv_df, pairs, set(step_of), {ji for _mi, ji in pairs}, status_columns)
+    results['step'] = pd.array([step_of.get(mi) if category in ('match', 'diff_sprint') else None
+                                for category, mi in zip(results['category'], results['mos_index'])], dtype='Int8')
+    return results
+
+def reconcile(mos_df, inv_df, state_path: Path = None, workers: int = 0):
+    """
+    match_two_way + categorize_and_prepare с переиспользованием прошлого запуска.
+    Возвращает (matches, mos_used, inv_used, results) - то же, что полный пересчёт.
+    state_path - каталог состояния (хэши и токены строк, записи результата); None - всегда
+    полный пересчёт. Без изменений в выгрузках состояние не перезаписывается.
+    workers > 1 - пересчёт частями в пуле процессов (результат тот же).
+    Таблицы - из prepare_sources: колонка статуса уже выбрана профилем выгрузки.
+    """
+    status_columns = profile_status_columns(mos_df, inv_df)
+    mos_titles, inv_titles = match_titles(mos_df, inv_df)
+    mos_keys, inv_keys = mos_df['Ключ проблемы'], inv_df['Ключ проблемы']
+    mos_ids = row_identities(mos_df)
+    inv_ids = row_identities(inv_df)
+    n_mos = len(mos_ids)
+
+    fingerprint = [MATCH_STATE_VERSION, NORMALIZATION_VERSION, status_columns,
+                   list(mos_df.columns), list(inv_df.columns),
+                   MOS_BASE_URL, INV_BASE_URL, list(INV_PREFIXES)]
+    prev = load_match_state(state_path, fingerprint)
+    changes = None
+    if prev is not None:
+        changes = _changed_rows(prev, mos_ids, inv_ids, mos_keys, inv_keys, mos_titles, inv_titles)
+        if changes is None:
+            print("  Прошлый результат не переиспользуется (много изменений или другой порядок строк)")
+
+    entries = None
+    if changes is None:
+        dirty_mos, dirty_inv = np.ones(n_mos, dtype=bool), np.ones(len(inv_ids), dtype=bool)
+        tokens = kept = None
+    else:
+        (dirty_mos, dirty_inv), (mos_moved, inv_moved), tokens, stats = changes
+        prev_entries = prev['entries']
+        if np.array_equal(mos_moved, np.arange(n_mos)) and np.array_equal(inv_moved, np.arange(len(inv_ids))):
+            print("  Выгрузки не изменились с прошлого запуска, результат взят из состояния")
+            entries = prev_entries
+        else:
+            # записи удалённых строк отбрасываются, затронутых - пересчитываются
+            keep = np.ones(len(prev_entries), dtype=bool)
+            positions = {}
+            for side, moved, side_dirty in (('mos', mos_moved, dirty_mos), ('inv', inv_moved, dirty_inv)):
+                prev_pos = prev_entries[f'{side}_pos'].to_numpy(dtype=np.int64)
+                positions[side] = _moved_positions(prev_pos, moved)
+                stays = positions[side] >= 0
+                stays[stays] = ~side_dirty[positions[side][stays]]
+                keep &= (prev_pos < 0) | stays
+            kept = prev_entries[keep].assign(mos_pos=positions['mos'][keep], inv_pos=positions['inv'][keep])
+            print(f"  Изменения с прошлого запуска: +{stats['added']} / -{stats['removed']} / ~{stats['changed']} строк; "
+                  f"пересчитываем {int(dirty_mos.sum() + dirty_inv.sum())} из {n_mos + len(inv_ids)}")
+
+    if entries is None:
+        # Пересчёт затронутых строк; индекс строк - их позиция в выгрузке
+        sub_mos = mos_df.reset_index(drop=True).loc[dirty_mos]
+        sub_inv = inv_df.reset_index(drop=True).loc[dirty_inv]
+        parallel = workers > 1 and len(sub_mos) + len(sub_inv) >= PARALLEL_MIN_ROWS
+        if tokens is None and (parallel or state_path is not None):
+            tokens = pd.concat([
+                token_table(mos_keys, mos_titles),
+                token_table(inv_keys, inv_titles, np.arange(n_mos, n_mos + len(inv_ids))),
+            ], ignore_index=True)
+        if parallel:
+            tokens_of = tokens.groupby('node')['token'].agg(tuple)
+            partitions = partition_by_tokens(
+                {mi: tokens_of.get(mi, ()) for mi in sub_mos.index},
+                {ji: tokens_of.get(n_mos + ji, ()) for ji in sub_inv.index},
+                workers * PARALLEL_PARTS_PER_WORKER)
+            tasks = [(sub_mos.loc[mos_part], sub_inv.loc[inv_part], status_columns)
+                     for mos_part, inv_part in partitions]
+            parts = run_parallel("Сопоставление и категоризация", _timed_match_partition, tasks, workers)
+            fresh = pd.concat(parts, ignore_index=True) if parts else match_partition(sub_mos, sub_inv, status_columns)
+        else:
+            fresh = match_partition(sub_mos, sub_inv, status_columns)
+        fresh['mos_pos'] = fresh.pop('mos_index').fillna(-1).to_numpy(dtype=np.int64)
+        fresh['inv_pos'] = fresh.pop('inv_index').fillna(-1).to_numpy(dtype=np.int64)
+
+        # Сборка в том же порядке, что и при полном пересчёте:
+        # пары шагов 1-2 по строкам ДИТ, шага 3 - по строкам Invaders, затем "только"
+        entries = fresh if kept is None else pd.concat([kept, fresh], ignore_index=True)
+        category = entries['category'].to_numpy()
+        rank = entries['step'].to_numpy(dtype=float, na_value=np.nan)
+        rank[category == 'mos_only'] = 4
+        rank[category == 'inv_only'] = 5
+        position = np.where(np.isin(rank, [1, 2, 4]), entries['mos_pos'].to_numpy(), entries['inv_pos'].to_numpy())
+        entries = entries.iloc[np.lexsort((position, rank))].reset_index(drop=True)
+        if state_path is not None:
+            save_match_state(state_path, fingerprint, {'mos': mos_ids, 'inv': inv_ids,
+                                                       'tokens': tokens, 'entries': entries})
+
+    paired = entries['step'].notna().to_numpy()
+    matches = list(zip(mos_df.index[entries['mos_pos'].to_numpy()[paired]].tolist(),
+                       inv_df.index[entries['inv_pos'].to_numpy()[paired]].tolist()))
+    mos_used = {mi for mi, _ji in matches}
+    inv_used = {ji for _mi, ji in matches}
+    return matches, mos_used, inv_used, entries[RESULT_COLUMNS].copy()
+
+def text_width(values: pd.Series, header: str = "") -> int:
+    """Длина самого длинного значения колонки строкой (пустые не считаются) или заголовка.
+    Считается по колонке целиком векторно (str.len().max()), без обхода ячеек"""
+    values = values[values.notna()]
+    if not pd.api.types.is_string_dtype(values.dtype) or values.dtype == object:
+        values = values.astype(str)
+    longest = values.str.len().max() if len(values) else 0
+    return max(len(str(header)), int(longest or 0))
+
+def excel_column_width(text_length: int) -> int:
+    """Ширина колонки Excel под текст длины text_length: с запасом, не шире EXCEL_MAX_COLUMN_WIDTH"""
+    return min(text_length + 2, EXCEL_MAX_COLUMN_WIDTH)
+
+def excel_styles() -> dict:
+    """Стили ячеек книги без привязки к движку: {имя: свойства}. Свойства: bold, size,
+    color и fill (RRGGBB), align ('center'), border (тонкая рамка со всех сторон)"""
+    styles = {
+        'title': {'bold': True, 'size': 14, 'align': 'center'},
+        'section': {'bold': True, 'size': 12},
+        'header': {'bold': True, 'color': 'FFFFFF', 'fill': '0F1724', 'align': 'center', 'border': True},
+        'cell': {'border': True},
+    }
+    # группы статусов - цветом как в HTML
+    for group, (_label, color) in status_group_info().items():
+        styles[f'status-{group}'] = {'bold': True, 'color': 'FFFFFF', 'fill': color[1:].upper(), 'border': True}
+    return styles
+
+def excel_summary_sheet(results) -> dict:
+    """Лист 'Сводка': заголовок (A1:D1), дата, статистика и распределение по статусам"""
+    # Подсчет по категориям и багов
+    counts = category_counts(results)
+    bugs = category_counts(results, bugs_only=True)
+    total_bugs = sum(bugs.values())
+
+    stats_data = [
+        ["Всего задач ДИТ", counts['match'] + counts['diff_sprint'] + counts['mos_only']],
+        ["Всего задач Invaders", counts['match'] + counts['diff_sprint'] + counts['inv_only']],
+        ["Совпадения (одинаковые спринты)", counts['match']],
+        ["Совпадения (разные спринты)", counts['diff_sprint']],
+        ["Только в ДИТ", counts['mos_only']],
+        ["Только в Invaders", counts['inv_only']],
+        ["Всего совпадений", counts['match'] + counts['diff_sprint']],
+        ["Процент совпадений", f"{(counts['match'] + counts['diff_sprint']) / max(counts['match'] + counts['diff_sprint'] + counts['mos_only'], 1) * 100:.1f}%"],
+        ["Всего багов", total_bugs],
+        ["Баги в совпадениях", bugs['match'] + bugs['diff_sprint']],
+        ["Баги только в ДИТ", bugs['mos_only']],
+        ["Баги только в Invaders", bugs['inv_only']]
+    ]
+
+    # Строки по порядку: заголовок, дата (строка 3), статистика (с 5-й),
+    # распределение по статусам (через две пустые строки); ячейка - (значение, стиль)
+    groups = status_group_info()
+    rows = [
+        [("Сводный отчет по сопоставлению задач ДИТ и Invaders", 'title')],
+        [],
+        [("Дата создания отчета:", None), (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), None)],
+        [],
+        [("Статистика", 'section')],
+        [("Показатель", 'header'), ("Количество", 'header')],
+    ]
+    rows += [[(name, 'cell'), (value, 'cell')] for name, value in stats_data]
+    rows += [[], [], [("Распределение по статусам", 'section')]]
+    rows.append([("Статус", 'header'), ("Группа", 'header'), ("Количество", 'header')])
+    for status, count in status_counts(results).items():
+        group = status_group(status)
+        rows.append([(status, 'cell'), (groups[group][0], f'status-{group}'), (count, 'cell')])
+
+    # колонки сводки короткие (десятки строк) - ширина по значениям ячеек
+    widths = [0] * max(4, *(len(row) for row in rows))  # A:D - под заголовком
+    for row in rows:
+        for j, (value, _style) in enumerate(row):
+            if value:
+                widths[j] = max(widths[j], len(str(value)))
+    return {'title': "Сводка", 'rows': rows, 'merged': [(0, 0, 0, 3)],
+            'widths': [excel_column_width(width) for width in widths]}
+
+def excel_table_sheet(title: str, headers, columns, cell_values, fixed_widths=None) -> dict:
+    """Лист-таблица: строка заголовков и колонки columns (Series одной длины) в стиле 'cell';
+    cell_values(Series) - значения ячеек колонки массивом (вызывается при записи листа).
+    Ширина - по данным колонок (text_width), fixed_widths {номер колонки: ширина} - вручную"""
+    widths = [excel_column_width(text_width(col, header)) for col, header in zip(columns, headers)]
+    for col, width in (fixed_widths or {}).items():
+        widths[col] = width
+    return {'title': title, 'rows': [[(header, 'header') for header in headers]], 'merged': [],
+            'widths': widths, 'columns': columns, 'cell_values': cell_values}
+
+def split_sheet(sheet: dict, max_rows: int = None) -> list:
+    """Лист-таблица длиннее max_rows (по умолчанию EXCEL_MAX_ROWS) строк - листами продолжения
+    '<имя> (2)', ... с теми же заголовками и шириной колонок; остальные листы - как есть"""
+    per_sheet = (max_rows or EXCEL_MAX_ROWS) - len(sheet['rows'])
+    total = len(sheet['columns'][0]) if sheet.get('columns') else 0
+    if total <= per_sheet:
+        return [sheet]
+    parts = []
+    for number, start in enumerate(range(0, total, per_sheet), 1):
+        part = dict(sheet, columns=[col.iloc[start:start + per_sheet] for col in sheet['columns']])
+        if number > 1:
+            part['title'] = f"{sheet['title']} ({number})"
+        parts.append(part)
+    return parts
+
+def excel_sheets(results, mos_df, inv_df, detail: str = None) -> list:
     """
-    Создает Excel файл с несколькими листами:
+    Листы книги отчета без привязки к движку записи (см. EXCEL_WRITERS):
     1. Сводка (статистика)
     2. Совпадения
     3. Разные спринты
     4. Только ДИТ
     5. Только Invaders
-    6. Исходные данные ДИТ
-    7. Исходные данные Invaders
+    6. Исходные данные ДИТ (только detail='full', по умолчанию EXCEL_DETAIL)
+    7. Исходные данные Invaders (только detail='full')
+    Исходные данные - прочитанные по профилю колонки без NORMALIZED_COLUMNS.
+    Таблицы длиннее EXCEL_MAX_ROWS продолжаются на следующих листах (split_sheet).
+    Лист - словарь: title, widths (по колонкам), merged [(строка, колонка, строка, колонка)],
+    rows - первые строки списками (значение, стиль), затем у таблиц columns и cell_values -
+    данные в стиле 'cell'.
     """
+    def category_columns(category, fields, label=None):
+        """Колонки листа категории: fields, затем label (если задан) и тип"""
+        rows = results[results['category'] == category]
+        columns = [rows[field] for field in fields]
+        if label is not None:
+            columns.append(pd.Series(label, index=rows.index, dtype=object))
+        columns.append(pd.Series(np.where(rows['is_bug'].to_numpy(dtype=bool), "Баг", "Задача"),
+                                 index=rows.index, dtype=object))
+        return columns
+
+    def result_values(col):
+        """Значения колонки результатов: пустые - None"""
+        return col.astype(object).where(col.notna(), None).to_numpy()
+
+    def raw_columns(df):
+        # Выбираем только строковые колонки для избежания ошибок сортировки
+        source_columns = df.columns.difference(NORMALIZED_COLUMNS, sort=False).tolist()
+        columns = []
+        for col in source_columns:
+            # Проверяем, что колонка содержит строковые данные
+            try:
+                # Пробуем взять первую непустую ячейку
+                sample_value = df[col].dropna().iloc[0] if not df[col].dropna().empty else ""
+                # Если это строка или число, добавляем колонку
+                if isinstance(sample_value, (str, int, float)):
+                    columns.append(col)
+            except:
+                continue
+
+        # Если не нашли подходящих колонок, берем первые 8; ограничиваем количество колонок
+        return (columns or source_columns)[:8]
+
+    def raw_values(col):
+        """Значения колонки исходных данных: числа как есть, остальное строкой, пусто - ''"""
+        if pd.api.types.is_float_dtype(col):
+            return col.astype(object).where(col.notna(), "").to_numpy()
+        return col.astype(str).where(col.notna(), "").to_numpy(dtype=object)
+
+    sheets = [
+        excel_summary_sheet(results),
+        excel_table_sheet(
+            "Совпадения",
+            ["Спринт", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ", "Ссылка ДИТ",
+             "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Статус", "Тип"],
+            category_columns('match', ['mos_sprint', 'mos_id', 'mos_title', 'mos_status', 'mos_url',
+                                       'inv_id', 'inv_title', 'inv_status', 'inv_url'], "Совпадение"),
+            result_values),
+        excel_table_sheet(
+            "Разные спринты",
+            ["Спринт ДИТ", "Спринт Invaders", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ",
+             "Ссылка ДИТ", "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Статус", "Тип"],
+            category_columns('diff_sprint', ['mos_sprint', 'inv_sprint', 'mos_id', 'mos_title', 'mos_status',
+                                             'mos_url', 'inv_id', 'inv_title', 'inv_status', 'inv_url'],
+                             "Разные спринты"),
+            result_values),
+        # колонка статуса шире: статусы типа "На анализе у исполнителя"
+        excel_table_sheet(
+            "Только ДИТ",
+            ["Спринт", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ", "Ссылка ДИТ", "Тип"],
+            category_columns('mos_only', ['mos_sprint', 'mos_id', 'mos_title', 'mos_status', 'mos_url']),
+            result_values, fixed_widths={3: 30}),
+        excel_table_sheet(
+            "Только Invaders",
+            ["Спринт", "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Тип"],
+            category_columns('inv_only', ['inv_sprint', 'inv_id', 'inv_title', 'inv_status', 'inv_url']),
+            result_values),
+    ]
+    # Исходные данные ДИТ и Invaders (ограничим количество колонок) - только в полном отчете
+    if (detail or EXCEL_DETAIL) == 'full':
+        for title, df in (("Исходные данные ДИТ", mos_df), ("Исходные данные Invaders", inv_df)):
+            columns = raw_columns(df)
+            sheets.append(excel_table_sheet(title, [str(col) for col in columns], [df[col] for col in columns],
+                                            raw_values))
+    return [part for sheet in sheets for part in split_sheet(sheet)]
+
+def _sheet_data_rows(sheet):
+    """Строки данных листа-таблицы кортежами значений (пусто, если данных нет)"""
+    if 'columns' not in sheet:
+        return iter(())
+    return zip(*(sheet['cell_values'](col) for col in sheet['columns']))
+
+def write_xlsx_openpyxl(sheets, out_file: Path):
+    """Записать листы через openpyxl в режиме write-only: строки сериализуются при добавлении,
+    стили создаются один раз, ячейки данных со стилем переиспользуются для всех строк"""
     from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
     from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
     from openpyxl.utils import get_column_letter
-    
-    print(f"Создание Excel файла: {out_file}")
-    
-    # Создаем новую книгу
-    wb = Workbook()
-    
-    # Удаляем дефолтный лист
-    if 'Sheet' in wb.sheetnames:
-        ws = wb['Sheet']
-        wb.remove(ws)
-    
-    # Настройки стилей
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="0F1724", end_color="0F1724", fill_type="solid")
-    center_alignment = Alignment(horizontal="center", vertical="center")
-    border_style = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Лист 1: Сводка
-    ws_summary = wb.create_sheet("Сводка")
-    
-    # Заголовок
-    ws_summary.merge_cells('A1:D1')
-    ws_summary['A1'] = "Сводный отчет по сопоставлению задач ДИТ и Invaders"
-    ws_summary['A1'].font = Font(bold=True, size=14)
-    ws_summary['A1'].alignment = center_alignment
-    
-    ws_summary['A3'] = "Дата создания отчета:"
-    ws_summary['B3'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Статистика
-    ws_summary['A5'] = "Статистика"
-    ws_summary['A5'].font = Font(bold=True, size=12)
-    
-    # Подсчет багов
-    bug_count_match = sum(1 for item in categorized['match'] if item.get('is_bug', False))
-    bug_count_diff = sum(1 for item in categorized['diff_sprint'] if item.get('is_bug', False))
-    bug_count_mos = sum(1 for item in categorized['mos_only'] if item.get('is_bug', False))
-    bug_count_inv = sum(1 for item in categorized['inv_only'] if item.get('is_bug', False))
-    total_bugs = bug_count_match + bug_count_diff + bug_count_mos + bug_count_inv
-    
-    # Статистика по статусам
-    status_counts = {}
-    for cat in categorized.values():
-        for item in cat:
-            for sys in ['mos', 'inv']:
-                status_key = f'{sys}_status'
-                if status_key in item:
-                    status = item[status_key]
-                    if status not in status_counts:
-                        status_counts[status] = 0
-                    status_counts[status] += 1
-    
-    stats_data = [
-        ["Показатель", "Количество"],
-        ["Всего задач ДИТ", len(categorized['match']) + len(categorized['diff_sprint']) + len(categorized['mos_only'])],
-        ["Всего задач Invaders", len(categorized['match']) + len(categorized['diff_sprint']) + len(categorized['inv_only'])],
-        ["Совпадения (одинаковые спринты)", len(categorized['match'])],
-        ["Совпадения (разные спринты)", len(categorized['diff_sprint'])],
-        ["Только в ДИТ", len(categorized['mos_only'])],
-        ["Только в Invaders", len(categorized['inv_only'])],
-        ["Всего совпадений", len(categorized['match']) + len(categorized['diff_sprint'])],
-        ["Процент совпадений", f"{(len(categorized['match']) + len(categorized['diff_sprint'])) / max(len(categorized['match']) + len(categorized['diff_sprint']) + len(categorized['mos_only']), 1) * 100:.1f}%"],
-        ["Всего багов", total_bugs],
-        ["Баги в совпадениях", bug_count_match + bug_count_diff],
-        ["Баги только в ДИТ", bug_count_mos],
-        ["Баги только в Invaders", bug_count_inv]
-    ]
-    
-    for i, row in enumerate(stats_data):
-        for j, value in enumerate(row):
-            cell = ws_summary.cell(row=i+6, column=j+1)
-            cell.value = value
-            cell.border = border_style
-            if i == 0:  # Заголовок таблицы
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = center_alignment
-    
-    # Добавляем статистику по статусам
-    row_offset = len(stats_data) + 8
-    ws_summary.cell(row=row_offset, column=1, value="Распределение по статусам").font = Font(bold=True, size=12)
-    
-    status_data = [["Статус", "Количество"]]
-    for status, count in sorted(status_counts.items()):
-        status_data.append([status, count])
-    
-    for i, row in enumerate(status_data):
-        for j, value in enumerate(row):
-            cell = ws_summary.cell(row=row_offset + i + 1, column=j+1)
-            cell.value = value
-            cell.border = border_style
-            if i == 0:  # Заголовок таблицы
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = center_alignment
-    
-    # Лист 2: Совпадения
-    ws_matches = wb.create_sheet("Совпадения")
-    matches_headers = ["Спринт", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ", "Ссылка ДИТ", 
-                      "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Статус", "Тип"]
-    
-    for col, header in enumerate(matches_headers, 1):
-        cell = ws_matches.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    row = 2
-    for item in categorized['match']:
-        ws_matches.cell(row=row, column=1, value=item['mos_sprint']).border = border_style
-        ws_matches.cell(row=row, column=2, value=item['mos_id']).border = border_style
-        ws_matches.cell(row=row, column=3, value=item['mos_title']).border = border_style
-        ws_matches.cell(row=row, column=4, value=item.get('mos_status', 'Неизвестно')).border = border_style
-        ws_matches.cell(row=row, column=5, value=item['mos_url']).border = border_style
-        ws_matches.cell(row=row, column=6, value=item['inv_id']).border = border_style
-        ws_matches.cell(row=row, column=7, value=item['inv_title']).border = border_style
-        ws_matches.cell(row=row, column=8, value=item.get('inv_status', 'Неизвестно')).border = border_style
-        ws_matches.cell(row=row, column=9, value=item['inv_url']).border = border_style
-        ws_matches.cell(row=row, column=10, value="Совпадение").border = border_style
-        ws_matches.cell(row=row, column=11, value="Баг" if item.get('is_bug', False) else "Задача").border = border_style
-        row += 1
-    
-    # Лист 3: Разные спринты
-    ws_diff = wb.create_sheet("Разные спринты")
-    diff_headers = ["Спринт ДИТ", "Спринт Invaders", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ", 
-                   "Ссылка ДИТ", "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Статус", "Тип"]
-    
-    for col, header in enumerate(diff_headers, 1):
-        cell = ws_diff.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    row = 2
-    for item in categorized['diff_sprint']:
-        ws_diff.cell(row=row, column=1, value=item['mos_sprint']).border = border_style
-        ws_diff.cell(row=row, column=2, value=item['inv_sprint']).border = border_style
-        ws_diff.cell(row=row, column=3, value=item['mos_id']).border = border_style
-        ws_diff.cell(row=row, column=4, value=item['mos_title']).border = border_style
-        ws_diff.cell(row=row, column=5, value=item.get('mos_status', 'Неизвестно')).border = border_style
-        ws_diff.cell(row=row, column=6, value=item['mos_url']).border = border_style
-        ws_diff.cell(row=row, column=7, value=item['inv_id']).border = border_style
-        ws_diff.cell(row=row, column=8, value=item['inv_title']).border = border_style
-        ws_diff.cell(row=row, column=9, value=item.get('inv_status', 'Неизвестно')).border = border_style
-        ws_diff.cell(row=row, column=10, value=item['inv_url']).border = border_style
-        ws_diff.cell(row=row, column=11, value="Разные спринты").border = border_style
-        ws_diff.cell(row=row, column=12, value="Баг" if item.get('is_bug', False) else "Задача").border = border_style
-        row += 1
-    
-    # Лист 4: Только ДИТ - ОБНОВЛЕНО: добавлена колонка статуса
-    ws_mos_only = wb.create_sheet("Только ДИТ")
-    mos_only_headers = ["Спринт", "Ключ ДИТ", "Название ДИТ", "Статус ДИТ", "Ссылка ДИТ", "Тип"]
-    
-    for col, header in enumerate(mos_only_headers, 1):
-        cell = ws_mos_only.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    row = 2
-    for item in categorized['mos_only']:
-        ws_mos_only.cell(row=row, column=1, value=item['mos_sprint']).border = border_style
-        ws_mos_only.cell(row=row, column=2, value=item['mos_id']).border = border_style
-        ws_mos_only.cell(row=row, column=3, value=item['mos_title']).border = border_style
-        ws_mos_only.cell(row=row, column=4, value=item.get('mos_status', 'Неизвестно')).border = border_style
-        ws_mos_only.cell(row=row, column=5, value=item['mos_url']).border = border_style
-        ws_mos_only.cell(row=row, column=6, value="Баг" if item.get('is_bug', False) else "Задача").border = border_style
-        row += 1
-    
-    # Лист 5: Только Invaders
-    ws_inv_only = wb.create_sheet("Только Invaders")
-    inv_only_headers = ["Спринт", "Ключ Invaders", "Название Invaders", "Статус Invaders", "Ссылка Invaders", "Тип"]
-    
-    for col, header in enumerate(inv_only_headers, 1):
-        cell = ws_inv_only.cell(row=1, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    row = 2
-    for item in categorized['inv_only']:
-        ws_inv_only.cell(row=row, column=1, value=item['inv_sprint']).border = border_style
-        ws_inv_only.cell(row=row, column=2, value=item['inv_id']).border = border_style
-        ws_inv_only.cell(row=row, column=3, value=item['inv_title']).border = border_style
-        ws_inv_only.cell(row=row, column=4, value=item.get('inv_status', 'Неизвестно')).border = border_style
-        ws_inv_only.cell(row=row, column=5, value=item['inv_url']).border = border_style
-        ws_inv_only.cell(row=row, column=6, value="Баг" if item.get('is_bug', False) else "Задача").border = border_style
-        row += 1
-    
-    # Лист 6: Исходные данные ДИТ (ограничим количество колонок)
-    ws_mos_raw = wb.create_sheet("Исходные данные ДИТ")
-    
-    # Выбираем только строковые колонки для избежания ошибок сортировки
-    mos_columns = []
-    for col in mos_df.columns:
-        # Проверяем, что колонка содержит строковые данные
-        try:
-            # Пробуем взять первую непустую ячейку
-            sample_value = mos_df[col].dropna().iloc[0] if not mos_df[col].dropna().empty else ""
-            # Если это строка или число, добавляем колонку
-            if isinstance(sample_value, (str, int, float)):
-                mos_columns.append(col)
-        except:
-            continue
-    
-    # Если не нашли подходящих колонок, берем первые 8
-    if len(mos_columns) == 0:
-        mos_columns = list(mos_df.columns)[:8]
-    
-    # Ограничиваем количество колонок
-    mos_columns = mos_columns[:8]
-    
-    for col_idx, header in enumerate(mos_columns, 1):
-        cell = ws_mos_raw.cell(row=1, column=col_idx)
-        cell.value = str(header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    for i, row_data in mos_df.iterrows():
-        for j, col_name in enumerate(mos_columns, 1):
-            cell = ws_mos_raw.cell(row=i+2, column=j)
-            value = row_data[col_name] if col_name in row_data and not pd.isna(row_data[col_name]) else ""
-            cell.value = str(value) if not isinstance(value, (int, float)) else value
-            cell.border = border_style
-    
-    # Лист 7: Исходные данные Invaders (ограничим количество колонок)
-    ws_inv_raw = wb.create_sheet("Исходные данные Invaders")
-    
-    # Выбираем только строковые колонки для избежания ошибок сортировки
-    inv_columns = []
-    for col in inv_df.columns:
-        # Проверяем, что колонка содержит строковые данные
-        try:
-            # Пробуем взять первую непустую ячейку
-            sample_value = inv_df[col].dropna().iloc[0] if not inv_df[col].dropna().empty else ""
-            # Если это строка или число, добавляем колонку
-            if isinstance(sample_value, (str, int, float)):
-                inv_columns.append(col)
-        except:
-            continue
-    
-    # Если не нашли подходящих колонок, берем первые 8
-    if len(inv_columns) == 0:
-        inv_columns = list(inv_df.columns)[:8]
-    
-    # Ограничиваем количество колонок
-    inv_columns = inv_columns[:8]
-    
-    for col_idx, header in enumerate(inv_columns, 1):
-        cell = ws_inv_raw.cell(row=1, column=col_idx)
-        cell.value = str(header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
-        cell.border = border_style
-    
-    for i, row_data in inv_df.iterrows():
-        for j, col_name in enumerate(inv_columns, 1):
-            cell = ws_inv_raw.cell(row=i+2, column=j)
-            value = row_data[col_name] if col_name in row_data and not pd.isna(row_data[col_name]) else ""
-            cell.value = str(value) if not isinstance(value, (int, float)) else value
-            cell.border = border_style
-    
-    # Настройка ширины колонок (без сортировки)
-    for ws in wb.worksheets:
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if cell.value:
-                        cell_length = len(str(cell.value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Автонастройка ширины для колонки "Статус ДИТ"
-    if 'Только ДИТ' in wb.sheetnames:
-        ws_mos_only = wb['Только ДИТ']
-        # Настраиваем ширину для колонки статуса (столбец D)
-        ws_mos_only.column_dimensions['D'].width = 30  # Ширина для статусов типа "На анализе у исполнителя"
-    
-    # Сохраняем файл
+
+    thin = Side(style='thin')
+    style_objects = {}
+    for name, style in excel_styles().items():
+        objects = {}
+        if style.get('bold') or style.get('size') or style.get('color'):
+            objects['font'] = Font(bold=style.get('bold', False), size=style.get('size'), color=style.get('color'))
+        if style.get('fill'):
+            objects['fill'] = PatternFill(start_color=style['fill'], end_color=style['fill'], fill_type="solid")
+        if style.get('align'):
+            objects['alignment'] = Alignment(horizontal=style['align'], vertical="center")
+        if style.get('border'):
+            objects['border'] = Border(left=thin, right=thin, top=thin, bottom=thin)
+        style_objects[name] = objects
+
+    # Книга только на запись: листы в памяти не держатся
+    wb = Workbook(write_only=True)
+
+    def styled(ws, value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        for attr, obj in style_objects.get(style, {}).items():
+            setattr(cell, attr, obj)
+        return cell
+
+    for sheet in sheets:
+        ws = wb.create_sheet(sheet['title'])
+        # ширина колонок задается до первой строки: в write-only листе потом уже нельзя
+        for col, width in enumerate(sheet['widths'], 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+        for first_row, first_col, last_row, last_col in sheet['merged']:
+            ws.merged_cells.add(f"{get_column_letter(first_col + 1)}{first_row + 1}:"
+                                f"{get_column_letter(last_col + 1)}{last_row + 1}")
+        for row in sheet['rows']:
+            ws.append([styled(ws, value, style) if style else value for value, style in row])
+        # строка сериализуется в append, поэтому одни и те же ячейки со стилем
+        # заполняются значениями каждой следующей строки
+        cells = [styled(ws, None, 'cell') for _ in sheet['widths']]
+        for values in _sheet_data_rows(sheet):
+            for cell, value in zip(cells, values):
+                cell.value = value
+            ws.append(cells[:len(values)])
+
     wb.save(out_file)
+
+def write_xlsx_xlsxwriter(sheets, out_file: Path):
+    """Записать листы через xlsxwriter в режиме constant_memory: строка листа сбрасывается
+    на диск, как только начата следующая, память не растет с числом строк"""
+    import xlsxwriter
+
+    # строки пишутся как есть: без превращения в формулы, ссылки и числа
+    wb = xlsxwriter.Workbook(str(out_file), {'constant_memory': True, 'strings_to_formulas': False,
+                                             'strings_to_urls': False, 'strings_to_numbers': False})
+    formats = {}
+    for name, style in excel_styles().items():
+        props = {}
+        if style.get('bold'):
+            props['bold'] = True
+        if style.get('size'):
+            props['font_size'] = style['size']
+        if style.get('color'):
+            props['font_color'] = '#' + style['color']
+        if style.get('fill'):
+            props.update(pattern=1, bg_color='#' + style['fill'])
+        if style.get('align'):
+            props.update(align=style['align'], valign='vcenter')
+        if style.get('border'):
+            props['border'] = 1
+        formats[name] = wb.add_format(props)
+
+    try:
+        for sheet in sheets:
+            ws = wb.add_worksheet(sheet['title'])
+            for col, width in enumerate(sheet['widths']):
+                ws.set_column(col, col, width)
+            merged = {(first_row, first_col): (first_row, first_col, last_row, last_col)
+                      for first_row, first_col, last_row, last_col in sheet['merged']}
+            for r, row in enumerate(sheet['rows']):
+                for c, (value, style) in enumerate(row):
+                    fmt = formats.get(style)
+                    if (r, c) in merged:
+                        ws.merge_range(*merged[(r, c)], value, fmt)
+                    else:
+                        ws.write(r, c, value, fmt)
+            cell_format = formats['cell']
+            for r, values in enumerate(_sheet_data_rows(sheet), len(sheet['rows'])):
+                ws.write_row(r, 0, values, cell_format)
+    finally:
+        wb.close()
+
+# Движки записи Excel: имя -> функция (листы, путь). 'xlsxwriter' быстрее и с постоянной
+# памятью, 'openpyxl' - основная зависимость скрипта
+EXCEL_WRITERS = {
+    'openpyxl': write_xlsx_openpyxl,
+    'xlsxwriter': write_xlsx_xlsxwriter,
+}
+
+def excel_engine(engine: str, rows: int) -> str:
+    """Движок записи: 'auto' (и None - EXCEL_ENGINE) - xlsxwriter, если он установлен
+    и строк данных не меньше EXCEL_FAST_MIN_ROWS, иначе openpyxl"""
+    engine = engine or EXCEL_ENGINE
+    if engine == 'auto':
+        engine = 'openpyxl'
+        if rows >= EXCEL_FAST_MIN_ROWS:
+            try:
+                import xlsxwriter  # noqa: F401
+                engine = 'xlsxwriter'
+            except ImportError:
+                pass
+    return engine
+
+def export_to_excel(results, out_file: Path, mos_df, inv_df, engine: str = None, detail: str = None):
+    """
+    Создает Excel файл по таблице результатов (см. categorize_and_prepare): листы
+    описывает excel_sheets (detail - 'categories' или 'full', по умолчанию EXCEL_DETAIL),
+    записывает движок engine - 'openpyxl', 'xlsxwriter' или 'auto' (по умолчанию EXCEL_ENGINE)
+    """
+    detail = detail or EXCEL_DETAIL
+    rows = len(results) + (len(mos_df) + len(inv_df) if detail == 'full' else 0)
+    engine = excel_engine(engine, rows)
+    print(f"Создание Excel файла ({engine}, {detail}): {out_file}")
+    EXCEL_WRITERS[engine](excel_sheets(results, mos_df, inv_df, detail), out_file)
     print(f"Excel файл успешно создан: {out_file}")
 
+# -------------------------
+# Машиночитаемые выгрузки (parquet / csv / jsonl)
+# -------------------------
+def results_table(results) -> pd.DataFrame:
+    """
+    Таблица результатов в схеме RESULTS_SCHEMA: поля стороны, которой нет у записи,
+    пустые; {side}_status_group - код группы из STATUS_GROUPS; URL '#' (нет ключа) - пустой.
+    """
+    table = {'category': results['category'], 'is_bug': results['is_bug']}
+    for side, absent in (('mos', 'inv_only'), ('inv', 'mos_only')):
+        present = results['category'] != absent
+        url = results[f'{side}_url']
+        columns = {
+            f'{side}_id': results[f'{side}_id'],
+            f'{side}_title': results[f'{side}_title'],
+            f'{side}_sprint_no': results[f'{side}_sprint_no'],
+            f'{side}_sprint': results[f'{side}_sprint'],
+            f'{side}_status': results[f'{side}_status'],
+            f'{side}_status_group': status_groups(results[f'{side}_status']),
+            f'{side}_url': url.where(url != "#"),
+        }
+        table.update({name: column.where(present) for name, column in columns.items()})
+    return pd.DataFrame(table)[list(RESULTS_SCHEMA)].astype(RESULTS_SCHEMA)
+
+def summary_table(results) -> pd.DataFrame:
+    """Счетчики сводки в схеме SUMMARY_SCHEMA: строки (metric, key, count), metric -
+    'category', 'bugs' (по категориям), 'status_group' или 'status'"""
+    metrics = {
+        'category': category_counts(results),
+        'bugs': category_counts(results, bugs_only=True),
+        'status_group': status_group_counts(results),
+        'status': status_counts(results),
+    }
+    rows = [(metric, key, count) for metric, counts in metrics.items() for key, count in counts.items()]
+    return pd.DataFrame(rows, columns=list(SUMMARY_SCHEMA)).astype(SUMMARY_SCHEMA)
+
+def write_parquet(table, path: Path):
+    with open_atomic(path, binary=True) as f:
+        table.to_parquet(f, index=False)
+
+def write_csv(table, path: Path):
+    with open_atomic(path, binary=True) as f:
+        table.to_csv(f, index=False, encoding="utf-8")
+
+def write_jsonl(table, path: Path):
+    """JSON Lines порциями по RESULTS_JSONL_CHUNK_ROWS строк: to_json всей таблицы
+    собрал бы весь текст файла в памяти"""
+    with open_atomic(path, binary=True) as f:
+        for start in range(0, len(table), RESULTS_JSONL_CHUNK_ROWS):
+            chunk = table.iloc[start:start + RESULTS_JSONL_CHUNK_ROWS]
+            f.write(chunk.to_json(orient="records", lines=True, force_ascii=False).encode("utf-8"))
+
+RESULTS_WRITERS = {
+    'parquet': write_parquet,
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
+
+def export_results(results, out_dir: Path, formats=None):
+    """
+    Записывает в out_dir таблицы results и summary (см. results_table, summary_table)
+    в форматах formats (по умолчанию RESULTS_FORMATS) и манифест RESULTS_MANIFEST.
+    Файлы форматов, которые в этот раз не пишутся, удаляются.
+    """
+    formats = list(formats or RESULTS_FORMATS)
+    if 'parquet' in formats:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("  ⚠️ pyarrow не установлен - выгрузка в parquet пропущена")
+            formats.remove('parquet')
+    print(f"Выгрузка результатов ({', '.join(formats)}): {out_dir}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tables = {
+        'results': (results_table(results), RESULTS_SCHEMA),
+        'summary': (summary_table(results), SUMMARY_SCHEMA),
+    }
+    files = {}
+    for name, (table, _schema) in tables.items():
+        for fmt in RESULTS_WRITERS:
+            path = out_dir / f"{name}.{fmt}"
+            if fmt in formats:
+                RESULTS_WRITERS[fmt](table, path)
+                files.setdefault(name, []).append(path.name)
+            else:
+                path.unlink(missing_ok=True)
+
+    manifest = {
+        'schema_version': RESULTS_SCHEMA_VERSION,
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'records': len(results),
+        'tables': {name: {'files': files.get(name, []), 'columns': schema}
+                   for name, (_table, schema) in tables.items()},
+    }
+    with open_atomic(out_dir / RESULTS_MANIFEST) as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"Выгрузка результатов завершена: {out_dir}")
+
 # -------------------------
 # HTML генерация с разделением на свимлайны и статусами
 # -------------------------
-def generate_html(categorized, out_file: Path, mos_df, inv_df):
-    # собрать все спринты и отсортировать по номеру
-    sprint_set = set()
-    for cat in categorized.values():
-        for it in cat:
-            for k, v in it.items():
-                if 'sprint' in k and v:
-                    sprint_set.add(v)
+@contextlib.contextmanager
+def open_atomic(path: Path, buffering: int = -1, binary: bool = False):
+    """Открыть файл на запись (текстовый utf-8 или, при binary, двоичный) через временный
+    файл рядом с ним: path заменяется только после успешной записи, при ошибке временный
+    файл удаляется"""
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        with (open(tmp, "wb", buffering=buffering) if binary
+              else open(tmp, "w", encoding="utf-8", buffering=buffering)) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def html_mode(mode: str, records: int) -> str:
+    """Режим HTML для отчета из records записей: 'auto' (и None - HTML_MODE) раскрывается"""
+    mode = mode or HTML_MODE
+    if mode == 'auto':
+        mode = 'compact' if records >= HTML_DATA_MIN_RECORDS else 'cards'
+    return mode
+
+def report_sprints(results) -> list:
+    """Номера спринтов отчета по возрастанию ('Нет спринта' - последним), не пустой список"""
+    sprints = sprint_order(pd.concat([results['mos_sprint_no'], results['inv_sprint_no']]).dropna())
     # гарантируем 'Нет спринта' если пусто
-    if not sprint_set:
-        sprint_set.add("Нет спринта")
+    return sprints or [NO_SPRINT_NUMBER]
 
-    def sprint_key(s):
-        m = re.search(r'(\d+)', s)
-        return int(m.group(1)) if m else 9999
+def generate_html(results, out_file: Path, mos_df, inv_df, mode: str = None, layout: str = None):
+    """Записать HTML отчет потоком (по разделам, через буфер) с атомарной заменой out_file.
+    mode - 'cards', 'data', 'compact' или 'auto' (по умолчанию HTML_MODE);
+    layout - 'single', 'sharded' или 'auto' (по умолчанию HTML_LAYOUT)"""
+    layout = layout or HTML_LAYOUT
+    if layout == 'auto':
+        layout = 'sharded' if len(report_sprints(results)) >= HTML_SHARD_MIN_SPRINTS else 'single'
+    if layout == 'sharded':
+        generate_html_shards(results, out_file, mos_df, inv_df, mode)
+        return
+    mode = html_mode(mode, len(results))
+    with open_atomic(out_file, buffering=HTML_WRITE_BUFFER) as f:
+        write_html(f.write, results, mos_df, inv_df, mode)
+    print(f"Saved HTML ({mode}):", str(out_file))
 
-    sorted_sprints = sorted(list(sprint_set), key=sprint_key)
+def shard_page_name(sprints) -> str:
+    """Имя файла страницы для спринтов sprints (номера по возрастанию)"""
+    slugs = ['none' if sp == NO_SPRINT_NUMBER else str(sp) for sp in (sprints[0], sprints[-1])]
+    if len(sprints) == 1:
+        return f"sprint_{slugs[0]}.html"
+    return f"sprints_{slugs[0]}-{slugs[1]}.html"
 
-    # Подсчет статистики
-    total_tasks = 0
-    total_bugs = 0
-    status_colors = {
-        'готово': '#2f9e44',
-        'закрыт': '#2f9e44',
-        'выполнено': '#2f9e44',
-        'done': '#2f9e44',
-        'closed': '#2f9e44',
-        'resolved': '#2f9e44',
-        'в работе': '#e6b000',
-        'в прогрессе': '#e6b000',
-        'открыт': '#1e6fe0',
-        'новая': '#1e6fe0',
-        'to do': '#1e6fe0',
-        'open': '#1e6fe0',
-        'отложен': '#6b7280',
-        'отклонен': '#dc2626',
-        'rejected': '#dc2626'
+def shard_fingerprint(rows, sprints, mode: str, index_href: str) -> str:
+    """Отпечаток содержимого страницы: записи, её спринты, режим и версия шаблона"""
+    h = hashlib.sha1(json.dumps([HTML_TEMPLATE_VERSION, mode, index_href, [int(sp) for sp in sprints]]).encode())
+    h.update(pd.util.hash_pandas_object(rows[RESULT_COLUMNS], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def load_shard_manifest(manifest_path: Path) -> dict:
+    """Отпечатки записанных страниц {имя файла: отпечаток}; битый/нет файла - пусто"""
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def generate_html_shards(results, out_file: Path, mos_df, inv_df, mode: str = None):
+    """
+    Отчет по частям: в out_file - легкий индекс со сводкой и списком спринтов, в папке
+    HTML_SHARD_DIR_NAME рядом - страница на каждые HTML_SHARD_SPRINTS спринтов с записями,
+    у которых хотя бы одна сторона в этих спринтах. Режим выбирается для каждой страницы
+    по её числу записей. Страница с тем же отпечатком (shard_fingerprint) не перезаписывается,
+    страницы пропавших спринтов удаляются.
+    """
+    shard_dir = out_file.parent / HTML_SHARD_DIR_NAME
+    shard_dir.mkdir(exist_ok=True)
+    manifest_path = shard_dir / HTML_SHARD_MANIFEST
+    previous = load_shard_manifest(manifest_path)
+    index_href = f"../{out_file.name}"
+
+    sorted_sprints = report_sprints(results)
+    mos_sprints = results['mos_sprint_no']
+    inv_sprints = results['inv_sprint_no']
+    manifest = {}
+    pages = []
+    written = 0
+    for start in range(0, len(sorted_sprints), HTML_SHARD_SPRINTS):
+        page_sprints = sorted_sprints[start:start + HTML_SHARD_SPRINTS]
+        rows = results[(mos_sprints.isin(page_sprints) | inv_sprints.isin(page_sprints)).to_numpy(dtype=bool)]
+        name = shard_page_name(page_sprints)
+        page_mode = html_mode(mode, len(rows))
+        manifest[name] = shard_fingerprint(rows, page_sprints, page_mode, index_href)
+        pages.append((f"{HTML_SHARD_DIR_NAME}/{name}", page_sprints, rows))
+        if previous.get(name) == manifest[name] and (shard_dir / name).exists():
+            continue
+        with open_atomic(shard_dir / name, buffering=HTML_WRITE_BUFFER) as f:
+            write_html(f.write, rows, mos_df, inv_df, page_mode, sprints=page_sprints, index_href=index_href)
+        written += 1
+
+    for stale in previous.keys() - manifest.keys():
+        (shard_dir / stale).unlink(missing_ok=True)
+    with open_atomic(manifest_path) as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    with open_atomic(out_file, buffering=HTML_WRITE_BUFFER) as f:
+        write_html_index(f.write, results, pages)
+    print("Saved HTML index:", str(out_file))
+    print(f"  Страниц по спринтам: {len(pages)} (записано {written}, без изменений {len(pages) - written}) в {shard_dir}")
+
+def write_html_index(write, results, pages):
+    """Индекс разбитого по спринтам отчета: сводка и таблица страниц
+    pages - [(href, номера спринтов, записи страницы)]"""
+    counts = category_counts(results)
+    total_bugs = int(results['is_bug'].sum())
+    write("<!doctype html><html><head><meta charset='utf-8'><title>Сравнение ДИТ ↔ Invaders</title>")
+    write("""
+    <style>
+    body{font-family:Inter, Arial, sans-serif;background:#f6f7fb;margin:0;padding:24px}
+    .container{max-width:1300px;margin:0 auto;background:#fff;padding:18px;border-radius:8px;box-shadow:0 6px 18px rgba(20,20,50,0.06)}
+    h1{font-size:18px;margin:0 0 12px}
+    table{width:100%;border-collapse:collapse;font-size:13px}
+    th{background:#0f1724;color:#fff;padding:8px;font-weight:600;text-align:left}
+    td{border:1px solid #e6e9ef;padding:6px 8px}
+    td.num{text-align:right}
+    .export-section{margin:16px 0;padding:12px;background:#f8fafc;border-radius:6px;border:1px solid #e6e9ef}
+    .export-info{font-size:13px;color:#4b5563;margin-top:8px}
+    </style>
+    """)
+    write("</head><body><div class='container'><h1>Сравнение ДИТ ↔ Invaders</h1>")
+    write("<div class='export-section'>")
+    write(f"<strong>Сводка</strong> <a href='{html.escape(EXCEL_NAME)}'>Скачать Excel отчет</a>")
+    write("<div class='export-info'>")
+    write(f"• Отчет содержит {counts['match']} совпадений, {counts['diff_sprint']} задач с разными спринтами<br>")
+    write(f"• Только в ДИТ: {counts['mos_only']} задач<br>")
+    write(f"• Только в Invaders: {counts['inv_only']} задач<br>")
+    write(f"• Задачи: {len(results) - total_bugs}, Баги: {total_bugs}<br>")
+    write("• Задача с разными спринтами есть на страницах обоих спринтов")
+    write("</div>")
+    write("</div>")
+
+    write("<table><thead><tr><th>Спринт</th><th>Совпадения</th><th>Разные спринты</th>"
+          "<th>Только ДИТ</th><th>Только Invaders</th><th>Баги</th></tr></thead><tbody>")
+    for href, sprints, rows in pages:
+        label = sprint_label(sprints[0])
+        if len(sprints) > 1:
+            label += f" — {sprint_label(sprints[-1])}"
+        page_counts = category_counts(rows)
+        write(f"<tr><td><a href='{html.escape(href)}'>{html.escape(label)}</a></td>")
+        for category in CATEGORIES:
+            write(f"<td class='num'>{page_counts[category]}</td>")
+        write(f"<td class='num'>{int(rows['is_bug'].sum())}</td></tr>")
+    write("</tbody></table>")
+    write("</div></body></html>")
+
+def _script_json(value) -> str:
+    """JSON для вставки внутрь <script>: '<' экранируется, чтобы не закрыть тег"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('<', '\\u003c')
+
+def payload_json(payload):
+    """Куски JSON-объекта payload (по ключу), готовые для вставки внутрь <script>"""
+    yield '{'
+    for i, (key, value) in enumerate(payload.items()):
+        yield f"{',' if i else ''}{_script_json(key)}:{_script_json(value)}"
+    yield '}'
+
+def compress_payload(payload) -> str:
+    """JSON payload, сжатый gzip и закодированный base64 (данные режима 'compact').
+    Сжимается по ключам, целиком JSON в памяти не собирается"""
+    compressor = zlib.compressobj(HTML_COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # формат gzip
+    chunks = [compressor.compress(part.encode('utf-8')) for part in payload_json(payload)]
+    chunks.append(compressor.flush())
+    return base64.b64encode(b''.join(chunks)).decode('ascii')
+
+def _json_list(col: pd.Series) -> list:
+    """Значения колонки списком, пустые - None (null в JSON)"""
+    return col.astype(object).where(col.notna(), None).tolist()
+
+def _as_text(col: pd.Series) -> pd.Series:
+    """Непустые значения колонки строкой, как в карточках (ключи бывают числами)"""
+    return col.astype(object).where(col.isna(), col.astype(str))
+
+def html_payload(results, sorted_sprints) -> dict:
+    """
+    Данные HTML отчета в режиме 'data': колонки записей списками одной длины.
+    category - индекс в CATEGORIES, bug - 0/1; по сторонам: {side}_id, _title,
+    _sprint (индекс в sprints), _status (индекс в statuses, -1 - не показывать)
+    и _url (путь после base_urls[side], 0 - путь совпадает с _id, null - нет ссылки).
+    Отсутствующая сторона - null/-1.
+    search_terms/search_postings - индекс для фильтра по задаче (search_index), search_ngram -
+    длина его терминов; только от SEARCH_INDEX_MIN_ROWS записей.
+    """
+    sprint_codes = {sp: code for code, sp in enumerate(sorted_sprints)}
+    statuses = pd.concat([results['mos_status'], results['inv_status']]).dropna()
+    shown = [status for status in statuses.unique().tolist() if status and status != UNKNOWN_STATUS]
+    status_codes = {status: code for code, status in enumerate(shown)}
+    base_urls = {'mos': MOS_BASE_URL, 'inv': INV_BASE_URL}
+
+    payload = {
+        'sprints': [sprint_label(sp) for sp in sorted_sprints],
+        'statuses': shown,
+        'status_classes': [f'status-{status_group(status)}' for status in shown],
+        'base_urls': base_urls,
+        'category': pd.Categorical(results['category'], categories=CATEGORIES).codes.tolist(),
+        'bug': results['is_bug'].astype(int).tolist(),
     }
-    
-    for cat in categorized.values():
-        for it in cat:
-            total_tasks += 1
-            if it.get('is_bug', False):
-                total_bugs += 1
+    for side in ('mos', 'inv'):
+        ids = _as_text(results[f'{side}_id'])
+        paths = results[f'{side}_url'].str.slice(len(base_urls[side]))
+        paths = paths.where(results[f'{side}_url'] != '#').astype(object)
+        payload[f'{side}_id'] = _json_list(ids)
+        payload[f'{side}_title'] = _json_list(_as_text(results[f'{side}_title']))
+        payload[f'{side}_sprint'] = results[f'{side}_sprint_no'].map(sprint_codes).fillna(-1).astype(int).tolist()
+        payload[f'{side}_status'] = results[f'{side}_status'].map(status_codes).fillna(-1).astype(int).tolist()
+        payload[f'{side}_url'] = _json_list(paths.mask(paths == ids, 0))
+    if len(results) >= SEARCH_INDEX_MIN_ROWS:
+        payload['search_terms'], payload['search_postings'] = search_index(results)
+        payload['search_ngram'] = SEARCH_NGRAM
+    return payload
+
+# Фильтр по задаче в режиме 'data' ищет подстроку в ID и темах. Индекс - триграммы символов
+# этих полей: подстроку могут содержать только записи со всеми триграммами запроса.
+# Индекс занимает около половины данных отчета, а проверка всех записей в браузере
+# укладывается в ~0.1 с до SEARCH_INDEX_MIN_ROWS записей, поэтому меньшие отчеты - без индекса
+SEARCH_NGRAM = 3
+SEARCH_INDEX_MIN_ROWS = 100_000
+SEARCH_FIELDS = ('mos_id', 'inv_id', 'mos_title', 'inv_title')
+
+def search_index(results):
+    """
+    Поисковый индекс записей для фильтра по задаче в режиме 'data': термины - n-граммы
+    символов (SEARCH_NGRAM) полей SEARCH_FIELDS в верхнем регистре. Возвращает
+    (terms, postings): terms отсортированы, postings[i] - номера записей с terms[i]
+    через запятую, разностями от предыдущего номера.
+    """
+    texts, records = [], []
+    for col in SEARCH_FIELDS:
+        values = results[col].to_numpy(dtype=object)
+        present = pd.notna(values)
+        texts += [str(value).upper() for value in values[present]]
+        records.append(np.flatnonzero(present))
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    windows = np.maximum(lengths - (SEARCH_NGRAM - 1), 0)
+    total = int(windows.sum())
+    if not total:
+        return [], []
+
+    # код n-граммы - коды ее символов (по 21 бит) подряд в одном uint64
+    chars = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    skipped = np.cumsum(lengths - windows) - (lengths - windows)
+    first = np.repeat(skipped, windows) + np.arange(total)
+    codes = np.zeros(total, dtype=np.uint64)
+    for k in range(SEARCH_NGRAM):
+        codes = (codes << np.uint64(21)) | chars[first + k]
+
+    # пары (термин, запись) сортируются одним ключом: ранг термина * n + номер записи
+    n = len(results)
+    term_codes, terms = pd.factorize(codes)
+    order = np.argsort(terms)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    keys = np.sort(rank[term_codes] * n + np.repeat(np.concatenate(records), windows))
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    term_ranks, records = np.divmod(keys, n)
+
+    starts = np.flatnonzero(np.r_[True, term_ranks[1:] != term_ranks[:-1]])
+    deltas = np.diff(records, prepend=0)
+    deltas[starts] = records[starts]
+    deltas = list(map(str, deltas.tolist()))
+    postings = [','.join(deltas[a:b]) for a, b in zip(starts.tolist(), starts[1:].tolist() + [len(deltas)])]
+    mask = (1 << 21) - 1
+    terms = [''.join(chr(code >> 21 * k & mask) for k in reversed(range(SEARCH_NGRAM)))
+             for code in terms[order].tolist()]
+    return terms, postings
+
+def write_html(write, results, mos_df, inv_df, mode: str = 'cards', sprints=None, index_href: str = None):
+    """HTML отчет по таблице результатов; write(str) - куда писать текст.
+    mode 'cards' - карточки в разметке, 'data' - JSON-данные и скрипт отрисовки,
+    'compact' - то же со сжатыми данными.
+    sprints - номера спринтов-колонок (по умолчанию все спринты results), index_href -
+    ссылка на индекс для страницы разбитого по спринтам отчета"""
+    # номера всех спринтов по возрастанию ('Нет спринта' - последним)
+    sorted_sprints = list(sprints) if sprints is not None else report_sprints(results)
+
+    # Подсчет статистики
+    total_tasks = len(results)
+    total_bugs = int(results['is_bug'].sum())
+    counts = category_counts(results)
     total_regular = total_tasks - total_bugs
 
     # CSS + JS (приближённый к твоему образцу)
@@ -837,34 +1989,37 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
     .swimlane-collapsed .swimlane-content{display:none}
     .bug-indicator{display:inline-block;background:#fef2f2;color:#dc2626;padding:2px 6px;border-radius:4px;font-size:11px;margin-left:6px;font-weight:600}
     .bug-task{border-left-color:#dc2626 !important}
-    .status-ready{background:#2f9e44;color:white}
-    .status-inprogress{background:#e6b000;color:white}
-    .status-open{background:#1e6fe0;color:white}
-    .status-other{background:#6b7280;color:white}
-    .status-rejected{background:#dc2626;color:white}
     </style>
     """
 
     js = """
     <script>
-    let originalTableHTML = {tasks: '', bugs: ''};
-    let allSprints = [];
+    let sprintColumns = {};  // код спринта -> заголовки и ячейки его колонок
     let currentFilteredSprint = '';
     
     document.addEventListener('DOMContentLoaded', function() {
-        // Сохраняем оригинальные таблицы и список спринтов
-        const tasksTable = document.querySelector('#tasks-swinlane table');
-        const bugsTable = document.querySelector('#bugs-swinlane table');
-        if (tasksTable) originalTableHTML.tasks = tasksTable.outerHTML;
-        if (bugsTable) originalTableHTML.bugs = bugsTable.outerHTML;
-        
-        const sprintSelect = document.getElementById('sprintFilter');
-        allSprints = Array.from(sprintSelect.options).map(opt => opt.value).filter(val => val);
+        // Колонки спринтов помечены data-sprint при генерации: собираем их один раз
+        document.querySelectorAll('.swimlane table').forEach(table => {
+            Array.from(table.rows).forEach(row => {
+                Array.from(row.cells).forEach(cell => {
+                    const sprint = cell.dataset.sprint;
+                    (sprintColumns[sprint] = sprintColumns[sprint] || []).push(cell);
+                });
+            });
+        });
         
         // Инициализируем свимлайны
         initSwimlanes();
     });
     
+    // Показать колонки выбранного спринта (или все) - переключение класса, без перестроения таблиц
+    function applySprintFilter() {
+        Object.keys(sprintColumns).forEach(sprint => {
+            const hidden = currentFilteredSprint !== '' && sprint !== currentFilteredSprint;
+            sprintColumns[sprint].forEach(cell => cell.classList.toggle('sprint-hidden', hidden));
+        });
+    }
+    
     function initSwimlanes() {
         const swimlaneHeaders = document.querySelectorAll('.swimlane-header');
         swimlaneHeaders.forEach(header => {
@@ -902,25 +2057,9 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
     }
     
     function showAll(){
-        // Восстанавливаем оригинальные таблицы
-        const tasksSwimlane = document.getElementById('tasks-swinlane');
-        const bugsSwimlane = document.getElementById('bugs-swinlane');
-        
-        if (tasksSwimlane && originalTableHTML.tasks) {
-            const tableContainer = tasksSwimlane.querySelector('.table-container');
-            if (tableContainer) {
-                tableContainer.innerHTML = originalTableHTML.tasks;
-            }
-        }
-        
-        if (bugsSwimlane && originalTableHTML.bugs) {
-            const tableContainer = bugsSwimlane.querySelector('.table-container');
-            if (tableContainer) {
-                tableContainer.innerHTML = originalTableHTML.bugs;
-            }
-        }
-        
+        // Показываем все спринты
         currentFilteredSprint = '';
+        applySprintFilter();
         
         // Сбрасываем выпадающий список
         const sprintSelect = document.getElementById('sprintFilter');
@@ -929,6 +2068,9 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
         }
         
         // Показываем все задачи
+        document.querySelectorAll('.task').forEach(task => {
+            task.classList.remove('task-hidden');
+        });
         ['match','diff','mos-only','inv-only'].forEach(c => {
             document.querySelectorAll('.' + c).forEach(e => e.style.display = '');
         });
@@ -981,112 +2123,7 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
         }
         
         currentFilteredSprint = selectedSprint;
-        
-        // Фильтруем обе таблицы (задачи и баги)
-        ['tasks-swinlane', 'bugs-swinlane'].forEach(swimlaneId => {
-            const swimlane = document.getElementById(swimlaneId);
-            if (!swimlane) return;
-            
-            const tableContainer = swimlane.querySelector('.table-container');
-            const table = swimlane.querySelector('table');
-            
-            if (!table) {
-                console.error('Table not found in', swimlaneId);
-                return;
-            }
-            
-            // Получаем оригинальную таблицу для этого свимлайна
-            const originalHTML = swimlaneId === 'tasks-swinlane' ? originalTableHTML.tasks : originalTableHTML.bugs;
-            
-            // Создаем новую таблицу только с выбранным спринтом
-            const newTable = document.createElement('table');
-            
-            // Создаем заголовки для выбранного спринта
-            const thead = document.createElement('thead');
-            
-            // Первая строка заголовков
-            const headerRow1 = document.createElement('tr');
-            const headerCell1 = document.createElement('th');
-            headerCell1.colSpan = 2;
-            headerCell1.textContent = selectedSprint;
-            headerRow1.appendChild(headerCell1);
-            thead.appendChild(headerRow1);
-            
-            // Вторая строка заголовков
-            const headerRow2 = document.createElement('tr');
-            const headerCellDit = document.createElement('th');
-            headerCellDit.className = 'col-head';
-            headerCellDit.textContent = 'ДИТ';
-            headerRow2.appendChild(headerCellDit);
-            
-            const headerCellInv = document.createElement('th');
-            headerCellInv.className = 'col-head';
-            headerCellInv.textContent = 'Invaders';
-            headerRow2.appendChild(headerCellInv);
-            thead.appendChild(headerRow2);
-            
-            newTable.appendChild(thead);
-            
-            // Создаем тело таблицы
-            const tbody = document.createElement('tbody');
-            const bodyRow = document.createElement('tr');
-            
-            // Колонка ДИТ
-            const ditCell = document.createElement('td');
-            
-            // Находим индекс спринта в оригинальной таблице
-            const originalTable = document.createElement('div');
-            originalTable.innerHTML = originalHTML;
-            const originalSprintHeaders = originalTable.querySelectorAll('th[colspan="2"]');
-            let sprintIndex = -1;
-            
-            for (let i = 0; i < originalSprintHeaders.length; i++) {
-                if (originalSprintHeaders[i].textContent.trim() === selectedSprint) {
-                    sprintIndex = i;
-                    break;
-                }
-            }
-            
-            if (sprintIndex !== -1) {
-                // Получаем все задачи из оригинальной таблицы для этого спринта
-                const originalTds = originalTable.querySelectorAll('td');
-                const ditCellIndex = sprintIndex * 2;
-                
-                if (ditCellIndex < originalTds.length) {
-                    // Копируем содержимое колонки ДИТ
-                    ditCell.innerHTML = originalTds[ditCellIndex].innerHTML;
-                }
-            }
-            
-            bodyRow.appendChild(ditCell);
-            
-            // Колонка Invaders
-            const invCell = document.createElement('td');
-            
-            if (sprintIndex !== -1) {
-                const originalTds = originalTable.querySelectorAll('td');
-                const invCellIndex = sprintIndex * 2 + 1;
-                
-                if (invCellIndex < originalTds.length) {
-                    // Копируем содержимое колонки Invaders
-                    invCell.innerHTML = originalTds[invCellIndex].innerHTML;
-                }
-            }
-            
-            bodyRow.appendChild(invCell);
-            tbody.appendChild(bodyRow);
-            newTable.appendChild(tbody);
-            
-            // Заменяем таблицу
-            tableContainer.innerHTML = '';
-            tableContainer.appendChild(newTable);
-        });
-        
-        // Применяем текущий фильтр по задаче, если он есть
-        const filterInput = document.getElementById('taskFilter');
-        if (filterInput && filterInput.value.trim()) {
-            filterByTask();
-        }
+        applySprintFilter();
     }
     
     // Очистка фильтра по спринту
@@ -1094,33 +2131,16 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
         const sprintSelect = document.getElementById('sprintFilter');
         sprintSelect.value = '';
         currentFilteredSprint = '';
-        
-        // Восстанавливаем оригинальные таблицы
-        showAll();
-        
-        // Применяем текущий фильтр по задаче, если он есть
-        const filterInput = document.getElementById('taskFilter');
-        if (filterInput && filterInput.value.trim()) {
-            filterByTask();
-        }
+        applySprintFilter();
     }
     
     // Очистка фильтра по задаче
     function clearFilter() {
         const filterInput = document.getElementById('taskFilter');
         filterInput.value = '';
-        
-        if (currentFilteredSprint) {
-            // Если есть фильтр по спринту, пересоздаем таблицу
-            const sprintSelect = document.getElementById('sprintFilter');
-            sprintSelect.value = currentFilteredSprint;
-            filterBySprint();
-        } else {
-            // Иначе показываем все задачи
-            document.querySelectorAll('.task').forEach(task => {
-                task.classList.remove('task-hidden');
-            });
-        }
+        document.querySelectorAll('.task').forEach(task => {
+            task.classList.remove('task-hidden');
+        });
     }
     
     // Очистка всех фильтров
@@ -1138,328 +2158,580 @@ def generate_html(categorized, out_file: Path, mos_df, inv_df):
     </script>
     """
 
-    # Функция для получения CSS класса статуса
-    def get_status_class(status_str):
-        if not status_str:
-            return 'status-other'
-        
-        status_lower = status_str.lower()
-        
-        if any(word in status_lower for word in ['готово', 'закрыт', 'выполнено', 'done', 'closed', 'resolved']):
-            return 'status-ready'
-        elif any(word in status_lower for word in ['в работе', 'в прогрессе', 'in progress', 'progress']):
-            return 'status-inprogress'
-        elif any(word in status_lower for word in ['открыт', 'новая', 'to do', 'open', 'new']):
-            return 'status-open'
-        elif any(word in status_lower for word in ['отклонен', 'rejected', 'declined']):
-            return 'status-rejected'
-        elif any(word in status_lower for word in ['отложен', 'отложено', 'отложена']):
-            return 'status-other'
-        else:
-            return 'status-other'
-
-    # Собираем HTML
-    html_parts = []
-    html_parts.append("<!doctype html><html><head><meta charset='utf-8'><title>Сравнение ДИТ ↔ Invaders</title>")
-    html_parts.append(css)
-    html_parts.append("</head><body><div class='container'><h1>Сравнение ДИТ ↔ Invaders</h1>")
-    html_parts.append("<div class='controls'>")
-    html_parts.append("<button class='btn' onclick='expandAllSwimlanes()'>Развернуть все</button>")
-    html_parts.append("<button class='btn' onclick='collapseAllSwimlanes()'>Свернуть все</button>")
-    html_parts.append("<button class='btn' onclick='showAll()'>Показать всё</button>")
-    html_parts.append("<button class='btn' onclick='hideAll()'>Скрыть всё</button>")
-    html_parts.append("<button class='btn' onclick=\"toggleClass('match')\">Toggle совпадения</button>")
-    html_parts.append("<button class='btn' onclick=\"toggleClass('diff')\">Toggle разные спринты</button>")
-    html_parts.append("<button class='btn' onclick=\"toggleClass('mos-only')\">Toggle только ДИТ</button>")
-    html_parts.append("<button class='btn' onclick=\"toggleClass('inv-only')\">Toggle только Invaders</button>")
+    # Режим 'data': таблицы строит скрипт по данным из #report-data. В ячейке спринта
+    # прокручиваемый блок высотой с все карточки, но в DOM только видимые карточки
+    css_data = """
+    <style>
+    .vcell{position:relative;height:320px;overflow-y:auto;min-width:220px}
+    .vcell-spacer{position:relative}
+    .vcell .task{position:absolute;left:0;right:4px;height:76px;box-sizing:border-box;overflow:hidden;margin:0}
+    .vcell .task .title{white-space:nowrap;overflow:hidden;text-overflow:ellipsis}
+    </style>
+    """
+
+    js_data = """
+    <script>
+    let REPORT = null;  // данные #report-data, загружаются loadReport()
+    const CARD_HEIGHT = 84;  // высота карточки с отступом, px
+    const OVERSCAN = 3;      // сколько карточек рисовать сверх видимых сверху и снизу
+    const CATEGORY_CLASSES = ['match', 'diff', 'mos-only', 'inv-only'];
+    const SIDES = ['mos', 'inv'];
+    const SIDE_NAMES = {mos: 'MOS', inv: 'INV'};
+    const SIDE_CATEGORIES = {mos: [0, 1, 2], inv: [0, 1, 3]};
+    const LANES = [{id: 'tasks-swinlane', bug: 0}, {id: 'bugs-swinlane', bug: 1}];
+    const ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'};
+
+    let hiddenCategories = new Set();
+    let taskFilterValue = '';
+    let currentFilteredSprint = -1;  // код спринта, -1 - все спринты
+    let cells = [];
+    let sprintColumns = [];  // код спринта -> заголовки и ячейки его колонок
+
+    document.addEventListener('DOMContentLoaded', () => {
+        loadReport().then(data => {
+            REPORT = data;
+            buildTables();
+        }).catch(err => {
+            document.querySelectorAll('.table-container').forEach(container => {
+                container.textContent = 'Не удалось прочитать данные отчета: ' + err.message;
+            });
+        });
+    });
+
+    // JSON из #report-data; при data-encoding='gzip' - base64 сжатого gzip JSON
+    async function loadReport() {
+        const el = document.getElementById('report-data');
+        if (el.dataset.encoding !== 'gzip') return JSON.parse(el.textContent);
+        if (typeof DecompressionStream === 'undefined') {
+            throw new Error('браузер не поддерживает DecompressionStream, откройте отчет в свежем Chrome, Firefox или Safari');
+        }
+        const binary = atob(el.textContent);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+        return JSON.parse(await new Response(stream).text());
+    }
+
+    function esc(value) {
+        return String(value).replace(/[&<>"']/g, c => ESCAPES[c]);
+    }
+
+    function taskUrl(side, i) {
+        const path = REPORT[side + '_url'][i];
+        if (path === null) return '#';
+        return REPORT.base_urls[side] + (path === 0 ? REPORT[side + '_id'][i] : path);
+    }
+
+    // Поиск подстроки по индексу n-грамм: проверяются только записи из самого короткого
+    // списка n-грамм запроса (без индекса или запрос короче n-граммы - все записи)
+    const SEARCH_FIELDS = ['mos_id', 'inv_id', 'mos_title', 'inv_title'];
+    const postingsCache = new Map();
+    let termIndex = null;
+
+    function postings(t) {
+        let records = postingsCache.get(t);
+        if (!records) {
+            let record = 0;
+            records = REPORT.search_postings[t].split(',').map(delta => (record += Number(delta)));
+            postingsCache.set(t, records);
+        }
+        return records;
+    }
+
+    // Записи, которые могут содержать запрос (null - все записи)
+    function searchCandidates(chars) {
+        const n = REPORT.search_ngram;
+        if (!n || chars.length < n) return null;
+        if (!termIndex) termIndex = new Map(REPORT.search_terms.map((term, t) => [term, t]));
+        let shortest = null;
+        for (let k = 0; k + n <= chars.length; k++) {
+            const t = termIndex.get(chars.slice(k, k + n).join(''));
+            if (t === undefined) return [];
+            const records = postings(t);
+            if (!shortest || records.length < shortest.length) shortest = records;
+        }
+        return shortest;
+    }
+
+    // Записи, подходящие под фильтр по задаче (null - фильтра нет)
+    function taskMatches() {
+        if (!taskFilterValue) return null;
+        const columns = SEARCH_FIELDS.map(name => REPORT[name]);
+        const matches = new Uint8Array(REPORT.category.length);
+        const check = i => {
+            matches[i] = columns.some(col => col[i] && col[i].toUpperCase().includes(taskFilterValue)) ? 1 : 0;
+        };
+        const candidates = searchCandidates(Array.from(taskFilterValue));
+        if (candidates) candidates.forEach(check);
+        else for (let i = 0; i < matches.length; i++) check(i);
+        return matches;
+    }
+
+    let taskFilterTimer = null;
+    function scheduleTaskFilter() {
+        clearTimeout(taskFilterTimer);
+        taskFilterTimer = setTimeout(filterByTask, 150);
+    }
+
+    // Индексы записей по ячейкам: lists[баг][спринт][сторона], в порядке категорий
+    function buildCellLists() {
+        const matches = taskMatches();
+        const lists = [0, 1].map(() => REPORT.sprints.map(() => ({mos: [], inv: []})));
+        for (const side of SIDES) {
+            const sprints = REPORT[side + '_sprint'];
+            for (const category of SIDE_CATEGORIES[side]) {
+                if (hiddenCategories.has(category)) continue;
+                for (let i = 0; i < REPORT.category.length; i++) {
+                    // sprints[i] < 0 - спринта записи нет среди колонок страницы
+                    if (REPORT.category[i] !== category || sprints[i] < 0 || (matches && !matches[i])) continue;
+                    lists[REPORT.bug[i]][sprints[i]][side].push(i);
+                }
+            }
+        }
+        return lists;
+    }
+
+    function cardHTML(i, side, top) {
+        const category = REPORT.category[i];
+        const bug = REPORT.bug[i];
+        const other = side === 'mos' ? 'inv' : 'mos';
+        const status = REPORT[side + '_status'][i];
+        const url = taskUrl(side, i);
+        let id = REPORT[side + '_id'][i];
+        if (category === 1) id = id || REPORT[other + '_id'][i];
+
+        let h = `<div class='task ${CATEGORY_CLASSES[category]}${bug ? ' bug-task' : ''}' style='top:${top}px'>`;
+        h += `<div class='id'>${esc(id || '')}${bug ? " <span class='bug-indicator'>БАГ</span>" : ''}`;
+        if (status >= 0) {
+            h += `<span class='status ${REPORT.status_classes[status]}'>${esc(REPORT.statuses[status])}</span>`;
+        }
+        h += '</div>';
+        const own = esc(REPORT[side + '_title'][i] || '');
+        const theirs = esc(REPORT[other + '_title'][i] || '');
+        if (category === 0) {
+            h += `<div class='title'><a href='${esc(url)}' target='_blank'>${own || theirs}</a></div>`;
+        } else if (category === 1) {
+            if (url !== '#') {
+                h += `<div class='title'>${SIDE_NAMES[side]}: <a href='${esc(url)}' target='_blank'>${own}</a><br/>`
+                   + `${SIDE_NAMES[other]}: <a href='${esc(taskUrl(other, i))}' target='_blank'>${theirs}</a></div>`;
+            } else {
+                h += `<div class='title'>${SIDE_NAMES[side]}: ${own}<br/>${SIDE_NAMES[other]}: ${theirs}</div>`;
+            }
+        } else if (url !== '#') {
+            h += `<div class='title'><a href='${esc(url)}' target='_blank'>${own}</a></div>`;
+        } else {
+            h += `<div class='title'>${own}</div>`;
+        }
+        return h + '</div>';
+    }
+
+    // Таблицы со всеми спринтами; фильтр по спринту только скрывает колонки
+    function buildTables() {
+        if (!REPORT) return;  // данные еще распаковываются
+        const lists = buildCellLists();
+        const sprints = REPORT.sprints.map((_, k) => k);
+        cells = [];
+        sprintColumns = sprints.map(() => []);
+        for (const lane of LANES) {
+            const container = document.querySelector('#' + lane.id + ' .table-container');
+            let h = '<table><thead><tr>';
+            for (const k of sprints) h += `<th colspan='2' data-sprint='${k}'>${esc(REPORT.sprints[k])}</th>`;
+            h += '</tr><tr>';
+            for (const k of sprints) {
+                h += `<th class='col-head' data-sprint='${k}'>ДИТ</th><th class='col-head' data-sprint='${k}'>Invaders</th>`;
+            }
+            h += '</tr></thead><tbody><tr>';
+            for (const k of sprints) {
+                h += `<td data-sprint='${k}'><div class='vcell'><div class='vcell-spacer'></div></div></td>`.repeat(2);
+            }
+            h += '</tr></tbody></table>';
+            container.innerHTML = h;
+
+            for (const row of container.querySelector('table').rows) {
+                for (const el of row.cells) sprintColumns[Number(el.dataset.sprint)].push(el);
+            }
+            const blocks = container.querySelectorAll('.vcell');
+            let b = 0;
+            for (const k of sprints) {
+                for (const side of SIDES) {
+                    const cell = {el: blocks[b++], side: side, list: lists[lane.bug][k][side], first: -1, last: -1};
+                    cell.el.firstChild.style.height = (cell.list.length * CARD_HEIGHT) + 'px';
+                    cell.el.addEventListener('scroll', () => scheduleRender(cell));
+                    cells.push(cell);
+                }
+            }
+        }
+        applySprintFilter();
+    }
+
+    // Показать колонки выбранного спринта (или все) и дорисовать ставшие видимыми ячейки
+    function applySprintFilter() {
+        sprintColumns.forEach((columns, k) => {
+            const hidden = currentFilteredSprint >= 0 && k !== currentFilteredSprint;
+            columns.forEach(el => el.classList.toggle('sprint-hidden', hidden));
+        });
+        renderAll();
+    }
+
+    // Нарисовать карточки, попадающие в видимую часть ячейки
+    function renderCell(cell) {
+        const height = cell.el.clientHeight;
+        if (!height) return;  // свимлайн свёрнут
+        const top = cell.el.scrollTop;
+        const first = Math.max(0, Math.floor(top / CARD_HEIGHT) - OVERSCAN);
+        const last = Math.min(cell.list.length, Math.ceil((top + height) / CARD_HEIGHT) + OVERSCAN);
+        if (first === cell.first && last === cell.last) return;
+        cell.first = first;
+        cell.last = last;
+        let h = '';
+        for (let j = first; j < last; j++) h += cardHTML(cell.list[j], cell.side, j * CARD_HEIGHT);
+        cell.el.firstChild.innerHTML = h;
+    }
+
+    function scheduleRender(cell) {
+        if (cell.pending) return;
+        cell.pending = true;
+        requestAnimationFrame(() => {
+            cell.pending = false;
+            renderCell(cell);
+        });
+    }
+
+    function renderAll() {
+        cells.forEach(renderCell);
+    }
+
+    function toggleSwimlane(swimlaneId) {
+        const swimlane = document.getElementById(swimlaneId);
+        if (swimlane) {
+            swimlane.classList.toggle('swimlane-collapsed');
+            renderAll();
+        }
+    }
+
+    function expandAllSwimlanes() {
+        document.querySelectorAll('.swimlane').forEach(swimlane => swimlane.classList.remove('swimlane-collapsed'));
+        renderAll();
+    }
+
+    function collapseAllSwimlanes() {
+        document.querySelectorAll('.swimlane').forEach(swimlane => swimlane.classList.add('swimlane-collapsed'));
+    }
+
+    function toggleClass(cls) {
+        const category = CATEGORY_CLASSES.indexOf(cls);
+        if (hiddenCategories.has(category)) hiddenCategories.delete(category);
+        else hiddenCategories.add(category);
+        buildTables();
+    }
+
+    function showAll() {
+        hiddenCategories.clear();
+        currentFilteredSprint = -1;
+        document.getElementById('sprintFilter').value = '';
+        buildTables();
+    }
+
+    function hideAll() {
+        CATEGORY_CLASSES.forEach((_, category) => hiddenCategories.add(category));
+        buildTables();
+    }
+
+    // Функция фильтрации по задаче
+    function filterByTask() {
+        taskFilterValue = document.getElementById('taskFilter').value.trim().toUpperCase();
+        buildTables();
+    }
+
+    // Функция фильтрации по спринту
+    function filterBySprint() {
+        const value = document.getElementById('sprintFilter').value;
+        if (value === '' || Number(value) === currentFilteredSprint) return;
+        currentFilteredSprint = Number(value);
+        applySprintFilter();
+    }
+
+    function clearSprintFilter() {
+        document.getElementById('sprintFilter').value = '';
+        currentFilteredSprint = -1;
+        applySprintFilter();
+    }
+
+    function clearFilter() {
+        document.getElementById('taskFilter').value = '';
+        taskFilterValue = '';
+        buildTables();
+    }
+
+    function clearAllFilters() {
+        document.getElementById('taskFilter').value = '';
+        document.getElementById('sprintFilter').value = '';
+        taskFilterValue = '';
+        currentFilteredSprint = -1;
+        buildTables();
+    }
+
+    function handleFilterKeyPress(event) {
+        if (event.key === 'Enter') {
+            filterByTask();
+        }
+    }
+    </script>
+    """
+
+    # Цвета групп статусов (CSS класс status-<группа>)
+    status_groups_info = status_group_info()
+    status_css = "<style>" + "".join(f".status-{group}{{background:{color};color:white}}"
+                                     for group, (_label, color) in status_groups_info.items()) + "</style>"
+
+    # Пишем HTML
+    write("<!doctype html><html><head><meta charset='utf-8'><title>Сравнение ДИТ ↔ Invaders</title>")
+    write(css)
+    write(status_css)
+    if mode != 'cards':
+        write(css_data)
+    write("</head><body><div class='container'><h1>Сравнение ДИТ ↔ Invaders</h1>")
+    excel_href = EXCEL_NAME
+    if index_href:
+        excel_href = str(PurePosixPath(index_href).parent / EXCEL_NAME)
+        write(f"<div class='small'><a href='{html.escape(index_href)}'>← Все спринты</a></div>")
+    write("<div class='controls'>")
+    write("<button class='btn' onclick='expandAllSwimlanes()'>Развернуть все</button>")
+    write("<button class='btn' onclick='collapseAllSwimlanes()'>Свернуть все</button>")
+    write("<button class='btn' onclick='showAll()'>Показать всё</button>")
+    write("<button class='btn' onclick='hideAll()'>Скрыть всё</button>")
+    write("<button class='btn' onclick=\"toggleClass('match')\">Toggle совпадения</button>")
+    write("<button class='btn' onclick=\"toggleClass('diff')\">Toggle разные спринты</button>")
+    write("<button class='btn' onclick=\"toggleClass('mos-only')\">Toggle только ДИТ</button>")
+    write("<button class='btn' onclick=\"toggleClass('inv-only')\">Toggle только Invaders</button>")
     
     # Кнопка экспорта в Excel
-    html_parts.append("<button class='export-btn' onclick=\"window.location.href='comparison_report.xlsx'\">Скачать Excel отчет</button>")
+    write(f"<button class='export-btn' onclick=\"window.location.href='{html.escape(excel_href)}'\">Скачать Excel отчет</button>")
     
-    html_parts.append("<span class='small'>Фильтры работают визуально</span>")
-    html_parts.append("</div>")
+    write("<span class='small'>Фильтры работают визуально</span>")
+    write("</div>")
     
     # Добавляем фильтр по задаче
-    html_parts.append("<div class='filter-row'>")
-    html_parts.append("<div class='filter-label'>Фильтр по задаче:</div>")
-    html_parts.append("<input type='text' id='taskFilter' class='filter-input' placeholder='Введите номер или название задачи (META-123, MT-456, или текст)' onkeypress='handleFilterKeyPress(event)'>")
-    html_parts.append("<button class='filter-btn' onclick='filterByTask()'>Фильтровать</button>")
-    html_parts.append("<button class='filter-clear' onclick='clearFilter()'>Очистить</button>")
-    html_parts.append("</div>")
+    write("<div class='filter-row'>")
+    write("<div class='filter-label'>Фильтр по задаче:</div>")
+    # в режиме 'data' фильтр по индексу срабатывает по мере ввода
+    as_you_type = " oninput='scheduleTaskFilter()'" if mode != 'cards' else ""
+    write(f"<input type='text' id='taskFilter' class='filter-input' placeholder='Введите номер или название задачи (META-123, MT-456, или текст)' onkeypress='handleFilterKeyPress(event)'{as_you_type}>")
+    write("<button class='filter-btn' onclick='filterByTask()'>Фильтровать</button>")
+    write("<button class='filter-clear' onclick='clearFilter()'>Очистить</button>")
+    write("</div>")
     
     # Добавляем фильтр по спринту
-    html_parts.append("<div class='filter-row'>")
-    html_parts.append("<div class='filter-label'>Фильтр по спринту:</div>")
-    html_parts.append("<select id='sprintFilter' class='filter-select'>")
-    html_parts.append("<option value=''>Все спринты</option>")
-    for sp in sorted_sprints:
-        html_parts.append(f"<option value='{html.escape(sp)}'>{html.escape(sp)}</option>")
-    html_parts.append("</select>")
-    html_parts.append("<button class='filter-btn' onclick='filterBySprint()'>Применить</button>")
-    html_parts.append("<button class='filter-clear' onclick='clearSprintFilter()'>Очистить</button>")
-    html_parts.append("<button class='filter-clear' onclick='clearAllFilters()'>Очистить все фильтры</button>")
-    html_parts.append("</div>")
+    write("<div class='filter-row'>")
+    write("<div class='filter-label'>Фильтр по спринту:</div>")
+    write("<select id='sprintFilter' class='filter-select'>")
+    write("<option value=''>Все спринты</option>")
+    for code, sp in enumerate(sorted_sprints):
+        # значение - код спринта: им помечены колонки таблиц (data-sprint)
+        write(f"<option value='{code}'>{html.escape(sprint_label(sp))}</option>")
+    write("</select>")
+    write("<button class='filter-btn' onclick='filterBySprint()'>Применить</button>")
+    write("<button class='filter-clear' onclick='clearSprintFilter()'>Очистить</button>")
+    write("<button class='filter-clear' onclick='clearAllFilters()'>Очистить все фильтры</button>")
+    write("</div>")
     
     # Секция информации об экспорте
-    html_parts.append("<div class='export-section'>")
-    html_parts.append("<strong>Доступен экспорт в Excel:</strong>")
-    html_parts.append("<div class='export-info'>")
-    html_parts.append(f"• Отчет содержит {len(categorized['match'])} совпадений, {len(categorized['diff_sprint'])} задач с разными спринтами<br>")
-    html_parts.append(f"• Только в ДИТ: {len(categorized['mos_only'])} задач<br>")
-    html_parts.append(f"• Только в Invaders: {len(categorized['inv_only'])} задач<br>")
-    html_parts.append(f"• Задачи: {total_regular}, Баги: {total_bugs}<br>")
-    html_parts.append("• Нажмите кнопку 'Скачать Excel отчет' для выгрузки полных данных")
-    html_parts.append("</div>")
-    html_parts.append("</div>")
-    
-    html_parts.append("<div class='legend'><b>Легенда:</b> <span style='background:#e6f6ea;padding:4px 8px;border-radius:4px;margin-left:8px'>совпадение (зелёный)</span> <span style='background:#fff8e0;padding:4px 8px;border-radius:4px;margin-left:8px'>разные спринты (жёлтый)</span> <span style='background:#ffe9e9;padding:4px 8px;border-radius:4px;margin-left:8px'>только ДИТ (красный)</span> <span style='background:#e8f1ff;padding:4px 8px;border-radius:4px;margin-left:8px'>только Invaders (синий)</span> <span class='bug-indicator'>Баг</span> <span class='status-ready' style='padding:2px 6px;border-radius:4px;margin-left:8px'>Готово</span> <span class='status-inprogress' style='padding:2px 6px;border-radius:4px;margin-left:8px'>В работе</span> <span class='status-open' style='padding:2px 6px;border-radius:4px;margin-left:8px'>Открыто</span></div>")
+    write("<div class='export-section'>")
+    write("<strong>Доступен экспорт в Excel:</strong>")
+    write("<div class='export-info'>")
+    write(f"• Отчет содержит {counts['match']} совпадений, {counts['diff_sprint']} задач с разными спринтами<br>")
+    write(f"• Только в ДИТ: {counts['mos_only']} задач<br>")
+    write(f"• Только в Invaders: {counts['inv_only']} задач<br>")
+    write(f"• Задачи: {total_regular}, Баги: {total_bugs}<br>")
+    write("• Нажмите кнопку 'Скачать Excel отчет' для выгрузки полных данных")
+    write("</div>")
+    write("</div>")
+    
+    write("<div class='legend'><b>Легенда:</b> <span style='background:#e6f6ea;padding:4px 8px;border-radius:4px;margin-left:8px'>совпадение (зелёный)</span> <span style='background:#fff8e0;padding:4px 8px;border-radius:4px;margin-left:8px'>разные спринты (жёлтый)</span> <span style='background:#ffe9e9;padding:4px 8px;border-radius:4px;margin-left:8px'>только ДИТ (красный)</span> <span style='background:#e8f1ff;padding:4px 8px;border-radius:4px;margin-left:8px'>только Invaders (синий)</span> <span class='bug-indicator'>Баг</span>")
+    for group, (label, _color) in status_groups_info.items():
+        write(f" <span class='status-{group}' style='padding:2px 6px;border-radius:4px;margin-left:8px'>{html.escape(label)}</span>")
+    write("</div>")
+
+    # Карточки раскладываются по корзинам (свимлайн, спринт, сторона, категория):
+    # позиции строк группируются один раз, а запись собирается только при выводе
+    # карточки, так что в памяти кроме таблицы результатов лишь позиции строк
+    side_categories = {'mos': ('match', 'diff_sprint', 'mos_only'),
+                       'inv': ('match', 'diff_sprint', 'inv_only')}
+    buckets = {}
+    columns = {}
+    if mode == 'cards':
+        categories = results['category'].to_numpy()
+        for category in CATEGORIES:
+            positions = np.flatnonzero(categories == category)
+            rows = results.iloc[positions]
+            for side in ('mos', 'inv'):
+                if category in side_categories[side]:
+                    groups = rows.groupby([rows['is_bug'], rows[f'{side}_sprint_no']], sort=False).indices
+                    for (bug, sp), group in groups.items():
+                        buckets[(bool(bug), int(sp), side, category)] = positions[group]
+        columns = {col: results[col].to_numpy(dtype=object) for col in RESULT_COLUMNS}
+        for side in ('mos', 'inv'):
+            columns[f'{side}_status_group'] = status_groups(results[f'{side}_status']).to_numpy(dtype=object)
+
+    def bucket_records(positions, category):
+        fields = category_fields(category)
+        fields += [f'{field}_group' for field in fields if field.endswith('_status')]
+        for pos in positions:
+            yield {field: columns[field][pos] for field in fields}
+
+    card_classes = {'match': 'match', 'diff_sprint': 'diff', 'mos_only': 'mos-only', 'inv_only': 'inv-only'}
+    side_names = {'mos': 'MOS', 'inv': 'INV'}
+
+    def render_card(it, side, category, bug):
+        other = 'inv' if side == 'mos' else 'mos'
+        status = it.get(f'{side}_status')
+        url = it.get(f'{side}_url')
+        task_id = it.get(f'{side}_id')
+        if category == 'diff_sprint':
+            task_id = task_id or it.get(f'{other}_id')
+        write(f"<div class='task {card_classes[category]}{' bug-task' if bug else ''}'>")
+        bug_badge = " <span class='bug-indicator'>БАГ</span>" if bug else ""
+        write(f"<div class='id'>{html.escape(str(task_id or ''))}{bug_badge}")
+        if status and status != UNKNOWN_STATUS:
+            write(f"<span class='status status-{it[f'{side}_status_group']}'>{html.escape(str(status))}</span>")
+        write("</div>")
+        if category == 'match':
+            title = it.get(f'{side}_title') or it.get(f'{other}_title') or ''
+            write(f"<div class='title'><a href='{it.get(f'{side}_url', '#')}' target='_blank'>{html.escape(str(title))}</a></div>")
+        elif category == 'diff_sprint':
+            own = html.escape(str(it.get(f'{side}_title') or ''))
+            theirs = html.escape(str(it.get(f'{other}_title') or ''))
+            if url != '#':
+                write(f"<div class='title'>{side_names[side]}: <a href='{url}' target='_blank'>{own}</a><br/>{side_names[other]}: <a href='{it.get(f'{other}_url')}' target='_blank'>{theirs}</a></div>")
+            else:
+                write(f"<div class='title'>{side_names[side]}: {own}<br/>{side_names[other]}: {theirs}</div>")
+        else:
+            title = html.escape(str(it.get(f'{side}_title') or ''))
+            if url != '#':
+                write(f"<div class='title'><a href='{url}' target='_blank'>{title}</a></div>")
+            else:
+                write(f"<div class='title'>{title}</div>")
+        write("</div>")
+
+    def render_swimlane_table(bug):
+        # заголовки и ячейки колонок спринта помечены кодом спринта для фильтра
+        write("<table><thead><tr>")
+        for code, sp in enumerate(sorted_sprints):
+            write(f"<th colspan='2' data-sprint='{code}'>{html.escape(sprint_label(sp))}</th>")
+        write("</tr><tr>")
+        for code, _ in enumerate(sorted_sprints):
+            write(f"<th class='col-head' data-sprint='{code}'>ДИТ</th><th class='col-head' data-sprint='{code}'>Invaders</th>")
+        write("</tr></thead><tbody><tr>")
+
+        # Body: для каждого спринта колонка ДИТ и колонка Invaders
+        for code, sp in enumerate(sorted_sprints):
+            for side in ('mos', 'inv'):
+                write(f"<td data-sprint='{code}'>")
+                for category in side_categories[side]:
+                    positions = buckets.get((bug, sp, side, category))
+                    if positions is None:
+                        continue
+                    for it in bucket_records(positions, category):
+                        render_card(it, side, category, bug)
+                write("</td>")
+        write("</tr></tbody></table>")
 
     # Свимлайн для обычных задач
-    html_parts.append(f"<div id='tasks-swinlane' class='swimlane'>")
-    html_parts.append(f"<div class='swimlane-header' onclick='toggleSwimlane(\"tasks-swinlane\")'>")
-    html_parts.append(f"<span class='swimlane-title'>Задачи ({total_regular})</span>")
-    html_parts.append(f"<span class='swimlane-count'>+</span>")
-    html_parts.append(f"</div>")
-    html_parts.append(f"<div class='swimlane-content'>")
+    write(f"<div id='tasks-swinlane' class='swimlane'>")
+    write(f"<div class='swimlane-header' onclick='toggleSwimlane(\"tasks-swinlane\")'>")
+    write(f"<span class='swimlane-title'>Задачи ({total_regular})</span>")
+    write(f"<span class='swimlane-count'>+</span>")
+    write(f"</div>")
+    write(f"<div class='swimlane-content'>")
     
     # Контейнер для таблицы с задачами
-    html_parts.append("<div class='table-container'>")
-    
-    # Создаем оригинальную таблицу для задач
-    html_parts.append("<table><thead><tr>")
-    for sp in sorted_sprints:
-        html_parts.append(f"<th colspan='2'>{html.escape(sp)}</th>")
-    html_parts.append("</tr><tr>")
-    for _ in sorted_sprints:
-        html_parts.append("<th class='col-head'>ДИТ</th><th class='col-head'>Invaders</th>")
-    html_parts.append("</tr></thead><tbody><tr>")
-
-    # Body: For each sprint, render DIT column and Invaders column для НЕ-багов
-    for sp in sorted_sprints:
-        # DIT column для задач (не багов)
-        html_parts.append("<td>")
-        # matches where both sprints equal this sp и НЕ баг
-        for it in categorized['match']:
-            if it.get('mos_sprint') == sp and it.get('inv_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task match'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or ''))}")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                html_parts.append(f"<div class='title'><a href='{it.get('mos_url', '#')}' target='_blank'>{html.escape(str(it.get('mos_title') or it.get('inv_title') or ''))}</a></div>")
-                html_parts.append("</div>")
-        # diff_sprint where mos_sprint == sp и НЕ баг
-        for it in categorized['diff_sprint']:
-            if it.get('mos_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task diff'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or it.get('inv_id') or ''))}")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('mos_url') != '#':
-                    html_parts.append(f"<div class='title'>MOS: <a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a><br/>INV: <a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>MOS: {html.escape(str(it.get('mos_title') or ''))}<br/>INV: {html.escape(str(it.get('inv_title') or ''))}</div>")
-                html_parts.append("</div>")
-        # mos_only и НЕ баг
-        for it in categorized['mos_only']:
-            if it.get('mos_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task mos-only'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or ''))}")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('mos_url') != '#':
-                    html_parts.append(f"<div class='title'><a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>{html.escape(str(it.get('mos_title') or ''))}</div>")
-                html_parts.append("</div>")
-        html_parts.append("</td>")
-
-        # Invaders column для задач (не багов)
-        html_parts.append("<td>")
-        for it in categorized['match']:
-            if it.get('inv_sprint') == sp and it.get('mos_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task match'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or ''))}")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                html_parts.append(f"<div class='title'><a href='{it.get('inv_url', '#')}' target='_blank'>{html.escape(str(it.get('inv_title') or it.get('mos_title') or ''))}</a></div>")
-                html_parts.append("</div>")
-        for it in categorized['diff_sprint']:
-            if it.get('inv_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task diff'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or it.get('mos_id') or ''))}")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('inv_url') != '#':
-                    html_parts.append(f"<div class='title'>INV: <a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a><br/>MOS: <a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>INV: {html.escape(str(it.get('inv_title') or ''))}<br/>MOS: {html.escape(str(it.get('mos_title') or ''))}</div>")
-                html_parts.append("</div>")
-        for it in categorized['inv_only']:
-            if it.get('inv_sprint') == sp and not it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task inv-only'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or ''))}")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('inv_url') != '#':
-                    html_parts.append(f"<div class='title'><a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>{html.escape(str(it.get('inv_title') or ''))}</div>")
-                html_parts.append("</div>")
-        html_parts.append("</td>")
-
-    html_parts.append("</tr></tbody></table>")
-    html_parts.append("</div>")  # Закрываем table-container
-    html_parts.append("</div>")  # Закрываем swimlane-content
-    html_parts.append("</div>")  # Закрываем swimlane
+    write("<div class='table-container'>")
+    
+    # Создаем оригинальную таблицу для задач (в режиме 'data' её строит скрипт)
+    if mode == 'cards':
+        render_swimlane_table(False)
+    write("</div>")  # Закрываем table-container
+    write("</div>")  # Закрываем swimlane-content
+    write("</div>")  # Закрываем swimlane
 
     # Свимлайн для багов
-    html_parts.append(f"<div id='bugs-swinlane' class='swimlane'>")
-    html_parts.append(f"<div class='swimlane-header' onclick='toggleSwimlane(\"bugs-swinlane\")'>")
-    html_parts.append(f"<span class='swimlane-title'>Баги ({total_bugs}) <span class='bug-indicator'>БАГ</span></span>")
-    html_parts.append(f"<span class='swimlane-count'>+</span>")
-    html_parts.append(f"</div>")
-    html_parts.append(f"<div class='swimlane-content'>")
+    write(f"<div id='bugs-swinlane' class='swimlane'>")
+    write(f"<div class='swimlane-header' onclick='toggleSwimlane(\"bugs-swinlane\")'>")
+    write(f"<span class='swimlane-title'>Баги ({total_bugs}) <span class='bug-indicator'>БАГ</span></span>")
+    write(f"<span class='swimlane-count'>+</span>")
+    write(f"</div>")
+    write(f"<div class='swimlane-content'>")
     
     # Контейнер для таблицы с багами
-    html_parts.append("<div class='table-container'>")
+    write("<div class='table-container'>")
     
     # Создаем оригинальную таблицу для багов
-    html_parts.append("<table><thead><tr>")
-    for sp in sorted_sprints:
-        html_parts.append(f"<th colspan='2'>{html.escape(sp)}</th>")
-    html_parts.append("</tr><tr>")
-    for _ in sorted_sprints:
-        html_parts.append("<th class='col-head'>ДИТ</th><th class='col-head'>Invaders</th>")
-    html_parts.append("</tr></thead><tbody><tr>")
-
-    # Body: For each sprint, render DIT column and Invaders column для багов
-    for sp in sorted_sprints:
-        # DIT column для багов
-        html_parts.append("<td>")
-        # matches where both sprints equal this sp и баг
-        for it in categorized['match']:
-            if it.get('mos_sprint') == sp and it.get('inv_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task match bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                html_parts.append(f"<div class='title'><a href='{it.get('mos_url', '#')}' target='_blank'>{html.escape(str(it.get('mos_title') or it.get('inv_title') or ''))}</a></div>")
-                html_parts.append("</div>")
-        # diff_sprint where mos_sprint == sp и баг
-        for it in categorized['diff_sprint']:
-            if it.get('mos_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task diff bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or it.get('inv_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('mos_url') != '#':
-                    html_parts.append(f"<div class='title'>MOS: <a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a><br/>INV: <a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>MOS: {html.escape(str(it.get('mos_title') or ''))}<br/>INV: {html.escape(str(it.get('inv_title') or ''))}</div>")
-                html_parts.append("</div>")
-        # mos_only и баг
-        for it in categorized['mos_only']:
-            if it.get('mos_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('mos_status'))
-                html_parts.append("<div class='task mos-only bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('mos_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('mos_status') and it.get('mos_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('mos_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('mos_url') != '#':
-                    html_parts.append(f"<div class='title'><a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>{html.escape(str(it.get('mos_title') or ''))}</div>")
-                html_parts.append("</div>")
-        html_parts.append("</td>")
-
-        # Invaders column для багов
-        html_parts.append("<td>")
-        for it in categorized['match']:
-            if it.get('inv_sprint') == sp and it.get('mos_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task match bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                html_parts.append(f"<div class='title'><a href='{it.get('inv_url', '#')}' target='_blank'>{html.escape(str(it.get('inv_title') or it.get('mos_title') or ''))}</a></div>")
-                html_parts.append("</div>")
-        for it in categorized['diff_sprint']:
-            if it.get('inv_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task diff bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or it.get('mos_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('inv_url') != '#':
-                    html_parts.append(f"<div class='title'>INV: <a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a><br/>MOS: <a href='{it.get('mos_url')}' target='_blank'>{html.escape(str(it.get('mos_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>INV: {html.escape(str(it.get('inv_title') or ''))}<br/>MOS: {html.escape(str(it.get('mos_title') or ''))}</div>")
-                html_parts.append("</div>")
-        for it in categorized['inv_only']:
-            if it.get('inv_sprint') == sp and it.get('is_bug', False):
-                status_class = get_status_class(it.get('inv_status'))
-                html_parts.append("<div class='task inv-only bug-task'>")
-                html_parts.append(f"<div class='id'>{html.escape(str(it.get('inv_id') or ''))} <span class='bug-indicator'>БАГ</span>")
-                if it.get('inv_status') and it.get('inv_status') != 'Неизвестно':
-                    html_parts.append(f"<span class='status {status_class}'>{html.escape(str(it.get('inv_status')))}</span>")
-                html_parts.append("</div>")
-                if it.get('inv_url') != '#':
-                    html_parts.append(f"<div class='title'><a href='{it.get('inv_url')}' target='_blank'>{html.escape(str(it.get('inv_title') or ''))}</a></div>")
-                else:
-                    html_parts.append(f"<div class='title'>{html.escape(str(it.get('inv_title') or ''))}</div>")
-                html_parts.append("</div>")
-        html_parts.append("</td>")
-
-    html_parts.append("</tr></tbody></table>")
-    html_parts.append("</div>")  # Закрываем table-container
-    html_parts.append("</div>")  # Закрываем swimlane-content
-    html_parts.append("</div>")  # Закрываем swimlane
-    
-    html_parts.append(js)
-    html_parts.append("</div></body></html>")
-
-    out_html = "".join(html_parts)
-    out_file.write_text(out_html, encoding="utf-8")
-    print("Saved HTML:", str(out_file))
+    if mode == 'cards':
+        render_swimlane_table(True)
+    write("</div>")  # Закрываем table-container
+    write("</div>")  # Закрываем swimlane-content
+    write("</div>")  # Закрываем swimlane
+    
+    if mode != 'cards':
+        payload = html_payload(results, sorted_sprints)
+        if mode == 'compact':
+            write("<script type='application/octet-stream' id='report-data' data-encoding='gzip'>")
+            write(compress_payload(payload))
+        else:
+            write("<script type='application/json' id='report-data'>")
+            for part in payload_json(payload):
+                write(part)
+        write("</script>")
+        write(js_data)
+    else:
+        write(js)
+    write("</div></body></html>")
 
 # -------------------------
-# Main - с улучшенным поиском спринтов
+# Подготовка данных и кэш
 # -------------------------
-def main():
-    base = Path(__file__).parent
-    mos_path = base / MOS_NAME
-    inv_path = base / INV_NAME
-    out_path = base / OUT_NAME
-    excel_path = base / EXCEL_NAME
+# Служебные колонки, которые нормализация добавляет к выгрузкам
+NORMALIZED_COLUMNS = ['maybe_key', 'sprint_no', 'sprint']
 
-    if not mos_path.exists():
-        print("Файл Mos.csv не найден в папке со скриптом:", mos_path)
-        return
-    if not inv_path.exists():
-        print("Файл Invaders.csv не найден в папке со скриптом:", inv_path)
-        return
+def normalize_mos_rows(mos_df):
+    """Построчная нормализация ДИТ: номер спринта и canonical sprint"""
+    mos_df = mos_df.copy()
+    mos_df['sprint_no'] = sprint_numbers(mos_df['Компоненты'])
+    mos_df['sprint'] = sprint_labels(mos_df['sprint_no'])
+    return mos_df
+
+def normalize_inv_rows(inv_df):
+    """Построчная нормализация Invaders: ключ из темы (если ключа нет), номер спринта и canonical sprint"""
+    inv_df = inv_df.copy()
+    inv_df['maybe_key'] = extract_inv_keys(inv_df['Тема'])
+    inv_keys = inv_df['Ключ проблемы']
+    inv_df['Ключ проблемы'] = inv_keys.where(inv_keys.notna() & (inv_keys != ""), inv_df['maybe_key'])
+    inv_df['sprint_no'] = sprint_numbers(inv_df['Пользовательское поле (Релизный спринт)'])
+    inv_df['sprint'] = sprint_labels(inv_df['sprint_no'])
+    return inv_df
+
+def sniff_encodings(mos_path: Path, inv_path: Path):
+    """Кодировки обеих выгрузок (sniff_encoding): (mos_encoding, inv_encoding)"""
+    return sniff_encoding(mos_path), sniff_encoding(inv_path)
+
+def resolve_profiles(mos_path: Path, inv_path: Path, profiles_path: Path = None, encodings=None):
+    """Профили обеих выгрузок: (mos_profile, inv_profile).
+    encodings - (mos_encoding, inv_encoding), по умолчанию sniff_encodings"""
+    print("Профили выгрузок...")
+    mos_encoding, inv_encoding = encodings or sniff_encodings(mos_path, inv_path)
+    return (resolve_profile(mos_path, MOS_PROFILE, 'mos', "ДИТ", profiles_path, mos_encoding),
+            resolve_profile(inv_path, INV_PROFILE, 'inv', "Invaders", profiles_path, inv_encoding))
 
-    mos_df = read_csv_guess(mos_path)
-    inv_df = read_csv_guess(inv_path)
+def prepare_sources(mos_path: Path, inv_path: Path, workers: int = 0, profiles=None, encodings=None):
+    """Прочитать обе выгрузки и нормализовать их: колонки, ключи, спринты.
+    profiles - (mos_profile, inv_profile), по умолчанию определяются по файлам;
+    encodings - (mos_encoding, inv_encoding), по умолчанию sniff_encodings;
+    workers > 1 - построчная нормализация частями в пуле процессов"""
+    encodings = encodings or sniff_encodings(mos_path, inv_path)
+    mos_profile, inv_profile = profiles if profiles is not None else resolve_profiles(mos_path, inv_path,
+                                                                                     encodings=encodings)
+    mos_df = load_source(mos_path, mos_profile, 'mos', encoding=encodings[0])
+    inv_df = load_source(inv_path, inv_profile, 'inv', encoding=encodings[1])
     
     print("=" * 80)
     print("Анализ файлов...")
@@ -1467,148 +2739,250 @@ def main():
     print(f"Колонки Invaders.csv: {list(inv_df.columns)}")
     print("=" * 80)
 
+    return normalize_sources(mos_df, inv_df, workers)
+
+def normalize_sources(mos_df, inv_df, workers: int = 0):
+    """Нормализовать прочитанные выгрузки (load_source): необходимые колонки,
+    ключи Invaders из темы, номера спринтов"""
     # гарантируем необходимые колонки
     if 'Тема' not in mos_df.columns:
-        mos_df['Тема'] = mos_df.iloc[:, 0].astype(str)
+        mos_df['Тема'] = None
     if 'Ключ проблемы' not in mos_df.columns:
-        mos_df['Ключ проблемы'] = mos_df['Тема'].apply(lambda x: extract_meta_key_from_text(x) or "")
-
-    # Invaders: стандартизируем
+        mos_df['Ключ проблемы'] = extract_meta_keys(mos_df['Тема']).fillna("")
     if 'Тема' not in inv_df.columns:
-        # если нет такой колонки, попробуем первые колонки
-        inv_df['Тема'] = inv_df.iloc[:, 0].astype(str)
-    
-    # Поиск колонки со спринтом в Invaders
-    print("\nПоиск колонки со спринтом в Invaders...")
-    sprint_col = None
-    
-    # Возможные названия колонки со спринтом
-    possible_names = [
-        'Релизный спринт', 'Release Sprint', 'Sprint', 'Спринт',
-        'Пользовательское поле (Релизный спринт)',
-        'Custom field (Release Sprint)'
-    ]
-    
-    # Ищем точное совпадение
-    for col in inv_df.columns:
-        col_str = str(col).strip()
-        if col_str in possible_names:
-            sprint_col = col
-            print(f"  ✓ Найдена колонка спринта: '{sprint_col}'")
-            break
-    
-    # Если не нашли точное совпадение, ищем частичное
-    if not sprint_col:
-        for col in inv_df.columns:
-            col_lower = str(col).lower()
-            if any(name.lower() in col_lower for name in ['спринт', 'sprint', 'релиз']):
-                sprint_col = col
-                print(f"  ⚠️ Найдена похожая колонка: '{col}'")
-                break
-    
-    # Если все еще не нашли, показываем первые значения из каждой колонки
-    if not sprint_col:
-        print("  ❗ Не найдена колонка со спринтом. Проверяем содержимое колонок...")
-        for col in inv_df.columns[:5]:  # Проверяем первые 5 колонок
-            sample_values = inv_df[col].dropna().head(3)
-            if not sample_values.empty:
-                print(f"    Колонка '{col}': {list(sample_values.values)}")
-                # Проверяем, содержат ли значения слово "спринт"
-                for val in sample_values:
-                    if isinstance(val, str) and ('спринт' in val.lower() or 'sprint' in val.lower()):
-                        sprint_col = col
-                        print(f"  ✓ Возможно это колонка спринта: '{col}'")
-                        break
-            if sprint_col:
-                break
-    
-    if sprint_col:
-        inv_df['Пользовательское поле (Релизный спринт)'] = inv_df[sprint_col]
-    else:
+        inv_df['Тема'] = None
+
+    sprint_col = CANONICAL_COLUMNS['inv']['sprint']
+    if sprint_col not in inv_df.columns:
         print("  ❗ Не удалось найти колонку со спринтом. Используем 'Нет спринта'")
-        inv_df['Пользовательское поле (Релизный спринт)'] = None
+        inv_df[sprint_col] = None
 
     # нормализация: canonical sprint и извлечение ключа из темы Invaders
     mos_df['Компоненты'] = mos_df.get('Компоненты', None)
-    mos_df['sprint'] = mos_df['Компоненты'].apply(canonical_sprint)
-    
     inv_df['Ключ проблемы'] = inv_df.get('Ключ проблемы')  # если уже есть, оставим
-    # если ключа нет, попытаемся извлечь из Тема
-    inv_df['maybe_key'] = inv_df['Тема'].apply(extract_inv_key_from_text)
-    inv_df['Ключ проблемы'] = inv_df.apply(lambda r: (
-        r['Ключ проблемы'] if r['Ключ проблемы'] and not (isinstance(r['Ключ проблемы'], float) and pd.isna(r['Ключ проблемы'])) 
-        else r['maybe_key']
-    ), axis=1)
-    inv_df['sprint'] = inv_df['Пользовательское поле (Релизный спринт)'].apply(canonical_sprint)
+    mos_df = normalize_in_parallel("Нормализация ДИТ", normalize_mos_rows, mos_df, workers)
+    inv_df = normalize_in_parallel("Нормализация Invaders", normalize_inv_rows, inv_df, workers)
+
+    return mos_df, inv_df
+
+def source_cache_key(mos_path: Path, inv_path: Path, profiles=None) -> str:
+    """Ключ кэша: хэш содержимого обоих файлов, профилей выгрузок и версия нормализации"""
+    h = hashlib.sha256()
+    h.update(f"v{NORMALIZATION_VERSION}|{','.join(INV_PREFIXES)}".encode("utf-8"))
+    h.update(json.dumps(profiles, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    for path in (mos_path, inv_path):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _cache_format():
+    """Parquet, если установлен pyarrow, иначе pickle"""
+    try:
+        import pyarrow  # noqa: F401
+        return "parquet"
+    except ImportError:
+        return "pickle"
+
+def read_source_cache(cache_dir: Path, key: str):
+    """Нормализованные (mos_df, inv_df) из кэша или None"""
+    fmt = _cache_format()
+    entry = cache_dir / key
+    paths = [entry / f"mos.{fmt}", entry / f"inv.{fmt}"]
+    if not all(path.exists() for path in paths):
+        return None
+    try:
+        if fmt == "parquet":
+            return tuple(pd.read_parquet(path) for path in paths)
+        return tuple(pd.read_pickle(path) for path in paths)
+    except Exception as e:
+        print(f"  ⚠️ Не удалось прочитать кэш ({e}), читаем CSV заново")
+        return None
+
+def write_source_cache(cache_dir: Path, key: str, mos_df, inv_df):
+    """Сохранить нормализованные таблицы в кэш (атомарно, через временный каталог)"""
+    fmt = _cache_format()
+    entry = cache_dir / key
+    tmp = cache_dir / f".{key}.tmp"
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name, df in (("mos", mos_df), ("inv", inv_df)):
+            if fmt == "parquet":
+                df.to_parquet(tmp / f"{name}.{fmt}")
+            else:
+                df.to_pickle(tmp / f"{name}.{fmt}")
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp.rename(entry)
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        print(f"  ⚠️ Не удалось сохранить кэш: {e}")
+        return
+
+    # Храним только последние CACHE_MAX_ENTRIES наборов
+    entries = sorted((p for p in cache_dir.iterdir()
+                      if p.is_dir() and not p.name.startswith('.') and p.name != MATCH_STATE_NAME),
+                     key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in entries[CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+def load_prepared_sources(mos_path: Path, inv_path: Path, cache_dir: Path = None, workers: int = 0,
+                          profiles_path: Path = None):
+    """prepare_sources с кэшем: при тех же файлах и профилях чтение и нормализация пропускаются.
+    profiles_path - файл с сохранёнными профилями выгрузок"""
+    encodings = sniff_encodings(mos_path, inv_path)
+    profiles = resolve_profiles(mos_path, inv_path, profiles_path, encodings)
+    if cache_dir is None:
+        return prepare_sources(mos_path, inv_path, workers, profiles, encodings)
+
+    key = source_cache_key(mos_path, inv_path, profiles)
+    cached = read_source_cache(cache_dir, key)
+    if cached is not None:
+        print(f"✓ Файлы не изменились, нормализованные данные взяты из кэша: {cache_dir / key}")
+        return cached
+
+    mos_df, inv_df = prepare_sources(mos_path, inv_path, workers, profiles, encodings)
+    write_source_cache(cache_dir, key, mos_df, inv_df)
+    return mos_df, inv_df
+
+# -------------------------
+# Main - с улучшенным поиском спринтов
+# -------------------------
+def parse_args(argv=None):
+    """Аргументы командной строки; без аргументов - выгрузки MOS_NAME и INV_NAME рядом
+    со скриптом, все этапы и все выходные файлы"""
+    base = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Сопоставление задач ДИТ и Invaders")
+    parser.add_argument('--mos', type=Path, default=base / MOS_NAME,
+                        help=f"выгрузка ДИТ (по умолчанию {MOS_NAME} рядом со скриптом)")
+    parser.add_argument('--inv', type=Path, default=base / INV_NAME,
+                        help=f"выгрузка Invaders (по умолчанию {INV_NAME} рядом со скриптом)")
+    parser.add_argument('--out-dir', type=Path, default=base,
+                        help="папка для отчетов и выгрузок (по умолчанию - папка скрипта)")
+    parser.add_argument('--stage', choices=RUN_STAGES, default=RUN_STAGES[-1],
+                        help="последний выполняемый этап: load - чтение и нормализация, "
+                             "match - сопоставление и счетчики, report - выходные файлы")
+    parser.add_argument('--outputs', nargs='+', choices=OUTPUTS, default=list(OUTPUTS),
+                        help="выходные файлы этапа report")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    base = Path(__file__).parent
+    mos_path = args.mos
+    inv_path = args.inv
+    out_path = args.out_dir / OUT_NAME
+    excel_path = args.out_dir / EXCEL_NAME
+    data_path = args.out_dir / RESULTS_DIR_NAME
+    outputs = [output for output in OUTPUTS if output in args.outputs]
+
+    if not mos_path.exists():
+        print("Файл выгрузки ДИТ не найден:", mos_path)
+        return 1
+    if not inv_path.exists():
+        print("Файл выгрузки Invaders не найден:", inv_path)
+        return 1
+
+    started = time.perf_counter()
+    mos_df, inv_df = load_prepared_sources(mos_path, inv_path, base / CACHE_DIR_NAME, PARALLEL_WORKERS,
+                                           base / PROFILES_NAME)
+    print(f"  ⏱ загрузка: {time.perf_counter() - started:.2f} с")
     
     # Статистика
     print(f"\nСтатистика по спринтам:")
-    print(f"  ДИТ: {mos_df['sprint'].nunique()} уникальных спринтов")
-    print(f"  Invaders: {inv_df['sprint'].nunique()} уникальных спринтов")
+    print(f"  ДИТ: {mos_df['sprint_no'].nunique()} уникальных спринтов")
+    print(f"  Invaders: {inv_df['sprint_no'].nunique()} уникальных спринтов")
     
-    if inv_df['sprint'].nunique() == 1 and inv_df['sprint'].iloc[0] == "Нет спринта":
+    if inv_df['sprint_no'].nunique() == 1 and inv_df['sprint_no'].iloc[0] == NO_SPRINT_NUMBER:
         print("\n⚠️ ВНИМАНИЕ: В файле Invaders не найдены спринты!")
         print("Возможные причины:")
         print("  1. Колонка со спринтом называется по-другому")
         print("  2. В данных нет информации о спринтах")
         print("  3. Формат данных отличается от ожидаемого")
         print("\nПроверьте CSV файл и убедитесь, что есть колонка с названием спринтов.")
+    if args.stage == 'load':
+        return 0
 
     # Выполняем матчи
     print("\nВыполняем сопоставление задач...")
-    matches, mos_used, inv_used = match_two_way(mos_df, inv_df)
+    started = time.perf_counter()
+    matches, mos_used, inv_used, results = reconcile(
+        mos_df, inv_df, base / CACHE_DIR_NAME / MATCH_STATE_NAME, PARALLEL_WORKERS)
+    print(f"  ⏱ сопоставление: {time.perf_counter() - started:.2f} с")
     
     print(f"\nРезультаты сопоставления:")
     print(f"  Найдено совпадений: {len(matches)}")
     print(f"  Задействовано задач из ДИТ: {len(mos_used)}")
     print(f"  Задействовано задач из Invaders: {len(inv_used)}")
     
-    categorized = categorize_and_prepare(mos_df, inv_df, matches, mos_used, inv_used)
-    
     print(f"\nКатегоризация:")
-    print(f"  Совпадения (один спринт): {len(categorized['match'])}")
-    print(f"  Совпадения (разные спринты): {len(categorized['diff_sprint'])}")
-    print(f"  Только в ДИТ: {len(categorized['mos_only'])}")
-    print(f"  Только в Invaders: {len(categorized['inv_only'])}")
+    counts = category_counts(results)
+    print(f"  Совпадения (один спринт): {counts['match']}")
+    print(f"  Совпадения (разные спринты): {counts['diff_sprint']}")
+    print(f"  Только в ДИТ: {counts['mos_only']}")
+    print(f"  Только в Invaders: {counts['inv_only']}")
     
     # Статистика по статусам
     print(f"\nСтатистика по статусам:")
-    status_stats = {}
-    for cat_name, cat_list in categorized.items():
-        for item in cat_list:
-            for sys in ['mos', 'inv']:
-                status_key = f'{sys}_status'
-                if status_key in item:
-                    status = item[status_key]
-                    if status not in status_stats:
-                        status_stats[status] = 0
-                    status_stats[status] += 1
-    
-    for status, count in sorted(status_stats.items()):
-        print(f"  {status}: {count}")
+    groups = status_group_info()
+    for group, count in status_group_counts(results).items():
+        print(f"  {groups[group][0]}: {count}")
+    print("  По значениям:")
+    for status, count in status_counts(results).items():
+        print(f"    {status} [{groups[status_group(status)][0]}]: {count}")
 
-    # генерируем HTML
-    print(f"\nГенерация HTML отчета...")
-    generate_html(categorized, out_path, mos_df, inv_df)
-    
-    # экспортируем в Excel
-    try:
-        print(f"\nЭкспорт в Excel...")
-        export_to_excel(categorized, excel_path, mos_df, inv_df)
-        print(f"✓ Excel отчет создан: {excel_path}")
-    except ImportError:
-        print("\n❌ Для экспорта в Excel требуется библиотека openpyxl.")
-        print("Установите её командой: pip install openpyxl")
-    except Exception as e:
-        print(f"\n❌ Ошибка при создании Excel файла: {e}")
-        import traceback
-        traceback.print_exc()
+    if args.stage == 'match':
+        return 0
+
+    # генерируем выбранные выходные файлы (одновременно)
+    jobs = {
+        'html': ('HTML', generate_html, (results, out_path, mos_df, inv_df)),
+        'excel': ('Excel', export_to_excel, (results, excel_path, mos_df, inv_df)),
+        'data': ('Данные', export_results, (results, data_path)),
+    }
+    print(f"\nСоздание выходных файлов: {', '.join(jobs[output][0] for output in outputs)}...")
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    done = render_outputs({jobs[output][0]: jobs[output][1:] for output in outputs}, OUTPUT_WORKERS)
+    failed = False
+
+    if 'HTML' in done:
+        html_error, html_trace = done['HTML']
+        if html_error is not None:
+            print(html_trace, end="")
+            raise html_error
+
+    if 'Excel' in done:
+        excel_error, excel_trace = done['Excel']
+        failed |= excel_error is not None
+        if excel_error is None:
+            print(f"✓ Excel отчет создан: {excel_path}")
+        elif isinstance(excel_error, ImportError):
+            print("\n❌ Для экспорта в Excel требуется библиотека openpyxl.")
+            print("Установите её командой: pip install openpyxl")
+        else:
+            print(f"\n❌ Ошибка при создании Excel файла: {excel_error}")
+            print(excel_trace, end="")
+
+    if 'Данные' in done:
+        data_error, data_trace = done['Данные']
+        failed |= data_error is not None
+        if data_error is None:
+            print(f"✓ Данные выгружены: {data_path}")
+        else:
+            print(f"\n❌ Ошибка при выгрузке данных: {data_error}")
+            print(data_trace, end="")
     
     print("\n" + "=" * 80)
     print("Обработка завершена!")
-    print(f"HTML отчет: {out_path}")
-    print(f"Excel отчет: {excel_path}")
+    if 'html' in outputs:
+        print(f"HTML отчет: {out_path}")
+    if 'excel' in outputs:
+        print(f"Excel отчет: {excel_path}")
+    if 'data' in outputs:
+        print(f"Данные (parquet/csv/jsonl): {data_path}")
     print("=" * 80)
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
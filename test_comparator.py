@@ -0,0 +1,153 @@
+# coding: utf-8
+"""
+Регрессионные тесты comparator.py
+Запуск: python -m pytest -q
+"""
+
+import io
+import re
+import json
+import contextlib
+
+import pandas as pd
+
+import comparator
+
+MOS_HEADER = "Ключ проблемы,Тема,Компоненты,Статус\n"
+INV_HEADER = "Ключ проблемы,Тема,Пользовательское поле (Релизный спринт),Статус\n"
+
+
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _logged(func, *args, **kwargs):
+    """(результат, напечатанное)"""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = func(*args, **kwargs)
+    return result, log.getvalue()
+
+
+def _sample_sources(tmp_path, rows=60, workers=0):
+    """Нормализованные выгрузки со всеми видами связей: общий ключ, ключ ДИТ в теме Invaders,
+    ключ Invaders в теме ДИТ, тема ДИТ с двумя ключами Invaders и повторяющиеся ключи"""
+    mos, inv = [MOS_HEADER], [INV_HEADER]
+    for i in range(1, rows + 1):
+        mos_title = f"Задача {i}"
+        if i % 5 == 0:
+            mos_title += f" (MT-{i})"
+        if i % 11 == 0:
+            mos_title += f" MT-{i + 1} MT-{i + 2}"
+        mos.append(f"META-{i},{mos_title},Спринт {i % 4},Открыт\n")
+        inv_key = f"META-{i}" if i % 7 == 0 else f"MT-{i}"
+        inv_title = f"[META-{i}] Тема {i}" if i % 3 == 0 else f"Тема {i}"
+        inv.append(f"{inv_key},{inv_title},Спринт {(i + i % 2) % 4},В работе\n")
+    mos.append("META-5,Повтор ключа,Спринт 1,Готово\n")
+    inv.append("MT-10,[META-10] Повтор,Спринт 2,Готово\n")
+
+    mos_path = tmp_path / comparator.MOS_NAME
+    inv_path = tmp_path / comparator.INV_NAME
+    mos_path.write_text("".join(mos), encoding="utf-8")
+    inv_path.write_text("".join(inv), encoding="utf-8")
+    return _quiet(comparator.prepare_sources, mos_path, inv_path, workers)
+
+
+def test_empty_exports(tmp_path):
+    """Выгрузки только с заголовком: пустой результат и отчеты без ошибок (с состоянием и без)"""
+    mos_path = tmp_path / comparator.MOS_NAME
+    inv_path = tmp_path / comparator.INV_NAME
+    mos_path.write_text(MOS_HEADER, encoding="utf-8")
+    inv_path.write_text(INV_HEADER, encoding="utf-8")
+
+    mos_df, inv_df = _quiet(comparator.prepare_sources, mos_path, inv_path)
+    state_path = tmp_path / comparator.MATCH_STATE_NAME
+    for _run in ("без состояния", "с состоянием"):
+        matches, mos_used, inv_used, results = _quiet(comparator.reconcile, mos_df, inv_df, state_path)
+        assert matches == [] and mos_used == set() and inv_used == set()
+        assert list(results.columns) == comparator.RESULT_COLUMNS
+        assert results.empty
+
+    _quiet(comparator.generate_html, results, tmp_path / comparator.OUT_NAME, mos_df, inv_df)
+    _quiet(comparator.export_results, results, tmp_path / comparator.RESULTS_DIR_NAME)
+    assert (tmp_path / comparator.OUT_NAME).exists()
+
+
+def test_data_report_ids_are_text(tmp_path):
+    """Числовые ключи выгрузки попадают в данные отчета 'data' строками (фильтр по задаче
+    вызывает у них toUpperCase)"""
+    mos_path = tmp_path / comparator.MOS_NAME
+    inv_path = tmp_path / comparator.INV_NAME
+    mos_path.write_text(MOS_HEADER + "102,Задача,Спринт 1,Открыт\n101,Другая,Спринт 2,Открыт\n,Без ключа,,\n",
+                        encoding="utf-8")
+    inv_path.write_text(INV_HEADER + "MT-7,Тема 102,Спринт 1,В работе\n", encoding="utf-8")
+    mos_df, inv_df = _quiet(comparator.prepare_sources, mos_path, inv_path)
+    results = _quiet(comparator.reconcile, mos_df, inv_df)[3]
+
+    out_file = tmp_path / comparator.OUT_NAME
+    _quiet(comparator.generate_html, results, out_file, mos_df, inv_df, mode="data", layout="single")
+    data = re.search(r"id='report-data'>(.*?)</script>", out_file.read_text(encoding="utf-8"), re.S).group(1)
+    payload = json.loads(data)
+    for field in ("mos_id", "inv_id", "mos_title", "inv_title"):
+        assert all(value is None or isinstance(value, str) for value in payload[field])
+    assert sum(value is not None for value in payload["mos_id"]) == 2
+
+
+def test_incremental_reconcile_equals_full(tmp_path):
+    """Пересчёт от состояния прошлого запуска совпадает с полным пересчётом, включая типы колонок"""
+    mos_df, inv_df = _sample_sources(tmp_path)
+    state_path = tmp_path / comparator.MATCH_STATE_NAME
+    _quiet(comparator.reconcile, mos_df, inv_df, state_path)
+
+    edited = inv_df.copy()
+    titles = edited.columns.get_loc("Тема")
+    edited.iloc[[2, 20], titles] = ["Тема без ключа", "[META-1] Новая связь"]
+    edited = pd.concat([edited.drop(edited.index[5]), edited.iloc[[0]]]).reset_index(drop=True)
+
+    for expected_log in ("Изменения с прошлого запуска", "Выгрузки не изменились"):
+        incremental, log = _logged(comparator.reconcile, mos_df, edited, state_path)
+        assert expected_log in log
+        full = _quiet(comparator.reconcile, mos_df, edited, None)
+        assert incremental[:3] == full[:3]
+        pd.testing.assert_frame_equal(incremental[3], full[3])
+
+
+def test_parallel_reconcile_equals_serial(tmp_path, monkeypatch):
+    """Нормализация и сопоставление частями в пуле процессов дают тот же результат, что и подряд:
+    строки с общим токеном (в том числе повторяющиеся ключи) попадают в одну часть"""
+    mos_df, inv_df = _sample_sources(tmp_path)
+    serial = _quiet(comparator.reconcile, mos_df, inv_df)
+
+    monkeypatch.setattr(comparator, "PARALLEL_MIN_ROWS", 1)
+    parallel_sources = _sample_sources(tmp_path, workers=2)
+    for serial_df, parallel_df in zip((mos_df, inv_df), parallel_sources):
+        pd.testing.assert_frame_equal(parallel_df, serial_df)
+
+    parallel, log = _logged(comparator.reconcile, mos_df, inv_df, None, 2)
+    assert "частей 8" in log
+    assert parallel[:3] == serial[:3]
+    pd.testing.assert_frame_equal(parallel[3], serial[3])
+
+
+def test_status_column_by_whole_values():
+    """По содержимому статусом считается колонка, значения которой - статусы целиком,
+    а не свободный текст со словами статусов"""
+    sample = pd.DataFrame({
+        "Описание": ["New report in progress", "Open question: done?", None],
+        "Поле 1": ["Открыт", " In  Progress ", "Готово"],
+    })
+    assert comparator.find_status_column(sample, "тест", verbose=False) == "Поле 1"
+    assert comparator.find_status_column(sample[["Описание"]], "тест", verbose=False) is None
+
+
+def test_cp1251_after_sniffed_head(tmp_path):
+    """Кириллица cp1251 дальше проверенного начала файла читается как cp1251, а не заменяется"""
+    path = tmp_path / "late.csv"
+    lines = ["key,title"] + [f"K-{i},title {i}" for i in range(comparator.CSV_SNIFF_BYTES // 10)]
+    path.write_bytes(("\n".join(lines + ["K-x,Тема"]) + "\n").encode("cp1251"))
+    assert comparator.sniff_encoding(path) == "utf-8-sig"
+
+    df = _quiet(comparator.read_csv_guess, path, chunksize=1000)
+    assert len(df) == len(lines)
+    assert df["title"].iloc[-1] == "Тема"